@@ -1,23 +1,25 @@
 import streamlit as st
 import pandas as pd
-import json
-import altair as alt
 import hmac
 import jwt
+import os
+import tempfile
+
+from dashboard import explorer, fact_table, pipeline, streaming, timing
+from dashboard.aggregate import fill_periods, shares
+from dashboard.cache import DataCache
+from dashboard.charts import ChartCache
+from dashboard.refresh import Refresher
+from dashboard.server import DataClient
+from dashboard.sketch import METRICS
+from dashboard.query import TYPE_IDS, ConsumptionQuery
+from dashboard.timing import stage
+
+# Les DataFrames partagés entre sessions ne sont jamais modifiés en place
+pd.set_option("mode.copy_on_write", True)
 
 data_file_path = "./data/dashboard-data/"
 
-consumption_histories_file_path = data_file_path + "consumption_histories_prod.csv"
-organizations_file_path = data_file_path + "organizations_prod.csv"
-users_file_path = data_file_path + "users_prod.csv"
-contacts_file_path = data_file_path + "contacts_prod.csv"
-companies_file_path = data_file_path + "companies_prod.csv"
-job_types_file_path = data_file_path + "job_types_prod.csv"
-company_sectors_file_path = data_file_path + "company_sectors_prod.csv"
-company_sectors_classes_file_path = data_file_path + "company_classes_prod.csv"
-company_workforce_file_path = data_file_path + "workforce_prod.csv"
-company_sales_file_path = data_file_path + "sales_prod.csv"
-
 def check_password():
     """Returns `True` if the user had the correct password."""
 
@@ -57,170 +59,151 @@ def check_jwt():
         st.error("Token JWT invalide.")
     return False
 
-no_security = False
-try:
-    no_security = False if st.secrets["no_security"] == 0 else True
-except KeyError:
-    no_security = False
-
-if not no_security and not check_jwt() and not check_password():
-        st.stop()
-
-
-@st.cache_data
-def load_data_consumption():
-    debug = False
+def get_secret(name, default=None):
     try:
-        debug = False if st.secrets["debug"] == 0 else True
+        return st.secrets[name]
     except KeyError:
-        debug = False
-
-    if debug:
-        return pd.read_csv(
-            consumption_histories_file_path,
-            usecols=['id', 'contact_id', 'creation_date', 'organization_id', 'type_id', 'user_id'],
-            parse_dates=["creation_date"],
-            nrows=100000
-        )
-
-    return pd.read_csv(
-        consumption_histories_file_path,
-        usecols=['id', 'contact_id', 'creation_date', 'organization_id', 'type_id', 'user_id'],
-        parse_dates=["creation_date"],
-    )
-
-
-@st.cache_data
-def load_data_organization():
-    return pd.read_csv(organizations_file_path)
-
-@st.cache_data
-def load_data_users():
-    return pd.read_csv(users_file_path)
-
-@st.cache_data
-def load_data_contact():
-    return pd.read_csv(contacts_file_path, usecols=['id', 'company_id', 'tag_list', 'job_type_list'])
+        return default
 
-@st.cache_data
-def load_data_companies():
-    return pd.read_csv(companies_file_path, usecols=['id', 'tag_list'])
 
-@st.cache_data
-def load_data_company_sectors():
-    return pd.read_csv(company_sectors_file_path)
-
-@st.cache_data
-def load_data_company_sectors_classes():
-    return pd.read_csv(company_sectors_classes_file_path)
-
-
-@st.cache_data
-def load_data_job_types():
-    job_types_df = pd.read_csv(job_types_file_path, usecols=['id', 'type'])
-    job_types_df = job_types_df.rename(columns={'type': 'name'})
-    return job_types_df
+no_security = get_secret("no_security", 0) != 0
 
+if not no_security and not check_jwt() and not check_password():
+        st.stop()
 
+debug = get_secret("debug", 0) != 0
 
-@st.cache_data
-def load_data_companies_workforce():
-    return pd.read_csv(company_workforce_file_path, usecols=['id', 'name'])
+# Mesure des étapes de l'exécution : panneau Performance en debug, fichier JSON lines si `timing_log`
+timing_log = get_secret("timing_log")
+recording = debug or bool(timing_log)
+recorder = timing.Recorder(log_path=timing_log)
+if recording:
+    recorder.start()
 
-@st.cache_data
-def load_data_companies_sales():
-    return pd.read_csv(company_sales_file_path, usecols=['id', 'name'])
+# Profil d'une seule exécution : ?profile=1 (cProfile) ou ?profile=pyinstrument dans l'URL
+profile = None
+if debug and "profile" in st.query_params:
+    try:
+        profile = timing.Profile("pyinstrument" if st.query_params["profile"] == "pyinstrument" else "cprofile")
+        profile.start()
+    except ImportError:
+        st.sidebar.warning("pyinstrument n'est pas installé : profil indisponible.")
 
 
+def finish_profile():
+    # À appeler avant chaque st.stop() aussi : un profil jamais arrêté reste actif dans le thread de la session
+    global profile
+    if profile is not None:
+        st.session_state["profile_report"] = profile.stop()
+        profile = None
+        del st.query_params["profile"]  # Une seule exécution profilée
 
-@st.cache_data
-def load_format_main_df():
-    df = load_data_consumption()
-    contacts_df = load_data_contact()
-    companies_df = load_data_companies()
-    companies_sector_df = load_data_company_sectors()
 
-    # Formating contact data
-    contacts_df['job_info'] = contacts_df['job_type_list'].apply(json.loads)
-    contacts_df['job_count'] = contacts_df['job_info'].apply(lambda x: len(x)) 
-    contacts_df['job_type_id'] = contacts_df['job_info'].apply(lambda x: x[0]['id'] if x else None)
+# Résultats des filtres et agrégats par sélection, partagés par toutes les sessions
+@st.cache_resource
+def get_result_cache():
+    return DataCache(max_bytes=get_secret("result_cache_max_mb", 256) * 2**20)
 
-    contacts_df['tags_info'] = contacts_df['tag_list'].apply(json.loads)
-    contacts_df['tags_count'] = contacts_df['tags_info'].apply(lambda x: len(x))
-    contacts_df['hierarchical_id'] = contacts_df['tags_info'].apply(lambda x: x[0]['list'][0]['id'] if x else None)
-    contacts_df['hierarchical_name'] = contacts_df['tags_info'].apply(lambda x: x[0]['list'][0]['name'] if x else None)
 
+# Specs Vega-Lite des graphiques avec leurs données, partagées entre sessions pour des tables identiques
+@st.cache_resource
+def get_chart_cache():
+    return DataCache(max_bytes=get_secret("chart_cache_max_mb", 64) * 2**20)
 
-    contacts_df.drop(columns=[
-        'job_type_list',
-        'tag_list',
-        'job_info',
-        'tags_info',
-        'job_count', #
-        'tags_count', #
-        'hierarchical_id' #
-        ], inplace=True)
 
-    df = df.merge(contacts_df, left_on='contact_id', right_on='id', how='left')
+result_cache = get_result_cache()
+# Taille et temps de construction des graphiques de cette exécution
+chart_cache = ChartCache(get_chart_cache())
 
-    # Formating company data
 
-    # Liste complète des catégories possibles
-    all_categories = ["Secteur", "Taille d'entreprise", "Tranche de CA", "Tranche d'effectif", "Structure Type"]
+# Fichiers lus en parallèle au démarrage, par chargement (défaut : `loaders.WORKERS`, 1 = l'un après l'autre)
+loader_workers = get_secret("loader_workers")
 
-    # Fonction pour extraire les valeurs du JSON stringifié
-    def extract_tags(json_str):
-        try:
-            data = json.loads(json_str)  # Charger le JSON
-            flattened_data = {entry["name"]: entry["list"][0]["id"] for entry in data if entry["list"]}
-            return {category: flattened_data.get(category, None) for category in all_categories}
-        except (json.JSONDecodeError, TypeError):  # Gérer les erreurs de JSON invalide ou NaN
-            return {category: None for category in all_categories}
 
-    tags_df = companies_df["tag_list"].apply(extract_tags).apply(pd.Series)
+# Serveur de données partagé par plusieurs répliques (`python -m dashboard serve`) : "hôte:port" ou
+# chemin d'un socket Unix. L'application n'est alors qu'un client : elle ne charge aucune donnée
+data_server = get_secret("data_server", os.environ.get("DASHBOARD_DATA_SERVER"))
 
-    # Fusionner avec le DataFrame original
-    companies_df = pd.concat([companies_df.drop(columns=["tag_list"]), tags_df], axis=1)
-    #companies_df = pd.concat([companies_df, tags_df], axis=1) # use the below one afeter debug
+use_fact_table = get_secret("fact_table", 0) != 0
+# Historique lu par morceaux et agrégé au fil de l'eau : seule une fenêtre récente reste en mémoire
+use_streaming = get_secret("streaming", 0) != 0
+source = "fact_table" if use_fact_table else "streaming" if use_streaming else "events"
 
-    df = df.merge(companies_df, left_on='company_id', right_on='id', how='left')
-    #df = df.drop(columns=['id_y']).rename(columns={'id_x': 'id'})
-    
-    df = df.drop(columns=['id', 'id_y']).rename(columns={'id_x': 'id'})
+# Moteur de requêtes des graphiques : "pandas" (cube) ou "duckdb" (SQL sur les événements)
+query_engine = get_secret("query_engine", "pandas")
 
-    df = df.merge(companies_sector_df[['id', 'class']], left_on='Secteur', right_on='id', how='left')
-    df = df.drop(columns=['id_y']).rename(columns={'id_x': 'id'})
+if query_engine == "duckdb" and use_streaming:
+    # Le moteur DuckDB interroge tous les événements, que le mode streaming ne garde pas
+    st.sidebar.warning("Moteur DuckDB indisponible en mode streaming : utilisation du cube.")
+    query_engine = "pandas"
 
-    return df
+duckdb_threads = get_secret("duckdb_threads")
 
 
-df = load_format_main_df()
+# Une version des données : événements, cube codé pour toutes les sélections, rapport mémoire,
+# tables de référence (libellés et options des sélecteurs précalculés) et moteur de requêtes
+def load_data():
+    return pipeline.load_version(
+        data_file_path, source, query_engine, loader_workers, duckdb_threads,
+        nrows=100000 if debug else None,
+        chunk_rows=get_secret("streaming_chunk_rows", streaming.CHUNK_ROWS),
+        window_days=get_secret("streaming_window_days", streaming.WINDOW_DAYS),
+        window_rows=get_secret("streaming_window_rows", streaming.WINDOW_ROWS),
+    )
 
-org_df = load_data_organization()
-users_df = load_data_users()
-job_types_df = load_data_job_types()
 
-companies_sector_df = load_data_company_sectors()
-companies_sector_class_df = load_data_company_sectors_classes()
-companies_workforce_df = load_data_companies_workforce()
-companies_sales_df = load_data_companies_sales()
+# Données reconstruites en arrière-plan quand les exports changent (le manifeste pour la table de faits),
+# puis substituées d'un coup : aucune requête n'attend un rechargement, sauf le tout premier.
+# Avec un serveur de données, c'est lui qui recharge : le client a la même interface
+@st.cache_resource
+def get_refresher():
+    if data_server:
+        return DataClient(data_server)
+    refresher = Refresher(
+        load_data,
+        pipeline.watched_paths(data_file_path, source),
+        interval=get_secret("refresh_interval_seconds", 60),
+    )
+    return refresher.start() if refresher.interval else refresher
 
-org_dict = dict(zip(org_df["name"] + ' (' + org_df["id"].astype(str) + ')' , org_df["id"]))
-users_dict = dict(zip(users_df["first_name"] + ' ' + users_df["last_name"] + ' (' + users_df["id"].astype(str) + ')' , users_df["id"]))
 
-type_ids_dict = {
-    "consultation contact": 1,
-    "exports": 3,
-    "exports CRM": 4,
-    "location mail": 5,
-    "push to crm": 7,
-    "campagnes/séquence": 8,
-    "mobiles": 9,
-}
+refresher = get_refresher()
+try:
+    data_version = refresher.current
+except OSError as error:
+    st.error(f"Serveur de données {data_server} injoignable : {error}")
+    finish_profile()
+    st.stop()
+dataset, lookups, engine = data_version.value
+st.sidebar.caption(
+    f"Données : version {data_version.number} du {data_version.built_at:%d/%m/%Y %H:%M}, "
+    f"construite en {data_version.seconds:,.1f} s"
+)
+if refresher.error is not None:
+    st.sidebar.warning(f"Échec du rechargement des données : version {data_version.number} conservée.")
+if dataset is None:
+    st.error("Table de faits absente : lancer `python -m dashboard build`." if use_fact_table else "Historique de consommation vide.")
+    finish_profile()
+    st.stop()
+if use_fact_table and not data_server and not fact_table.is_fresh(data_file_path):
+    st.sidebar.warning("Table de faits obsolète : relancer `python -m dashboard build`.")
+if dataset.note:
+    st.sidebar.caption(dataset.note)
+df, memory_df = dataset.events, dataset.memory
+
+if debug:
+    with st.sidebar.expander("Debug : mémoire du DataFrame principal"):
+        st.dataframe(memory_df)
+    with st.sidebar.expander("Debug : cache des sélections"):
+        st.json(result_cache.stats())
+
+org_dict = lookups.options["organization_id"]
+users_dict = lookups.options["user_id"]
+
+type_ids_dict = TYPE_IDS
 
 # Définir la période par défaut (les 31 derniers jours)
-default_end_date = df["creation_date"].max()
-default_start_date = default_end_date - pd.Timedelta(days=31)
+default_start_date, default_end_date = pipeline.default_period(df)
 
 
 # Interface Streamlit
@@ -254,81 +237,110 @@ selected_users_names = st.sidebar.multiselect("Sélectionner un ou plusieurs uti
 selected_users_ids = [users_dict[name] for name in selected_users_names]
 
 
-# Affichage par jour ou par mois
-#aggregation = st.radio("Afficher par :", ["Jour", "Mois"], index=0)
-aggregation = st.selectbox(
-    "",
-    ("Jour", "Mois"),
-    index=0,
-)
+# Filtrage des données : résultats partagés entre sessions pour une même sélection
+query = ConsumptionQuery(start_date, end_date, selected_type_id, selected_org_ids, selected_users_ids)
 
 
-# Filtrage des données
-filtered_df = df[(df["creation_date"] >= pd.Timestamp(start_date)) & (df["creation_date"] <= pd.Timestamp(end_date))]
+def selection_result(name, compute):
+    # Résultats propres à la version des données : ceux des versions remplacées sortent du cache LRU
+    return result_cache.get((data_version.number, query, name), compute)
 
-#filtered_df = filtered_df[filtered_df["type_id"] == selected_type_id]
-filtered_df = filtered_df[filtered_df["type_id"].isin(selected_type_id)]
 
+# Timeline et répartitions de tous les graphiques, en une passe sur la sélection,
+# calculées au premier panneau affiché
+def get_aggregates():
+    return selection_result("aggregates", lambda: query.run(engine))
 
-# Filtrage sur les `organization_id`
-if selected_org_ids:
-    filtered_df = filtered_df[filtered_df["organization_id"].isin(selected_org_ids)]
 
-# Filtrage sur les `user_id`
-if selected_users_ids:
-    filtered_df = filtered_df[filtered_df["user_id"].isin(selected_users_ids)]
+# Mesures des graphiques : nombre d'événements, ou nombre distinct estimé par les sketches HyperLogLog
+EVENTS_METRIC = "Événements"
+metric_columns = {label: column for column, label in METRICS.items()}
 
 
-##############################################################
-#  CONSOMMATIONS PERIODE GRAPHIQUE HORIZONTAL
-##############################################################
+def get_distinct(metric, by):
+    column = metric_columns[metric]
+    return selection_result(("distinct", column, by), lambda: dataset.sketches[column].distinct(query, by))
+
+
+def metric_selectbox(key):
+    # Les sketches sont par jour, type et organisation : pas de mesure distincte filtrée par utilisateur
+    if selected_users_ids:
+        return EVENTS_METRIC
+    return st.selectbox("Mesure", [EVENTS_METRIC, *metric_columns], key=key, label_visibility="collapsed")
 
-# Agrégation des données
-if aggregation == "Jour":
-    all_dates = pd.date_range(start=start_date, end=end_date, freq="D").date
-    grouped_df = filtered_df.groupby(filtered_df["creation_date"].dt.date).size().reset_index(name="count")
-    grouped_df = pd.DataFrame({"creation_date": all_dates}).merge(grouped_df, on="creation_date", how="left").fillna(0)
-    grouped_df["creation_date"] = grouped_df["creation_date"].astype(str)  # Pour affichage correct
-else:
-    all_dates = pd.period_range(start=start_date, end=end_date, freq="M")
-    grouped_df = filtered_df.groupby(filtered_df["creation_date"].dt.to_period("M")).size().reset_index(name="count")
-    grouped_df = pd.DataFrame({"creation_date": all_dates}).merge(grouped_df, on="creation_date", how="left").fillna(0)
-    grouped_df["creation_date"] = grouped_df["creation_date"].astype(str)  # Pour affichage correct
 
 primary_color = st.get_option("theme.primaryColor")
 background_color = st.get_option("theme.backgroundColor")
 text_color = st.get_option("theme.textColor")
 secondary_background_color = st.get_option("theme.secondaryBackgroundColor")
 
-# Graphique avec Altair
-chart = alt.Chart(grouped_df).mark_bar().encode(
-    x=alt.X("creation_date:N", title="Date", sort=None),
-    y=alt.Y("count:Q", title="Nombre d'occurrences"),
-    tooltip=["creation_date", "count"]
-).properties(
-    width=800,
-    # height=400,
-    # title=f"Consommation par {aggregation.lower()}"
-)
 
-# Graphique pour les labels
-text_labels = alt.Chart(grouped_df).mark_text(
-    align="center",
-    baseline="bottom",
-    dy=-5,  # Décalage vertical pour placer les labels au-dessus des barres
-    color=text_color,
-    #angle=45
-).encode(
-    x=alt.X("creation_date:N", sort=None),
-    y="count:Q",
-    text=alt.Text("count:Q", format=",") 
-)
+def draw_chart(label, kind, chart_df, **params):
+    st.vega_lite_chart(chart_cache.get(label, kind, chart_df, text_color, **params), use_container_width=True)
+
+
+##############################################################
+#  PANNEAUX
+##############################################################
+
+# Chaque section est un panneau : rien n'est calculé tant qu'il n'est pas affiché
+panels = []
+# Panneaux affichés à l'ouverture de la page
+open_panels = get_secret("open_panels", ["timeline"])
+
+
+def panel(key, title):
+    """Registers a section, rendered by `show_panel` only when its toggle is on."""
+    def decorator(render):
+        panels.append((key, title, key in open_panels, render))
+        return render
+    return decorator
 
-final_chart = (chart + text_labels).configure_axis(
-    labelAngle=-45
-)
 
-st.altair_chart(final_chart, use_container_width=True)
+# Un fragment par panneau : ses contrôles ne relancent que lui
+@st.fragment
+def show_panel(key, title, expanded, render):
+    if recording:
+        # Relance du seul fragment : mesures ajoutées à celles de la dernière exécution complète
+        recorder.start()
+    if title:
+        st.subheader(title)
+    if st.toggle("Afficher", value=expanded, key=f"panel_{key}"):
+        with stage("panel", panel=key):
+            render()
+
+
+##############################################################
+#  CONSOMMATIONS PERIODE GRAPHIQUE HORIZONTAL
+##############################################################
+
+@panel("timeline", "")
+def timeline_panel():
+    aggregation_column, metric_column = st.columns(2)
+    with aggregation_column:
+        # Affichage par jour ou par mois
+        #aggregation = st.radio("Afficher par :", ["Jour", "Mois"], index=0)
+        aggregation = st.selectbox(
+            "",
+            ("Jour", "Mois"),
+            index=0,
+        )
+    with metric_column:
+        metric = metric_selectbox("timeline_metric")
+    freq = "D" if aggregation == "Jour" else "M"
+
+    # Agrégation des données
+    if metric == EVENTS_METRIC:
+        grouped_df = get_aggregates().period_timeline(freq, start_date, end_date)
+    else:
+        grouped_df = fill_periods(get_distinct(metric, freq), freq, start_date, end_date)
+    grouped_df["creation_date"] = grouped_df["creation_date"].astype(str)  # Pour affichage correct
+
+    # Graphique avec Altair : spec construite une fois, données envoyées une fois pour toutes les couches
+    if metric == EVENTS_METRIC:
+        draw_chart("Consommation", "timeline", grouped_df)
+    else:
+        draw_chart(f"Consommation : {metric}", "timeline", grouped_df, title=metric)
 
 
 if selected_org_ids and not selected_users_ids:
@@ -336,25 +348,10 @@ if selected_org_ids and not selected_users_ids:
     ##############################################################
     #  CHAMPIONS USERS
     ##############################################################
-    st.subheader("🥇 Champions de l'organization")
-    user_champtions_counts = filtered_df["user_id"].value_counts().reset_index()
-    user_champtions_counts.columns = ["user_id", "count"]
-    user_champtions_counts = user_champtions_counts.merge(users_df, left_on="user_id", right_on="id", how="left")
-    user_champtions_counts["name"] = user_champtions_counts["first_name"] + " " + user_champtions_counts["last_name"] + " (" + user_champtions_counts["id"].astype(str) + ")"
-    user_champtions_counts["name"].fillna("Inconnu", inplace=True)
-
-    chart = alt.Chart(user_champtions_counts).mark_bar().encode(
-        x=alt.X("count:Q", title="Nombre d'occurrences"),
-        y=alt.Y("name:N", title="", sort="-x"),
-        tooltip=["name", "count"]
-    ).properties(
-        #title="Nombre d'occurrences par Tranche d'effectif"
-    ).configure_axis(
-        labelFontSize=12,
-        titleFontSize=14,
-        labelLimit=300  # Augmente l'espace pour les labels
-    )
-    st.altair_chart(chart, use_container_width=True)
+    @panel("user_champions", "🥇 Champions de l'organization")
+    def user_champions_panel():
+        user_champtions_counts = get_aggregates().breakdown("user_id", lookups.names["user_id"])
+        draw_chart("Champions utilisateurs", "bar", user_champtions_counts, text=False)
 
 
 if not selected_org_ids and not selected_users_ids:
@@ -362,300 +359,146 @@ if not selected_org_ids and not selected_users_ids:
     ##############################################################
     #  CHAMPIONS ORGANIZATIONS
     ##############################################################
-    st.subheader("🥇 Top 10 des organizations")
-
-    organizations_champtions_counts = filtered_df["organization_id"].value_counts().reset_index()
-    organizations_champtions_counts.columns = ["organization_id", "count"]
-    organizations_champtions_counts = organizations_champtions_counts.merge(org_df, left_on="organization_id", right_on="id", how="left")
-    organizations_champtions_counts["name"] = organizations_champtions_counts["name"] + " (" + organizations_champtions_counts["id"].astype(str) + ")"
-    organizations_champtions_counts["name"].fillna("Inconnu", inplace=True)
-
-    organizations_champtions_counts = organizations_champtions_counts.head(10)
-
-    chart = alt.Chart(organizations_champtions_counts).mark_bar().encode(
-        x=alt.X("count:Q", title="Nombre d'occurrences"),
-        y=alt.Y("name:N", title="", sort="-x"),
-        tooltip=["name", "count"]
-    ).properties(
-        #title="Nombre d'occurrences par Tranche d'effectif"
-    ).configure_axis(
-        labelFontSize=12,
-        titleFontSize=14,
-        labelLimit=300  # Augmente l'espace pour les labels
-    )
-    st.altair_chart(chart, use_container_width=True)
-
-
-st.dataframe(df.head(1000))
+    @panel("organization_champions", "🥇 Top 10 des organizations")
+    def organization_champions_panel():
+        metric = metric_selectbox("organization_metric")
+        if metric == EVENTS_METRIC:
+            organizations_champtions_counts = get_aggregates().breakdown("organization_id", lookups.names["organization_id"])
+        else:
+            organizations_champtions_counts = get_distinct(metric, "organization_id")
+            organizations_champtions_counts = organizations_champtions_counts.assign(
+                name=lookups.label("organization_id", organizations_champtions_counts["organization_id"]),
+            )
+        organizations_champtions_counts = organizations_champtions_counts.head(10)
+        draw_chart("Top organisations", "bar", organizations_champtions_counts, text=False)
+
+
+@panel("events", "🗂️ Explorateur des événements")
+def events_panel():
+    # Événements de la sélection : seule la page demandée est lue, pour les colonnes choisies
+    # Avec un serveur de données, les correspondances restent sur le serveur : seules les pages transitent
+    if data_server:
+        filtered = selection_result("events", lambda: refresher.filtered_events(query))
+    else:
+        filtered = selection_result("events", lambda: explorer.FilteredEvents(df, query))
+    columns = st.multiselect("Colonnes", list(df.columns), default=list(df.columns), key="events_columns")
+    page_column, size_column = st.columns(2)
+    with size_column:
+        page_rows = st.selectbox("Lignes par page", (50, 100, 500, 1000), index=1, key="events_page_rows")
+    page_count = max(1, -(-len(filtered) // page_rows))
+    with page_column:
+        page_number = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="events_page")
+    st.caption(f"{len(filtered):,} événements, page {page_number} sur {page_count:,}")
+    st.dataframe(filtered.page(df, page_number - 1, page_rows, columns), hide_index=True)
+
+    # Export écrit par morceaux dans un fichier temporaire, mais que st.download_button relit en entier
+    # dans la mémoire du processus : sa taille est plafonnée par `export_max_rows`
+    format_column, export_column = st.columns(2)
+    with format_column:
+        export_format = st.radio("Format", list(explorer.EXPORT_FORMATS), horizontal=True, key="events_export_format")
+    extension, mime = explorer.EXPORT_FORMATS[export_format]
+    export_max_rows = get_secret("export_max_rows", explorer.EXPORT_MAX_ROWS)
+    with export_column:
+        if len(filtered) > export_max_rows:
+            st.warning(
+                f"Export limité à {export_max_rows:,} lignes : réduire la période ou filtrer les types, "
+                f"organisations ou utilisateurs pour exporter ces {len(filtered):,} événements."
+            )
+        elif st.button(f"Préparer l'export ({len(filtered):,} lignes)", key="events_export"):
+            with tempfile.TemporaryDirectory() as export_dir:
+                export_path = os.path.join(export_dir, f"evenements.{extension}")
+                explorer.write_export(df, filtered, export_path, export_format, columns)
+                with open(export_path, "rb") as export_file:
+                    st.download_button("Télécharger", export_file, file_name=f"evenements.{extension}", mime=mime)
 
 
 ##############################################################
 #  FAMILLE DE FONCTIONS
 ##############################################################
 
-st.subheader("👔 Répartition par famille de fonction")
-job_counts = filtered_df["job_type_id"].value_counts().reset_index()
-job_counts.columns = ["job_type_id", "count"]
-job_counts = job_counts.merge(job_types_df, left_on="job_type_id", right_on="id", how="left")
-job_counts["name"].fillna("Inconnu", inplace=True)
-
-chart = alt.Chart(job_counts).mark_bar().encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    tooltip=["name", "count"],
-).properties(
-    width=700,
-)
-
-text_labels = alt.Chart(job_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    text=alt.Text("count:Q", format=",") 
-)
-
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
-
-st.altair_chart(final_chart, use_container_width=True)
-
-
-
-
+@panel("job_types", "👔 Répartition par famille de fonction")
+def job_types_panel():
+    job_counts = get_aggregates().breakdown("job_type_id", lookups.names["job_type_id"])
+    draw_chart("Familles de fonction", "bar", job_counts, width=700)
 
 
 ##############################################################
 #  Hierarchical name
 ##############################################################
-st.subheader("🔝 Niveau hierarchique")
-
-hierarchical_counts = filtered_df["hierarchical_name"].value_counts().reset_index()
-hierarchical_counts.columns = ["hierarchical_name", "count"]
-
-total_count = hierarchical_counts["count"].sum()
-hierarchical_counts["rate"] = (hierarchical_counts["count"] / total_count) * 100
-hierarchical_counts["rate"] = hierarchical_counts["rate"].round(2)
-hierarchical_counts['rate_with_units'] = hierarchical_counts['rate'].apply(lambda x: f"{x:,.0f} %")
-chart = alt.Chart(hierarchical_counts).mark_bar().encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("hierarchical_name:N", title="", sort="-x"),
-    tooltip=["hierarchical_name", "count"]
-)
-
-text_labels = alt.Chart(hierarchical_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("hierarchical_name:N", title="", sort="-x"),
-    text=alt.Text("count:Q", format=",") 
-)
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
-st.altair_chart(final_chart, use_container_width=True)
-
-######
-chart = alt.Chart(hierarchical_counts).mark_bar().encode(
-    x=alt.X("rate:Q", title="Nombre d'occurrences"),
-    y=alt.Y("hierarchical_name:N", title="", sort="-x"),
-    tooltip=["hierarchical_name", "rate"]
-)
-
-text_labels = alt.Chart(hierarchical_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("rate:Q", title="Nombre d'occurrences"),
-    y=alt.Y("hierarchical_name:N", title="", sort="-x"),
-    text="rate_with_units"
-)
-
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
-st.altair_chart(final_chart, use_container_width=True)
 
+@panel("hierarchical", "🔝 Niveau hierarchique")
+def hierarchical_panel():
+    hierarchical_counts = shares(get_aggregates().breakdown("hierarchical_name"))
 
+    draw_chart("Niveaux hiérarchiques", "bar", hierarchical_counts, y="hierarchical_name")
 
+    ######
+    draw_chart("Niveaux hiérarchiques (%)", "bar", hierarchical_counts, y="hierarchical_name", x="rate", text="rate_with_units")
 
-
-# Créer un pie chart avec Altair
-pie_chart = alt.Chart(hierarchical_counts).mark_arc().encode(
-    theta=alt.Theta(field="count", type="quantitative"),
-    color=alt.Color(field="hierarchical_name", type="nominal"),
-    tooltip=["hierarchical_name", "count"]
-).properties(
-    width=400,
-    height=400,
-    title="Répartition des catégories"
-)
-st.altair_chart(pie_chart, use_container_width=True)
-
+    # Créer un pie chart avec Altair
+    draw_chart("Répartition des catégories", "pie", hierarchical_counts, color="hierarchical_name", title="Répartition des catégories")
 
 
 ##############################################################
 #  Workforce
 ##############################################################
 
-# Workforce
-st.subheader("👷 Répartition par Tranche d'effectif")
-
-workforce_counts = filtered_df["Tranche d'effectif"].value_counts().reset_index()
-workforce_counts.columns = ["Tranche d'effectif", "count"]
-workforce_counts = workforce_counts.merge(companies_workforce_df, left_on="Tranche d'effectif", right_on="id", how="left")
-workforce_counts["name"].fillna("Inconnu", inplace=True)
-
-chart = alt.Chart(workforce_counts).mark_bar().encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    tooltip=["name", "count"]
-)
-
-text_labels = alt.Chart(workforce_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    text=alt.Text("count:Q", format=",") 
-)
-
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
-
-st.altair_chart(final_chart, use_container_width=True)
+@panel("workforce", "👷 Répartition par Tranche d'effectif")
+def workforce_panel():
+    workforce_counts = get_aggregates().breakdown("Tranche d'effectif", lookups.names["Tranche d'effectif"])
+    draw_chart("Tranches d'effectif", "bar", workforce_counts)
 
 
 ##############################################################
 #  Tranches CA
 ##############################################################
 
-st.subheader("💵 Répartition par Tranche de CA")
-company_sales_counts = filtered_df["Tranche de CA"].value_counts().reset_index()
-company_sales_counts.columns = ["Tranche de CA", "count"]
-company_sales_counts = company_sales_counts.merge(companies_sales_df, left_on="Tranche de CA", right_on="id", how="left")
-company_sales_counts["name"].fillna("Inconnu", inplace=True)
-
-chart = alt.Chart(company_sales_counts).mark_bar().encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    tooltip=["name", "count"]
-)
-
-text_labels = alt.Chart(company_sales_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    text=alt.Text("count:Q", format=",") 
-)
-
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
-
-st.altair_chart(final_chart, use_container_width=True)
-
+@panel("company_sales", "💵 Répartition par Tranche de CA")
+def company_sales_panel():
+    company_sales_counts = get_aggregates().breakdown("Tranche de CA", lookups.names["Tranche de CA"])
+    draw_chart("Tranches de CA", "bar", company_sales_counts)
 
 
 ##############################################################
 #  Secteurs (Secteurs types)
 ##############################################################
 
-st.subheader("💼 Répartition par méta secteur")
-meta_sector_counts = filtered_df["class"].value_counts().reset_index()
-meta_sector_counts.columns = ["class", "count"]
-meta_sector_counts = meta_sector_counts.merge(companies_sector_class_df, left_on="class", right_on="id", how="left")
-meta_sector_counts["name"].fillna("Inconnu", inplace=True)
+@panel("meta_sectors", "💼 Répartition par méta secteur")
+def meta_sectors_panel():
+    meta_sector_counts = get_aggregates().breakdown("class", lookups.names["class"])
+    draw_chart("Méta secteurs", "bar", meta_sector_counts)
 
-chart = alt.Chart(meta_sector_counts).mark_bar().encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    tooltip=["name", "count"]
-)
 
-text_labels = alt.Chart(meta_sector_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    text=alt.Text("count:Q", format=",") 
-)
+##############################################################
+#  Secteurs (Secteurs types)
+##############################################################
 
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
+@panel("sectors", "🏭 Répartition par secteur")
+def sectors_panel():
+    sector_counts = get_aggregates().breakdown("Secteur", lookups.names["Secteur"])
+    draw_chart("Secteurs", "bar", sector_counts)
 
-st.altair_chart(final_chart, use_container_width=True)
 
+for panel_args in panels:
+    show_panel(*panel_args)
 
 
-##############################################################
-#  Secteurs (Secteurs types)
-##############################################################
-st.subheader("🏭 Répartition par secteur")
-sector_counts = filtered_df["Secteur"].value_counts().reset_index()
-sector_counts.columns = ["Secteur", "count"]
-sector_counts = sector_counts.merge(companies_sector_df, left_on="Secteur", right_on="id", how="left")
-sector_counts["name"].fillna("Inconnu", inplace=True)
-
-chart = alt.Chart(sector_counts).mark_bar().encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    tooltip=["name", "count"]
-)
-
-text_labels = alt.Chart(sector_counts).mark_text(
-    align="left",
-    baseline="middle",
-    dx=5,
-    color=text_color
-).encode(
-    x=alt.X("count:Q", title="Nombre d'occurrences"),
-    y=alt.Y("name:N", title="", sort="-x"),
-    text=alt.Text("count:Q", format=",") 
-)
+finish_profile()
 
-final_chart = (chart + text_labels).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14,
-    labelLimit=300
-)
-st.altair_chart(final_chart, use_container_width=True)
+if debug:
+    with st.sidebar.expander("Debug : cache des graphiques"):
+        st.json(chart_cache.data_cache.stats())
 
+    with st.expander("⏱️ Performance"):
+        st.caption(f"Exécution {recorder.run} : {recorder.elapsed_ms():,.0f} ms")
+        st.dataframe(recorder.frame(), hide_index=True)
+        profile_report = st.session_state.get("profile_report")
+        if profile_report:
+            st.code(profile_report)
+            st.download_button("Télécharger le profil", profile_report, file_name="profile.txt")
+        else:
+            st.caption("Ajouter `?profile=1` (ou `?profile=pyinstrument`) à l'URL pour profiler une exécution.")
 
 
 #st.dataframe(df.head())
 
-
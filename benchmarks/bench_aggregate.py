@@ -0,0 +1,105 @@
+"""Per-rerun cost of the chart tables: one-pass aggregation vs. per-chart code.
+
+The former code filtered the cube, then ran one `groupby` per chart and
+merged each result with its lookup frame. `CodedCube.aggregate` answers
+every chart from one gather of the selected rows and resolves names by
+array indexing. Both must produce identical chart tables::
+
+    python -m benchmarks.bench_aggregate --rows 2000000 --selections 50
+"""
+import argparse
+import json
+
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.common import timed
+from benchmarks.bench_query_engines import main_df, random_selections
+from dashboard.aggregate import CodedCube
+from dashboard.lookups import id_names, organization_labels, user_labels
+from dashboard.rollup import breakdown, build_cube, select, timeline
+
+LABELED_COLUMNS = ["user_id", "organization_id", "job_type_id", "Tranche d'effectif", "Tranche de CA", "class", "Secteur"]
+
+
+def lookups(organizations, users):
+    return {
+        "organization_id": synthetic.lookup(range(1, organizations + 1), "Org"),
+        "user_id": synthetic.users(users),
+        "job_type_id": synthetic.lookup(range(1, synthetic.JOB_TYPES + 1), "Fonction"),
+        "Tranche d'effectif": synthetic.lookup(synthetic.COMPANY_TAGS["Tranche d'effectif"], "Effectif"),
+        "Tranche de CA": synthetic.lookup(synthetic.COMPANY_TAGS["Tranche de CA"], "CA"),
+        "class": synthetic.lookup(range(1, 13), "Classe"),
+        "Secteur": synthetic.lookup(synthetic.COMPANY_TAGS["Secteur"], "Secteur"),
+    }
+
+
+def label_arrays(lookup_dfs):
+    labels = {column: id_names(lookup_df["id"], lookup_df["name"]) for column, lookup_df in lookup_dfs.items() if "name" in lookup_df}
+    labels["user_id"] = id_names(lookup_dfs["user_id"]["id"], user_labels(lookup_dfs["user_id"]))
+    labels["organization_id"] = id_names(lookup_dfs["organization_id"]["id"], organization_labels(lookup_dfs["organization_id"]))
+    return labels
+
+
+def per_chart_rerun(cube, selection, lookup_dfs):
+    """The former chart code: filter, then one groupby and one merge per chart."""
+    rows = select(cube, selection)
+    tables = {"timeline": timeline(rows, "D"), "hierarchical_name": breakdown(rows, "hierarchical_name")}
+    for column in LABELED_COLUMNS:
+        counts = breakdown(rows, column).merge(lookup_dfs[column], left_on=column, right_on="id", how="left")
+        if column == "user_id":
+            counts["name"] = counts["first_name"] + " " + counts["last_name"] + " (" + counts["id"].astype(str) + ")"
+        elif column == "organization_id":
+            counts["name"] = counts["name"] + " (" + counts["id"].astype(str) + ")"
+        counts["name"] = counts["name"].fillna("Inconnu")
+        tables[column] = counts[[column, "count", "name"]]
+    return tables
+
+
+def one_pass_rerun(coded_cube, selection, labels):
+    aggregates = coded_cube.aggregate(selection)
+    tables = {"timeline": aggregates.timeline("D"), "hierarchical_name": aggregates.breakdown("hierarchical_name")}
+    for column in LABELED_COLUMNS:
+        tables[column] = aggregates.breakdown(column, labels[column])
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--selections", type=int, default=30)
+    args = parser.parse_args()
+
+    df = main_df(args.rows, args.contacts)
+    lookup_dfs = lookups(organizations=1_000, users=10_000)
+    cube = build_cube(df)
+    coded_cube, coded_seconds = timed(CodedCube, cube)
+    labels, labels_seconds = timed(label_arrays, lookup_dfs)
+
+    per_chart_seconds = one_pass_seconds = 0.0
+    selections = random_selections(df, args.selections)
+    for selection in selections:
+        expected, seconds = timed(per_chart_rerun, cube, selection, lookup_dfs)
+        per_chart_seconds += seconds
+        result, seconds = timed(one_pass_rerun, coded_cube, selection, labels)
+        one_pass_seconds += seconds
+        for name, table in expected.items():
+            pd.testing.assert_frame_equal(table, result[name], check_dtype=False, obj=f"{name} for {selection}")
+
+    print(json.dumps({
+        "rows": args.rows,
+        "cube_rows": len(cube),
+        "selections": len(selections),
+        "identical": True,
+        "setup_seconds": {"coded_cube": round(coded_seconds, 3), "labels": round(labels_seconds, 3)},
+        "ms_per_rerun": {
+            "per_chart": round(1000 * per_chart_seconds / len(selections), 1),
+            "one_pass": round(1000 * one_pass_seconds / len(selections), 1),
+        },
+        "speedup": round(per_chart_seconds / one_pass_seconds, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
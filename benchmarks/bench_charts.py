@@ -0,0 +1,176 @@
+"""Payload size and build time of each dashboard chart, per rerun.
+
+The former code built and validated every chart with Altair on each
+rerun, the bar and text layers each holding the table, and let
+`st.altair_chart` serialize it once per layer. `dashboard.charts` builds
+each spec once without data and ships the table once, as a named dataset
+shared by the layers; payloads are then cached on the data hash. For random selections, every chart is marshalled
+into the Streamlit chart message the four ways (former code, first
+build, new table for a known spec, cache hit) and the message sizes and
+build times are reported per chart::
+
+    python -m benchmarks.bench_charts --rows 2000000 --output charts.json
+    python -m benchmarks.bench_charts --rows 2000000 --baseline charts.json
+
+With `--baseline`, the run fails if a chart payload grew, or if building
+a chart for a new table got more than `--max-slowdown` times slower than
+in the baseline report.
+"""
+import argparse
+import json
+import sys
+
+import altair as alt
+from streamlit.elements import vega_charts
+from streamlit.proto.ArrowVegaLiteChart_pb2 import ArrowVegaLiteChart
+
+from benchmarks.bench_aggregate import label_arrays, lookups
+from benchmarks.bench_query_engines import main_df, random_selections
+from benchmarks.common import regressions, timed
+from dashboard import charts
+from dashboard.aggregate import CodedCube, shares
+from dashboard.cache import DataCache
+from dashboard.rollup import build_cube
+
+TEXT_COLOR = "#31333F"
+
+
+def chart_tables(aggregates, labels, start, end, freq):
+    """The tables of the app charts: (label, kind, table, params)."""
+    timeline = aggregates.period_timeline(freq, start, end)
+    timeline["creation_date"] = timeline["creation_date"].astype(str)
+    hierarchical = shares(aggregates.breakdown("hierarchical_name"))
+
+    tables = [
+        ("timeline", "timeline", timeline, {}),
+        ("organization_id", "bar", aggregates.breakdown("organization_id", labels["organization_id"]).head(10), {"text": False}),
+        ("job_type_id", "bar", aggregates.breakdown("job_type_id", labels["job_type_id"]), {"width": 700}),
+        ("hierarchical_name", "bar", hierarchical, {"y": "hierarchical_name"}),
+        ("hierarchical_name %", "bar", hierarchical, {"y": "hierarchical_name", "x": "rate", "text": "rate_with_units"}),
+        ("hierarchical_name pie", "pie", hierarchical, {"color": "hierarchical_name", "title": "Répartition des catégories"}),
+    ]
+    tables += [(column, "bar", aggregates.breakdown(column, labels[column]), {})
+               for column in ("Tranche d'effectif", "Tranche de CA", "class", "Secteur")]
+    return tables
+
+
+def legacy_chart(kind, df, text_color, y="name", x="count", text=None, width=None, color="name", title=None):
+    """The chart as the former code built it, the table attached to every layer."""
+    if kind == "pie":
+        return alt.Chart(df).mark_arc().encode(
+            theta=alt.Theta(field="count", type="quantitative"),
+            color=alt.Color(field=color, type="nominal"),
+            tooltip=[color, "count"],
+        ).properties(width=400, height=400, title=title)
+    if kind == "timeline":
+        chart = alt.Chart(df).mark_bar().encode(
+            x=alt.X("creation_date:N", title="Date", sort=None),
+            y=alt.Y("count:Q", title="Nombre d'occurrences"),
+            tooltip=["creation_date", "count"],
+        ).properties(width=800)
+        text_labels = alt.Chart(df).mark_text(align="center", baseline="bottom", dy=-5, color=text_color).encode(
+            x=alt.X("creation_date:N", sort=None), y="count:Q", text=alt.Text("count:Q", format=","),
+        )
+        return (chart + text_labels).configure_axis(labelAngle=-45)
+    chart = alt.Chart(df).mark_bar().encode(
+        x=alt.X(f"{x}:Q", title="Nombre d'occurrences"), y=alt.Y(f"{y}:N", title="", sort="-x"), tooltip=[y, x],
+    )
+    if width is not None:
+        chart = chart.properties(width=width)
+    if text is False:
+        return chart.configure_axis(**charts.AXIS)
+    text_labels = alt.Chart(df).mark_text(align="left", baseline="middle", dx=5, color=text_color).encode(
+        x=alt.X(f"{x}:Q", title="Nombre d'occurrences"), y=alt.Y(f"{y}:N", title="", sort="-x"),
+        text=text or alt.Text(f"{x}:Q", format=","),
+    )
+    return (chart + text_labels).configure_axis(**charts.AXIS)
+
+
+def message(spec):
+    """The Streamlit chart message of a Vega-Lite spec, as `st.vega_lite_chart` builds it."""
+    proto = ArrowVegaLiteChart()
+    spec = vega_charts._prepare_vega_lite_spec(spec, use_container_width=True)
+    vega_charts._marshall_chart_data(proto, spec)
+    proto.spec = vega_charts._stabilize_vega_json_spec(json.dumps(spec))
+    return proto
+
+
+def measure(tables, chart_cache):
+    """Message bytes and build ms of each chart: former code, first build,
+    new table for a cached spec template, cache hit."""
+    results = {}
+    for label, kind, df, params in tables:
+        legacy, legacy_seconds = timed(lambda: message(vega_charts._convert_altair_to_vega_lite_spec(legacy_chart(kind, df, TEXT_COLOR, **params))))
+        charts.spec_template.cache_clear()
+        chart_cache.data_cache.clear()
+        built, build_seconds = timed(lambda: message(chart_cache.get(label, kind, df, TEXT_COLOR, **params)))
+        chart_cache.data_cache.clear()
+        _, template_seconds = timed(lambda: message(chart_cache.get(label, kind, df, TEXT_COLOR, **params)))
+        cached, cached_seconds = timed(lambda: message(chart_cache.get(label, kind, df, TEXT_COLOR, **params)))
+        assert built == cached
+        results[label] = {
+            "rows": len(df),
+            "legacy_bytes": legacy.ByteSize(), "bytes": built.ByteSize(),
+            "legacy_ms": 1000 * legacy_seconds, "build_ms": 1000 * build_seconds,
+            "template_ms": 1000 * template_seconds, "cached_ms": 1000 * cached_seconds,
+        }
+    return results
+
+
+def chart_values(report, key, name):
+    """{"<chart>: <name>": value of `key`} of every chart of a report, for `regressions`."""
+    return {f"{label}: {name}": chart[key] for label, chart in report["charts"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--selections", type=int, default=10)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=2.0)
+    args = parser.parse_args()
+
+    df = main_df(args.rows, args.contacts)
+    coded_cube = CodedCube(build_cube(df))
+    labels = label_arrays(lookups(int(df["organization_id"].max()), int(df["user_id"].max())))
+    chart_cache = charts.ChartCache(DataCache())
+
+    totals = {}
+    for index, selection in enumerate(random_selections(df, args.selections)):
+        freq = "D" if index % 2 == 0 else "M"
+        tables = chart_tables(coded_cube.aggregate(selection), labels, selection.start_date, selection.end_date, freq)
+        for label, chart in measure(tables, chart_cache).items():
+            total = totals.setdefault(label, dict.fromkeys(chart, 0))
+            for key, value in chart.items():
+                total[key] += value
+
+    count = args.selections
+    report = {
+        "rows": args.rows,
+        "selections": count,
+        "charts": {
+            label: {key: round(value / count, 2) if key.endswith("ms") else int(value / count) for key, value in total.items()}
+            for label, total in totals.items()
+        },
+    }
+    report["total"] = {key: round(sum(chart[key] for chart in report["charts"].values()), 2)
+                       for key in ("legacy_bytes", "bytes", "legacy_ms", "build_ms", "template_ms", "cached_ms")}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        failures = regressions(chart_values(report, "bytes", "payload"), chart_values(baseline, "bytes", "payload"), 1, unit="bytes")
+        failures += regressions(
+            chart_values(report, "template_ms", "build"), chart_values(baseline, "template_ms", "build"), args.max_slowdown, floor=1.0,
+        )
+        if failures:
+            sys.exit("chart regressions:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
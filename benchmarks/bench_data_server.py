@@ -0,0 +1,135 @@
+"""Data server against a local stand-in: identical results and round-trip cost.
+
+Writes synthetic exports to a temporary directory and serves them from this
+process with `dashboard.server` on a temporary Unix socket (or `--address`),
+as `python -m dashboard serve` would. For random sidebar selections, checks
+that the client gets exactly the tables of the local engine, sketches and
+explorer (timelines, breakdowns, distinct counts, pages and a CSV export),
+then reports the time per request locally, from the server on a first
+(uncached) and a repeated request, and with `--clients` threads querying at
+once, plus the bytes received per aggregate::
+
+    python -m benchmarks.bench_data_server --events 2000000 --clients 1 4 8
+
+Fails if any result differs.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.bench_query_engines import random_selections
+from benchmarks.common import timed
+from dashboard import explorer, pipeline, server
+from dashboard.aggregate import BREAKDOWN_COLUMNS
+from dashboard.refresh import Refresher
+
+
+def tables(dataset, engine, selection):
+    """Every table the app reads for `selection`."""
+    aggregates = selection.run(engine)
+    result = {("timeline", freq): aggregates.timeline(freq) for freq in ("D", "M")}
+    result.update({("breakdown", column): aggregates.breakdown(column) for column in BREAKDOWN_COLUMNS})
+    if not selection.user_ids:
+        for column, sketches in dataset.sketches.items():
+            result.update({("distinct", column, by): sketches.distinct(selection, by) for by in (None, "D", "M", "organization_id")})
+    return result
+
+
+def explorer_tables(dataset, filtered, export_path):
+    """Length, first and last pages and CSV export of a `FilteredEvents` (local or remote)."""
+    pages = max(1, -(-len(filtered) // 100))
+    explorer.write_export(dataset.events, filtered, export_path, chunk_rows=10_000)
+    with open(export_path, "rb") as export_file:
+        export = export_file.read()
+    return len(filtered), filtered.page(dataset.events, 0, 100), filtered.page(dataset.events, pages - 1, 100), export
+
+
+def differences(local, remote):
+    """Keys of the results that differ."""
+    found = []
+    for key, expected in local.items():
+        try:
+            if isinstance(expected, pd.DataFrame):
+                pd.testing.assert_frame_equal(expected, remote[key])
+            elif expected != remote[key]:
+                found.append(key)
+        except AssertionError:
+            found.append(key)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--contacts", type=int, default=50_000)
+    parser.add_argument("--selections", type=int, default=20)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--address", help="host:port (default: a temporary Unix socket)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        synthetic.write_dataset(data_dir, args.events, contacts_count=args.contacts)
+        refresher = Refresher(lambda: pipeline.load_version(data_dir), [], interval=0)
+        dataset, lookups, engine = refresher.current.value
+        address = args.address or "unix:" + os.path.join(data_dir, "data.sock")
+        data_server = server.make_server(address, server.DataService(refresher))
+        threading.Thread(target=data_server.serve_forever, daemon=True).start()
+
+        client = server.DataClient(address)
+        remote_dataset, remote_lookups, remote_engine = client.current.value
+        selections = random_selections(dataset.events, args.selections)
+        report = {"events": args.events, "selections": len(selections), "address": address}
+
+        failures = []
+        if remote_lookups.options != lookups.options or any(
+            list(remote_lookups.names[column]) != list(names) for column, names in lookups.names.items()
+        ):
+            failures.append("lookups")
+        if not remote_dataset.events.equals(dataset.events.iloc[-1:]) or not remote_dataset.memory.equals(dataset.memory):
+            failures.append("dataset")
+        for number, selection in enumerate(selections):
+            local = tables(dataset, engine, selection)
+            local_ms = 1000 * timed(tables, dataset, engine, selection)[1]
+            remote_ms = {}
+            remote_ms["first"] = 1000 * timed(tables, remote_dataset, remote_engine, selection)[1]
+            remote = tables(remote_dataset, remote_engine, selection)
+            remote_ms["repeated"] = 1000 * timed(tables, remote_dataset, remote_engine, selection)[1]
+            failures += [f"selection {number}: {key}" for key in differences(local, remote)]
+            for name, value in (("local_ms", local_ms), *((f"remote_{kind}_ms", ms) for kind, ms in remote_ms.items())):
+                report[name] = report.get(name, 0) + value / len(selections)
+
+            export_path = os.path.join(data_dir, "export.csv")
+            local = explorer_tables(dataset, explorer.FilteredEvents(dataset.events, selection), export_path)
+            remote = explorer_tables(remote_dataset, client.filtered_events(selection), export_path)
+            failures += [f"selection {number}: explorer {key}" for key in differences(dict(enumerate(local)), dict(enumerate(remote)))]
+        report.update({name: round(value, 2) for name, value in report.items() if name.endswith("_ms")})
+        header, frames = client.request("aggregate", selections[0])
+        report["aggregate_kb"] = round(sum(frame.memory_usage(deep=True).sum() for frame in frames) / 1024, 1)
+
+        # Plusieurs répliques à la fois : chaque thread a sa connexion
+        report["concurrent"] = {}
+        for clients in args.clients:
+            data_server.service.cache.clear()
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(clients) as executor:
+                list(executor.map(lambda selection: remote_engine.aggregate(selection), selections * clients))
+            seconds = time.perf_counter() - start
+            report["concurrent"][clients] = {"requests_per_s": round(len(selections) * clients / seconds, 1)}
+        data_server.shutdown()
+        data_server.server_close()
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        sys.exit("results differ from the local ones:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
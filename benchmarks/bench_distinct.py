@@ -0,0 +1,101 @@
+"""Accuracy and speed of the HyperLogLog distinct counts against exact `nunique`.
+
+For random sidebar selections (without a user filter, which the sketches do
+not support) over a synthetic main frame, computes the distinct contacts and
+users in total, per day, per month and per organization twice: exactly
+with `nunique` over the filtered events, and from the sketches of
+`dashboard.sketch`. Reports the time of both, the relative error of the
+estimates (mean, 99th percentile and max, over groups of at least
+`--min-exact` distinct values), and the build time and size of the sketches::
+
+    python -m benchmarks.bench_distinct --rows 5000000 --contacts 500000
+
+Fails if the mean error exceeds `--max-mean-error`.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_query_engines import main_df, random_selections
+from benchmarks.common import timed
+from dashboard import sketch
+
+GROUPINGS = [None, "D", "M", "organization_id"]
+
+
+def exact_distinct(df, selection, column, by):
+    """`CodedSketches.distinct` computed exactly over the events."""
+    days = df["creation_date"].dt.floor("D")
+    rows = df[
+        (days >= pd.Timestamp(selection.start_date)) & (days <= pd.Timestamp(selection.end_date))
+        & df["type_id"].isin(selection.type_ids)
+    ]
+    if selection.org_ids:
+        rows = rows[rows["organization_id"].isin(selection.org_ids)]
+    if by is None:
+        return rows[column].nunique()
+    keys = {"D": days.loc[rows.index].dt.date, "M": rows["creation_date"].dt.to_period("M")}.get(by, rows.get(by))
+    return rows.groupby(keys, observed=True)[column].nunique()
+
+
+def errors(estimated, exact, by, min_exact):
+    """Relative errors of the estimates, for exact counts of at least `min_exact`."""
+    if by is None:
+        pairs = [(estimated, exact)]
+    else:
+        estimated = estimated.set_index("creation_date" if by in ("D", "M") else by)["count"]
+        pairs = list(zip(estimated.reindex(exact.index).fillna(0), exact))
+    return [abs(estimate - value) / value for estimate, value in pairs if value >= min_exact]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--contacts", type=int, default=200_000)
+    parser.add_argument("--selections", type=int, default=20)
+    parser.add_argument("--min-exact", type=int, default=100)
+    parser.add_argument("--max-mean-error", type=float, default=0.03)
+    args = parser.parse_args()
+
+    df = main_df(args.rows, args.contacts)
+    selections = [selection._replace(user_ids=()) for selection in random_selections(df, args.selections)]
+
+    report = {"rows": args.rows, "selections": len(selections), "metrics": {}}
+    for column in sketch.METRICS:
+        frame, build_seconds = timed(sketch.build_sketches, df, column)
+        coded = sketch.CodedSketches(frame)
+        metric = {"build_ms": round(1000 * build_seconds), "sketch_rows": len(coded), "sketch_mb": round(coded.nbytes / 2**20, 1)}
+        for by in GROUPINGS:
+            exact_seconds = sketch_seconds = 0.0
+            relative_errors = []
+            for selection in selections:
+                exact, seconds = timed(exact_distinct, df, selection, column, by)
+                exact_seconds += seconds
+                estimated, seconds = timed(coded.distinct, selection, by)
+                sketch_seconds += seconds
+                relative_errors += errors(estimated, exact, by, args.min_exact)
+            metric[by or "total"] = {
+                "exact_ms": round(1000 * exact_seconds / len(selections), 2),
+                "sketch_ms": round(1000 * sketch_seconds / len(selections), 2),
+                "groups": len(relative_errors),
+                "mean_error": round(float(np.mean(relative_errors)), 4) if relative_errors else None,
+                "p99_error": round(float(np.percentile(relative_errors, 99)), 4) if relative_errors else None,
+                "max_error": round(float(np.max(relative_errors)), 4) if relative_errors else None,
+            }
+        report["metrics"][column] = metric
+    print(json.dumps(report, indent=2))
+
+    failures = [
+        f"{column} {by}: mean error {result['mean_error']}"
+        for column, metric in report["metrics"].items() for by, result in metric.items()
+        if isinstance(result, dict) and (result["mean_error"] or 0) > args.max_mean_error
+    ]
+    if failures:
+        sys.exit("distinct count errors:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Latency and memory of the event explorer for small and huge selections.
+
+Over a synthetic main frame, builds the `FilteredEvents` of a selection
+matching a few rows (one user over a month) and of one matching every
+event, then reads the first, middle and last pages and exports the matches
+as CSV and Parquet. Reports the time of each step, the size of the filter
+result and the resident memory growth of each step, which should not grow
+with the number of matching rows beyond the chunk size of the export::
+
+    python -m benchmarks.bench_explorer --rows 5000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_query_engines import main_df
+from benchmarks.common import peak_rss_mb, rss_mb
+from benchmarks.synthetic import TYPE_IDS
+from dashboard import explorer
+from dashboard.query import ConsumptionQuery
+
+
+def measured(func):
+    """Result, ms and resident MB gained while running `func`."""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    result = func()
+    ms = 1000 * (time.perf_counter() - start)
+    return result, round(ms, 2), round(rss_mb() - rss_before, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--page-rows", type=int, default=100)
+    args = parser.parse_args()
+
+    df = main_df(args.rows, args.contacts)
+    first, last = df["creation_date"].min(), df["creation_date"].max()
+    selections = {
+        "small": ConsumptionQuery(last - pd.Timedelta(days=31), last, [1], None, [int(df["user_id"].iloc[-1])]),
+        "all": ConsumptionQuery(first, last, TYPE_IDS),
+    }
+
+    report = {"rows": args.rows, "selections": {}}
+    with tempfile.TemporaryDirectory() as export_dir:
+        for name, selection in selections.items():
+            filtered, ms, mb = measured(lambda: explorer.FilteredEvents(df, selection))
+            result = {"matches": len(filtered), "filter_kb": round(filtered.nbytes / 1024, 1), "filter": {"ms": ms, "rss_delta_mb": mb}}
+            pages = max(1, -(-len(filtered) // args.page_rows))
+            for label, number in (("first_page", 0), ("middle_page", pages // 2), ("last_page", pages - 1)):
+                _, ms, mb = measured(lambda: filtered.page(df, number, args.page_rows))
+                result[label] = {"ms": ms, "rss_delta_mb": mb}
+            for export_format, (extension, _) in explorer.EXPORT_FORMATS.items():
+                path = os.path.join(export_dir, f"{name}.{extension}")
+                _, ms, mb = measured(lambda: explorer.write_export(df, filtered, path, export_format))
+                result[f"export_{extension}"] = {"ms": ms, "rss_delta_mb": mb, "file_mb": round(os.path.getsize(path) / 2**20, 1)}
+            report["selections"][name] = result
+    report["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
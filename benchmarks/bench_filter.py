@@ -0,0 +1,52 @@
+"""Latency of the sidebar filter as the history grows.
+
+Times `CodedCube.positions` (posting lists) against the boolean `isin`
+masks of `rollup.select` for narrow selections over the whole history:
+one organization, one user, and the default type-only view. With posting
+lists the narrow cases cost in proportion to the matching events, not to
+the table size. Both must select the same rows::
+
+    python -m benchmarks.bench_filter --rows 1000000 4000000
+"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.common import timed
+from dashboard.aggregate import CodedCube
+from dashboard.query import normalize_selection
+from dashboard.rollup import DIMENSIONS, build_cube, select
+
+REPEAT = 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 4_000_000])
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        # Dimensions constantes : seules les colonnes de filtre comptent ici
+        cube = build_cube(synthetic.consumption_histories(rows).assign(**dict.fromkeys(DIMENSIONS, 0)))
+        coded_cube = CodedCube(cube)
+        first, last = cube["creation_date"].iloc[0], cube["creation_date"].iloc[-1]
+        selections = {
+            "one_organization": normalize_selection(first, last, synthetic.TYPE_IDS, [7]),
+            "one_user": normalize_selection(first, last, synthetic.TYPE_IDS, None, [42]),
+            "type_only": normalize_selection(first, last, [1]),
+        }
+        for name, selection in selections.items():
+            expected, mask_seconds = timed(select, cube, selection, repeat=REPEAT)
+            positions, posting_seconds = timed(coded_cube.positions, selection, repeat=REPEAT)
+            assert np.array_equal(expected.index.to_numpy(), positions), name
+            results.append({"rows": rows, "selection": name, "matching": len(positions),
+                            "isin_ms": round(1000 * mask_seconds, 2), "posting_ms": round(1000 * posting_seconds, 2)})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
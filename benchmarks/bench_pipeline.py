@@ -0,0 +1,188 @@
+"""Wall time, peak RSS and throughput of the whole pipeline at several scales.
+
+For each number of events, writes the ten synthetic exports (or reuses
+`--data-dir`), then runs the pipeline in a fresh interpreter with the
+stage recorder of `dashboard.timing` active: every loader, the
+construction of the main frame (reads, tag flattening, merges,
+compaction), the cube, and for random sidebar selections the filter, the
+aggregation pass and each chart table. Stages are summed per name and
+reported with their throughput; the report is JSON, tagged with the
+commit, to compare across commits::
+
+    python -m benchmarks.bench_pipeline --events 1000000 10000000 50000000 --output pipeline.json
+    python -m benchmarks.bench_pipeline --events 1000000 --baseline pipeline.json
+
+With `--snapshot`, the Parquet snapshots are built first and read instead
+of the CSVs (next to the CSVs of `--data-dir`, as `python -m dashboard
+ingest` does). With `--baseline`, the run fails if a stage got more than
+`--max-slowdown` times slower than in the baseline report at the same scale.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import regressions
+
+LOADERS = [
+    "load_consumption", "load_contacts", "load_companies", "load_company_sectors", "load_organizations",
+    "load_users", "load_job_types", "load_companies_workforce", "load_companies_sales", "load_company_sectors_classes",
+]
+
+
+def stage_key(record):
+    """Name a stage is summed under: its parent stage, its name, and the file,
+    chart or panel it is about."""
+    details = [str(record[field]) for field in ("file", "chart", "panel") if record.get(field) is not None]
+    name = " ".join([record["stage"]] + details)
+    return f"{record['parent']} > {name}" if record.get("parent") else name
+
+
+def summarize(records):
+    stages = {}
+    for record in records:
+        stage = stages.setdefault(stage_key(record), {"calls": 0, "ms": 0.0, "rows": 0, "rss_delta_mb": 0.0})
+        stage["calls"] += 1
+        stage["ms"] += record["ms"]
+        stage["rows"] += record.get("rows") or 0
+        stage["rss_delta_mb"] += record.get("rss_delta_mb") or 0.0
+    for stage in stages.values():
+        stage["ms"] = round(stage["ms"], 2)
+        stage["rss_delta_mb"] = round(stage["rss_delta_mb"], 1)
+        stage["rows_per_s"] = round(1000 * stage["rows"] / stage["ms"]) if stage["rows"] and stage["ms"] else None
+    return stages
+
+
+def run_pipeline(data_dir, selections):
+    from benchmarks.bench_query_engines import random_selections
+    from benchmarks.common import peak_rss_mb
+    from dashboard import loaders, pipeline
+    from dashboard.aggregate import BREAKDOWN_COLUMNS
+    from dashboard.lookups import LookupRegistry
+    from dashboard.timing import Recorder, stage
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with recorder.activate():
+        for name in LOADERS:
+            with stage(name) as record:
+                record["rows"] = len(getattr(loaders, name)(data_dir))
+
+        # Comme `load_format_main_df` de l'application
+        with stage("load_format_main_df") as record:
+            df, _ = pipeline.load_main_df(data_dir)
+            record["rows"] = len(df)
+        with stage("load_lookups"):
+            lookups = LookupRegistry.load(data_dir)
+        coded_cube = pipeline.code_cube(df)
+
+        for selection in random_selections(df, selections):
+            aggregates = selection.run(coded_cube)
+            for freq in ("D", "M"):
+                with stage("chart", chart=f"timeline {freq}") as record:
+                    record["rows"] = len(aggregates.timeline(freq))
+            for column in BREAKDOWN_COLUMNS:
+                with stage("chart", chart=column) as record:
+                    record["rows"] = len(aggregates.breakdown(column, lookups.names.get(column)))
+
+    return {
+        "events": len(df),
+        "cube_rows": len(coded_cube.counts),
+        "selections": selections,
+        "seconds": round(time.perf_counter() - start, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": summarize(recorder.records),
+    }
+
+
+def run_child(data_dir, selections):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_pipeline", "--child", "--data-dir", data_dir,
+         "--selections", str(selections)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def write_inputs(data_dir, events, args):
+    from benchmarks import synthetic
+    from dashboard import snapshot
+
+    synthetic.write_dataset(
+        data_dir, events, contacts_count=args.contacts, companies_count=args.companies,
+        organizations=args.organizations, users_count=args.users,
+    )
+    if args.snapshot:
+        snapshot.ingest(data_dir)
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_ms(report):
+    """{"<events> events, <stage>": ms} of every run of a report, for `regressions`."""
+    return {f"{run['events']:,} events, {name}": stage["ms"] for run in report["runs"] for name, stage in run["stages"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--contacts", type=int, default=200_000)
+    parser.add_argument("--companies", type=int, default=50_000)
+    parser.add_argument("--organizations", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--selections", type=int, default=20)
+    parser.add_argument("--snapshot", action="store_true", help="read Parquet snapshots instead of the CSVs")
+    parser.add_argument("--data-dir", help="existing exports to use instead of synthetic ones (one scale)")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=2.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_pipeline(args.data_dir, args.selections)))
+        return
+
+    runs = []
+    if args.data_dir:
+        if args.snapshot:
+            from dashboard import snapshot
+
+            snapshot.ingest(args.data_dir)
+        runs.append(run_child(args.data_dir, args.selections))
+    else:
+        for events in args.events:
+            with tempfile.TemporaryDirectory() as data_dir:
+                write_inputs(data_dir, events, args)
+                runs.append(run_child(data_dir, args.selections))
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "snapshot": args.snapshot,
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            # Plancher de 10 ms : les petites étapes varient surtout avec le bruit de mesure
+            failures = regressions(stage_ms(report), stage_ms(json.load(baseline)), args.max_slowdown, floor=10.0)
+        if failures:
+            sys.exit("pipeline regressions:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compares the chart query engines.
+
+Builds the main frame from synthetic inputs, answers the same random
+sidebar selections with the per-chart pandas functions of
+`dashboard.rollup`, `CodedCube` and `DuckDBEngine`, checks that every
+timeline and breakdown table is identical and reports the time per
+selection::
+
+    python -m benchmarks.bench_query_engines --rows 2000000 --selections 50
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.common import timed
+from dashboard.aggregate import BREAKDOWN_COLUMNS, CodedCube
+from dashboard.duckdb_engine import DuckDBEngine
+from dashboard.enrich import build_main_df
+from dashboard.query import ConsumptionQuery, sort_by_date
+from dashboard.rollup import breakdown, build_cube, select, timeline
+from dashboard.schema import compact_main_df
+
+
+def main_df(rows, contacts):
+    """The compacted main frame of synthetic inputs, sorted by date."""
+    df = build_main_df(
+        synthetic.consumption_histories(rows, contacts=contacts),
+        synthetic.contacts(contacts),
+        synthetic.companies(20_000),
+        synthetic.company_sectors(),
+    )
+    return sort_by_date(compact_main_df(df))
+
+
+def random_selections(df, count, seed=0):
+    """Selections like the sidebar produces: a period, types and sometimes orgs or users."""
+    rng = np.random.default_rng(seed)
+    first, last = df["creation_date"].min(), df["creation_date"].max()
+    selections = [ConsumptionQuery(last - pd.Timedelta(days=31), last, [1])]
+    while len(selections) < count:
+        start = first + (last - first) * rng.random()
+        end = start + pd.Timedelta(days=int(rng.integers(0, 400)))
+        types = rng.choice(synthetic.TYPE_IDS, int(rng.integers(0, 4)), replace=False)
+        orgs = rng.choice(df["organization_id"].unique(), int(rng.integers(0, 3)) * int(rng.random() < 0.5))
+        users = rng.choice(df["user_id"].unique(), int(rng.integers(0, 3)) * int(rng.random() < 0.3))
+        selections.append(ConsumptionQuery(start, end, types, orgs, users))
+    return selections
+
+
+def reference_tables(cube, selection):
+    rows = select(cube, selection)
+    tables = {("timeline", freq): timeline(rows, freq) for freq in ("D", "M")}
+    tables.update({("breakdown", column): breakdown(rows, column) for column in BREAKDOWN_COLUMNS})
+    return tables
+
+
+def engine_tables(engine, selection):
+    aggregates = engine.aggregate(selection)
+    tables = {("timeline", freq): aggregates.timeline(freq) for freq in ("D", "M")}
+    tables.update({("breakdown", column): aggregates.breakdown(column) for column in BREAKDOWN_COLUMNS})
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--selections", type=int, default=30)
+    args = parser.parse_args()
+
+    df = main_df(args.rows, args.contacts)
+    cube, cube_seconds = timed(build_cube, df)
+    coded_cube, coded_seconds = timed(CodedCube, cube)
+    duckdb_engine, duckdb_seconds = timed(DuckDBEngine, df)
+    engines = {
+        "pandas": (reference_tables, cube, cube_seconds),
+        "cube": (engine_tables, coded_cube, cube_seconds + coded_seconds),
+        "duckdb": (engine_tables, duckdb_engine, duckdb_seconds),
+    }
+
+    selections = random_selections(df, args.selections)
+    seconds = dict.fromkeys(engines, 0.0)
+    for selection in selections:
+        results = {}
+        for name, (tables, engine, _) in engines.items():
+            results[name], elapsed = timed(tables, engine, selection)
+            seconds[name] += elapsed
+        for name in ("cube", "duckdb"):
+            for key, table in results["pandas"].items():
+                pd.testing.assert_frame_equal(table, results[name][key], obj=f"{name} {key} for {selection}")
+
+    print(json.dumps({
+        "rows": args.rows,
+        "cube_rows": len(cube),
+        "selections": len(selections),
+        "identical": True,
+        "engines": {
+            name: {"setup_seconds": round(setup, 3), "ms_per_selection": round(1000 * seconds[name] / len(selections), 1)}
+            for name, (_, _, setup) in engines.items()
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
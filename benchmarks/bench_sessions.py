@@ -0,0 +1,397 @@
+"""Load test of the dashboard: concurrent sessions against a real Streamlit server.
+
+Starts `streamlit run app.py` headless in a temporary directory, with
+`no_security = 1`, every chart panel open and the `--secret` values in its
+secrets, on the exports of `--data-dir` or on synthetic exports of
+`--events` events. Then, for each count of `--sessions`, opens that many
+websocket sessions at once, as browsers do. Each one loads the page and
+replays `--interactions` random sidebar interactions:
+
+- period changes;
+- type, organization and user selections;
+- "Jour" / "Mois" and "Mesure" switches, which rerun only their panel.
+
+A session waits about `--think-ms` between interactions. Reports as JSON,
+per session count:
+
+- p50/p95/p99/max rerun latency, overall and per interaction;
+- reruns per second and failed reruns;
+- resident memory of the server (and of any `--pid`, such as a data
+  server): at the start, at the peak and at the end.
+
+For example::
+
+    python -m benchmarks.bench_sessions --events 1000000 --sessions 1 4 16 --output sessions.json
+    python -m benchmarks.bench_sessions --sessions 8 --secret data_server=127.0.0.1:8765 --pid 1234
+
+With `--baseline`, fails if the p95 latency of a session count got more than
+`--max-slowdown` times slower, or its peak memory more than
+`--max-memory-growth` times larger, than in a previous report.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import streamlit
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+from benchmarks import synthetic
+from benchmarks.bench_pipeline import commit
+from benchmarks.common import process_rss_mb, regressions
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PANELS = [
+    "timeline", "user_champions", "organization_champions", "job_types", "hierarchical",
+    "workforce", "company_sales", "meta_sectors", "sectors",
+]
+# Interactions rejouées et leur poids : surtout la période et les organisations
+INTERACTIONS = {"period": 3, "types": 1, "organizations": 3, "users": 1, "granularity": 2, "metric": 1}
+PERIOD_DAYS = [7, 31, 90, 365, 730]
+DATE_FORMAT = "%Y/%m/%d"
+FINISHED = {ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY}
+
+
+class Session:
+    """A browser tab: a websocket session rerunning the app with its own widget values."""
+
+    def __init__(self, url, rng, timeout):
+        self.url = url
+        self.rng = rng
+        self.timeout = timeout
+        self.widgets = {}  # clé, ou libellé sans clé -> (proto du widget, fragment)
+        self.states = {}  # id -> WidgetState envoyé à chaque exécution
+        self.exceptions = []
+        self._messages = {}  # Messages reçus par hash : le serveur n'en renvoie ensuite que la référence
+        self._connection = None
+
+    async def connect(self):
+        self._connection = await websocket_connect(self.url, subprotocols=["streamlit"])
+
+    def close(self):
+        self._connection.close()
+
+    async def rerun(self, fragment_id=""):
+        """Seconds until the server finished the run, and whether it succeeded without an exception."""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.fragment_id = fragment_id
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        if not fragment_id:
+            self.widgets = {}
+        exceptions = len(self.exceptions)
+        start = time.perf_counter()
+        await self._connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            data = await asyncio.wait_for(self._connection.read_message(), self.timeout)
+            if data is None:
+                raise ConnectionError("session closed by the server")
+            message = ForwardMsg.FromString(data)
+            if message.ref_hash:
+                message = self._messages[message.ref_hash]
+            elif message.hash:
+                self._messages[message.hash] = message
+            kind = message.WhichOneof("type")
+            if kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                self._element(message.delta.new_element, message.delta.fragment_id)
+            elif kind == "script_finished":
+                seconds = time.perf_counter() - start
+                return seconds, message.script_finished in FINISHED and len(self.exceptions) == exceptions
+
+    def _element(self, element, fragment_id):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.exceptions.append(element.exception.message)
+        elif kind in ("date_input", "multiselect", "selectbox"):
+            widget = getattr(element, kind)
+            # Identifiant "$$ID-<hash>-<clé>" : la clé distingue les deux sélecteurs "Mesure"
+            key = widget.id.rsplit("-", 1)[-1]
+            self.widgets[key if key != "None" else widget.label or "/".join(widget.options)] = (widget, fragment_id)
+
+    def _set(self, name, **value):
+        widget, fragment_id = self.widgets[name]
+        state = WidgetState(id=widget.id)
+        (field, data), = value.items()
+        if field == "int_value":
+            state.int_value = data
+        else:
+            # Liste éventuellement vide : le champ doit être marqué présent
+            getattr(state, field).SetInParent()
+            getattr(state, field).data[:] = data
+        self.states[widget.id] = state
+        return fragment_id
+
+    def _value(self, name):
+        widget, _ = self.widgets[name]
+        state = self.states.get(widget.id)
+        return widget.default if state is None else getattr(state, state.WhichOneof("value"))
+
+    def _sample(self, name, counts):
+        options = self.widgets[name][0].options
+        return self.rng.sample(range(len(options)), min(self.rng.choice(counts), len(options)))
+
+    def interact(self):
+        """Changes one widget value at random: (interaction, fragment to rerun, "" for the page)."""
+        available = {
+            "period": "Date de fin" in self.widgets,
+            "types": "Sélectionner un type" in self.widgets,
+            "organizations": "Sélectionner une ou plusieurs organisations" in self.widgets,
+            "users": "Sélectionner un ou plusieurs utilisateurs" in self.widgets,
+            "granularity": "Jour/Mois" in self.widgets,
+            "metric": "timeline_metric" in self.widgets,
+        }
+        names = [name for name in INTERACTIONS if available[name]]
+        name = self.rng.choices(names, [INTERACTIONS[name] for name in names])[0]
+        if name == "period":
+            end = datetime.datetime.strptime(self.widgets["Date de fin"][0].default[0], DATE_FORMAT)
+            start = end - datetime.timedelta(days=self.rng.choice(PERIOD_DAYS))
+            return name, self._set("Date de début", string_array_value=[start.strftime(DATE_FORMAT)])
+        if name == "types":
+            return name, self._set("Sélectionner un type", int_array_value=self._sample("Sélectionner un type", [1, 1, 2, 3]))
+        if name == "organizations":
+            widget_name = "Sélectionner une ou plusieurs organisations"
+            return name, self._set(widget_name, int_array_value=self._sample(widget_name, [0, 1, 1, 2]))
+        if name == "users":
+            widget_name = "Sélectionner un ou plusieurs utilisateurs"
+            return name, self._set(widget_name, int_array_value=self._sample(widget_name, [0, 0, 1]))
+        if name == "granularity":
+            return name, self._set("Jour/Mois", int_value=1 - self._value("Jour/Mois"))
+        options = self.widgets["timeline_metric"][0].options
+        return name, self._set("timeline_metric", int_value=self.rng.randrange(len(options)))
+
+
+async def replay(url, interactions, think_ms, rng, timeout):
+    """(interaction, seconds, succeeded) of each run of one session: "open", then `interactions` changes."""
+    session = Session(url, rng, timeout)
+    await session.connect()
+    try:
+        seconds, ok = await session.rerun()
+        runs = [("open", seconds, ok)]
+        for _ in range(interactions):
+            await asyncio.sleep(rng.expovariate(1000 / think_ms) if think_ms else 0)
+            name, fragment_id = session.interact()
+            seconds, ok = await session.rerun(fragment_id)
+            runs.append((name, seconds, ok))
+        return runs
+    finally:
+        session.close()
+
+
+class MemorySampler(threading.Thread):
+    """Resident memory of processes, sampled every `interval` seconds while running."""
+
+    def __init__(self, pids, interval=0.1):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.samples = {name: [process_rss_mb(pid)] for name, pid in pids.items()}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            for name, pid in self.pids.items():
+                self.samples[name].append(process_rss_mb(pid))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        report = {}
+        for name, pid in self.pids.items():
+            samples = [mb for mb in self.samples[name] + [process_rss_mb(pid)] if mb is not None]
+            if samples:
+                report[name] = {"start": samples[0], "peak": max(samples), "end": samples[-1]}
+        return report
+
+
+def percentiles(seconds):
+    milliseconds = 1000 * np.asarray(seconds)
+    if not len(milliseconds):
+        return None
+    result = {f"p{q}": round(float(np.percentile(milliseconds, q)), 1) for q in (50, 95, 99)}
+    return {**result, "max": round(float(milliseconds.max()), 1), "mean": round(float(milliseconds.mean()), 1)}
+
+
+def run_level(url, sessions, args, pids):
+    """Report of `sessions` concurrent sessions."""
+    async def run_all():
+        return await asyncio.gather(*(
+            replay(url, args.interactions, args.think_ms, random.Random(args.seed + number), args.timeout)
+            for number in range(sessions)
+        ), return_exceptions=True)
+
+    sampler = MemorySampler(pids)
+    sampler.start()
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    wall = time.perf_counter() - start
+    memory = sampler.stop()
+
+    runs = [run for result in results if not isinstance(result, BaseException) for run in result]
+    aborted = [f"{type(result).__name__}: {result}" for result in results if isinstance(result, BaseException)]
+    reruns = [seconds for name, seconds, ok in runs if name != "open"]
+    by_interaction = {
+        name: {"count": sum(run[0] == name for run in runs), **percentiles([run[1] for run in runs if run[0] == name])}
+        for name in ["open", *INTERACTIONS] if any(run[0] == name for run in runs)
+    }
+    return {
+        "sessions": sessions,
+        "runs": len(runs),
+        "failed_runs": sum(not ok for _, _, ok in runs),
+        "aborted_sessions": aborted,
+        "wall_s": round(wall, 2),
+        "runs_per_s": round(len(runs) / wall, 2),
+        "rerun_ms": percentiles(reruns),
+        "by_interaction": by_interaction,
+        "rss_mb": memory,
+        "server_growth_per_session_mb": round((memory["server"]["peak"] - memory["server"]["start"]) / sessions, 1)
+        if "server" in memory else None,
+    }
+
+
+def toml_value(value):
+    return value if value.lstrip("-").isdigit() else json.dumps(value)
+
+
+def write_config(workdir, secrets):
+    config_dir = os.path.join(workdir, ".streamlit")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "secrets.toml"), "w") as secrets_file:
+        for name, value in {"no_security": "1", "open_panels": None, **secrets}.items():
+            secrets_file.write(f"{name} = {json.dumps(PANELS) if name == 'open_panels' and value is None else toml_value(value)}\n")
+    with open(os.path.join(config_dir, "config.toml"), "w") as config_file:
+        # Couleur du texte utilisée par les graphiques : sans thème configuré, elle n'est pas définie
+        config_file.write('[theme]\ntextColor = "#31333F"\n\n[server]\nfileWatcherType = "none"\n\n[logger]\nlevel = "error"\n')
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(workdir, port, log, timeout):
+    """A headless `streamlit run app.py` in `workdir`, once it answers its health check."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true", "--server.port", str(port),
+         "--server.address", "127.0.0.1", "--browser.gatherUsageStats", "false"],
+        cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise TimeoutError("streamlit did not start")
+
+
+def p95_ms(report):
+    """{"<n> sessions, p95": ms} of every session count with completed reruns, for `regressions`."""
+    return {f"{level['sessions']} sessions, p95": level["rerun_ms"]["p95"] for level in report["levels"] if level["rerun_ms"]}
+
+
+def peak_rss(report):
+    """{"<n> sessions, <process> peak RSS": MB} of every session count, for `regressions`."""
+    return {
+        f"{level['sessions']} sessions, {name} peak RSS": memory["peak"]
+        for level in report["levels"] for name, memory in level["rss_mb"].items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--interactions", type=int, default=10, help="interactions per session after the page load")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between interactions, 0 for none")
+    parser.add_argument("--events", type=int, default=200_000, help="events of the synthetic exports")
+    parser.add_argument("--contacts", type=int, default=50_000)
+    parser.add_argument("--data-dir", help="existing exports to use instead of synthetic ones")
+    parser.add_argument("--secret", action="append", default=[], metavar="NAME=VALUE", help="app secret, repeatable")
+    parser.add_argument("--pid", type=int, action="append", default=[], help="another process to measure, repeatable")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per run")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=2.0)
+    parser.add_argument("--max-memory-growth", type=float, default=1.5)
+    args = parser.parse_args()
+
+    secrets = dict(secret.split("=", 1) for secret in args.secret)
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = os.path.join(workdir, "data", "dashboard-data")
+        os.makedirs(os.path.dirname(data_dir))
+        if args.data_dir:
+            os.symlink(os.path.abspath(args.data_dir), data_dir)
+        else:
+            os.makedirs(data_dir)
+            synthetic.write_dataset(data_dir, args.events, contacts_count=args.contacts)
+        write_config(workdir, secrets)
+
+        port = free_port()
+        with open(os.path.join(workdir, "streamlit.log"), "w+") as log:
+            server = start_server(workdir, port, log, args.timeout)
+            try:
+                url = f"ws://127.0.0.1:{port}/_stcore/stream"
+                pids = {"server": server.pid, **{str(pid): pid for pid in args.pid}}
+                # Première session seule : chargement à froid des données, hors des mesures suivantes
+                startup = run_level(url, 1, argparse.Namespace(**{**vars(args), "interactions": 0}), pids)
+                levels = [run_level(url, sessions, args, pids) for sessions in args.sessions]
+            finally:
+                server.terminate()
+                server.wait()
+                log.seek(0)
+                server_log = log.read()
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "cpus": os.cpu_count(),
+        "events": None if args.data_dir else args.events,
+        "secrets": secrets,
+        "interactions": args.interactions,
+        "think_ms": args.think_ms,
+        "startup": {"open_ms": startup["by_interaction"].get("open", {}).get("max"), "rss_mb": startup["rss_mb"]},
+        "levels": levels,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+    failures = [
+        f"{level['sessions']} sessions: {level['failed_runs']} failed runs, {len(level['aborted_sessions'])} aborted sessions"
+        for level in [startup, *levels] if level["failed_runs"] or level["aborted_sessions"]
+    ]
+    if failures:
+        sys.exit("\n".join(failures) + "\n\nserver log:\n" + server_log[-2000:])
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        # Plancher de 50 ms : les petites latences varient surtout avec le bruit de mesure
+        failures = regressions(p95_ms(report), p95_ms(baseline), args.max_slowdown, floor=50.0)
+        failures += regressions(peak_rss(report), peak_rss(baseline), args.max_memory_growth, unit="MB")
+        if failures:
+            sys.exit("load test regressions:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cold-load benchmark: CSV parsing vs. Parquet snapshot.
+
+Each measurement runs in a fresh interpreter so that timings include no
+warm pandas state and peak RSS is not polluted by the previous run::
+
+    python -m benchmarks.bench_snapshot --rows 5000000
+    python -m benchmarks.bench_snapshot --csv ./data/dashboard-data/consumption_histories_prod.csv
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+USECOLS = ['id', 'contact_id', 'creation_date', 'organization_id', 'type_id', 'user_id']
+
+
+def load(mode, csv_path):
+    """Loads the consumption history like `load_data_consumption` does."""
+    import pandas as pd
+    from dashboard.snapshot import read_table
+
+    from benchmarks.common import peak_rss_mb
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "csv":
+        df = pd.read_csv(csv_path, usecols=USECOLS, parse_dates=["creation_date"])
+    else:
+        df = read_table(csv_path, usecols=USECOLS, parse_dates=["creation_date"])
+    seconds = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "rows": len(df),
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "load_rss_mb": round(peak_rss_mb() - rss_before, 1),
+    }
+
+
+def run_child(mode, csv_path):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_snapshot", "--child", mode, "--csv", csv_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", help="existing consumption_histories_prod.csv to benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic rows when --csv is not given")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=["csv", "snapshot"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(load(args.child, args.csv)))
+        return
+
+    from dashboard.snapshot import write_snapshot
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = args.csv
+        if csv_path is None:
+            from benchmarks.synthetic import write_consumption_histories
+            csv_path = os.path.join(tmp_dir, "consumption_histories_prod.csv")
+            write_consumption_histories(csv_path, args.rows)
+            write_snapshot(csv_path)
+        elif not os.path.exists(os.path.splitext(csv_path)[0] + ".parquet"):
+            sys.exit("no snapshot next to --csv, run `python -m dashboard ingest` first")
+
+        results = []
+        for mode in ("csv", "snapshot"):
+            runs = [run_child(mode, csv_path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            best["csv_mb"] = round(os.path.getsize(csv_path) / 2**20, 1)
+            results.append(best)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Cold start time of the dashboard data with sequential and parallel reads.
+
+Writes the ten synthetic exports (or reuses `--data-dir`), then for each
+worker count loads them in a fresh interpreter the way the app does on a
+cold start: the reference tables on one thread while the events, contacts,
+companies and sectors are read and joined, each group on `workers` reader
+threads. Reports the wall time of the whole load, the wall and summed time
+of the reads, the time of the slowest file and the peak RSS::
+
+    python -m benchmarks.bench_startup --events 5000000 --workers 1 8
+    python -m benchmarks.bench_startup --events 5000000 --snapshot
+
+With enough workers, the read time should approach that of the largest
+file rather than the sum of all files.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def cold_load(data_dir, workers):
+    import concurrent.futures
+    import contextvars
+
+    from benchmarks.common import peak_rss_mb
+    from dashboard import pipeline
+    from dashboard.lookups import LookupRegistry
+    from dashboard.timing import Recorder
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    # Comme l'application : tables de référence pendant le chargement des événements
+    with recorder.activate(), concurrent.futures.ThreadPoolExecutor(1) as executor:
+        lookups_future = executor.submit(contextvars.copy_context().run, LookupRegistry.load, data_dir, workers)
+        dataset = pipeline.load(data_dir, workers=workers)
+        lookups_future.result()
+    seconds = time.perf_counter() - start
+
+    loads = [record for record in recorder.records if record["stage"] == "load tables"]
+    reads = [record for record in recorder.records if record["stage"] == "read"]
+    return {
+        "workers": workers,
+        "events": len(dataset.events),
+        "seconds": round(seconds, 3),
+        "read_wall_ms": round(sum(record["ms"] for record in loads), 1),
+        "read_sum_ms": round(sum(record["ms"] for record in reads), 1),
+        "largest_file_ms": round(max(record["ms"] for record in reads), 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_child(data_dir, workers):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--data-dir", data_dir, "--workers", str(workers)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--contacts", type=int, default=200_000)
+    parser.add_argument("--companies", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--snapshot", action="store_true", help="read Parquet snapshots instead of the CSVs")
+    parser.add_argument("--data-dir", help="existing exports to use instead of synthetic ones")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(cold_load(args.data_dir, args.workers[0])))
+        return
+
+    from benchmarks import synthetic
+    from dashboard import snapshot
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        if not args.data_dir:
+            synthetic.write_dataset(data_dir, args.events, contacts_count=args.contacts, companies_count=args.companies)
+        if args.snapshot:
+            snapshot.ingest(data_dir)
+        runs = [run_child(data_dir, workers) for workers in args.workers]
+
+    print(json.dumps({"snapshot": args.snapshot, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Peak memory of the streaming load against a memory cap.
+
+Writes a synthetic consumption history larger than `--memory-cap-mb`
+(plus contacts, companies and sectors), then loads it in a fresh
+interpreter with `dashboard.streaming.load` and fails if the peak RSS
+exceeds the cap. With `--compare`, the full in-memory load (enriched
+frame, then cube) is measured too, and both cubes are checked equal.
+
+The streaming peak is bounded by one chunk plus the cube, so the default
+population is small enough for the cube to be much smaller than the
+history; with one distinct combination per event, the cube is as large
+as the history and no cap below it can hold::
+
+    python -m benchmarks.bench_streaming --rows 12000000 --memory-cap-mb 400
+    python -m benchmarks.bench_streaming --rows 1000000 --memory-cap-mb 400 --compare
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def load(mode, data_dir, chunk_rows, cube_path, window_rows=None):
+    import pandas as pd
+
+    from benchmarks.common import peak_rss_mb
+    from dashboard import loaders, streaming
+    from dashboard.enrich import build_main_df
+    from dashboard.query import sort_by_date
+    from dashboard.rollup import build_cube
+    from dashboard.schema import compact_main_df
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "streaming":
+        streamed = streaming.load(data_dir, chunk_rows=chunk_rows, window_rows=window_rows or streaming.WINDOW_ROWS)
+        rows, cube = streamed.rows, streamed.cube
+    else:
+        df = build_main_df(
+            loaders.load_consumption(data_dir),
+            loaders.load_contacts(data_dir),
+            loaders.load_companies(data_dir),
+            loaders.load_company_sectors(data_dir),
+        )
+        df = sort_by_date(compact_main_df(df))
+        rows, cube = len(df), build_cube(df)
+    seconds = time.perf_counter() - start
+    if cube_path:
+        cube.to_pickle(cube_path)
+    return {
+        "mode": mode,
+        "rows": rows,
+        "cube_rows": len(cube),
+        "seconds": round(seconds, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "interpreter_rss_mb": rss_before,
+    }
+
+
+def run_child(mode, data_dir, chunk_rows, cube_path, window_rows=None):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_streaming", "--child", mode, "--data-dir", data_dir,
+         "--chunk-rows", str(chunk_rows), "--cube-path", cube_path or "", "--window-rows", str(window_rows or 0)],
+        check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    return json.loads(output)
+
+
+def write_inputs(data_dir, args):
+    from benchmarks import synthetic
+    from dashboard import loaders
+
+    synthetic.write_consumption_histories(
+        os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE), args.rows, start=args.start, end=args.end,
+        contacts=args.contacts, organizations=args.organizations, users=args.users,
+    )
+    synthetic.contacts(args.contacts).to_csv(os.path.join(data_dir, loaders.CONTACTS_FILE), index=False)
+    synthetic.companies(args.companies).to_csv(os.path.join(data_dir, loaders.COMPANIES_FILE), index=False)
+    synthetic.company_sectors().to_csv(os.path.join(data_dir, loaders.COMPANY_SECTORS_FILE), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=12_000_000)
+    # Peu de combinaisons jour x type x organisation x utilisateur x contact : cube bien plus petit que l'historique
+    parser.add_argument("--contacts", type=int, default=20)
+    parser.add_argument("--organizations", type=int, default=2)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--companies", type=int, default=20_000)
+    parser.add_argument("--start", default="2024-01-01")
+    parser.add_argument("--end", default="2025-01-01")
+    parser.add_argument("--chunk-rows", type=int, default=250_000)
+    parser.add_argument("--window-rows", type=int, help="rows of the preview window (default: streaming.WINDOW_ROWS)")
+    parser.add_argument("--memory-cap-mb", type=float, default=400)
+    parser.add_argument("--compare", action="store_true", help="also measure the full in-memory load")
+    parser.add_argument("--child", choices=["streaming", "full"], help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--cube-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(load(args.child, args.data_dir, args.chunk_rows, args.cube_path, args.window_rows)))
+        return
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_inputs(data_dir, args)
+        csv_mb = os.path.getsize(os.path.join(data_dir, "consumption_histories_prod.csv")) / 2**20
+
+        modes = ["streaming", "full"] if args.compare else ["streaming"]
+        results = {mode: run_child(mode, data_dir, args.chunk_rows, os.path.join(data_dir, f"{mode}.pkl") if args.compare else None, args.window_rows)
+                   for mode in modes}
+        if args.compare:
+            import pandas as pd
+            pd.testing.assert_frame_equal(pd.read_pickle(os.path.join(data_dir, "streaming.pkl")),
+                                          pd.read_pickle(os.path.join(data_dir, "full.pkl")))
+
+    report = {
+        "csv_mb": round(csv_mb, 1),
+        "memory_cap_mb": args.memory_cap_mb,
+        "csv_larger_than_cap": csv_mb > args.memory_cap_mb,
+        "streaming_within_cap": results["streaming"]["peak_rss_mb"] <= args.memory_cap_mb,
+        "cubes_equal": True if args.compare else None,
+        "results": list(results.values()),
+    }
+    print(json.dumps(report, indent=2))
+    if not report["streaming_within_cap"]:
+        sys.exit("streaming load exceeded the memory cap")
+
+
+if __name__ == "__main__":
+    main()
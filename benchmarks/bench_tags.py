@@ -0,0 +1,69 @@
+"""Micro-benchmark of the JSON tag flattening used by `build_main_df`.
+
+Compares `dashboard.tags` with the former per-row `apply` path on synthetic
+contacts and companies, and checks that both produce identical output::
+
+    python -m benchmarks.bench_tags --rows 1000000
+"""
+import argparse
+import json
+
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.common import timed
+from dashboard.tags import all_categories, flatten_company_tags, flatten_contact_tags
+
+
+def contacts_apply(contacts_df):
+    """The former row-by-row contact flattening."""
+    contacts_df = contacts_df.copy()
+    contacts_df['job_info'] = contacts_df['job_type_list'].apply(json.loads)
+    contacts_df['job_count'] = contacts_df['job_info'].apply(lambda x: len(x))
+    contacts_df['job_type_id'] = contacts_df['job_info'].apply(lambda x: x[0]['id'] if x else None)
+    contacts_df['tags_info'] = contacts_df['tag_list'].apply(json.loads)
+    contacts_df['tags_count'] = contacts_df['tags_info'].apply(lambda x: len(x))
+    contacts_df['hierarchical_id'] = contacts_df['tags_info'].apply(lambda x: x[0]['list'][0]['id'] if x else None)
+    contacts_df['hierarchical_name'] = contacts_df['tags_info'].apply(lambda x: x[0]['list'][0]['name'] if x else None)
+    return contacts_df[['job_type_id', 'hierarchical_name']]
+
+
+def extract_tags(json_str):
+    """The former per-company parser."""
+    try:
+        data = json.loads(json_str)
+        flattened_data = {entry["name"]: entry["list"][0]["id"] for entry in data if entry["list"]}
+        return {category: flattened_data.get(category, None) for category in all_categories}
+    except (json.JSONDecodeError, TypeError):
+        return {category: None for category in all_categories}
+
+
+def companies_apply(tag_list):
+    return tag_list.apply(extract_tags).apply(pd.Series)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    contacts_df = synthetic.contacts(args.rows)
+    companies_df = synthetic.companies(args.rows)
+
+    expected, apply_seconds = timed(contacts_apply, contacts_df)
+    result, bulk_seconds = timed(flatten_contact_tags, contacts_df)
+    pd.testing.assert_frame_equal(expected, result)
+    results = [{"input": "contacts", "rows": args.rows, "apply_seconds": round(apply_seconds, 3),
+                "bulk_seconds": round(bulk_seconds, 3), "speedup": round(apply_seconds / bulk_seconds, 1)}]
+
+    expected, apply_seconds = timed(companies_apply, companies_df["tag_list"])
+    result, bulk_seconds = timed(flatten_company_tags, companies_df["tag_list"])
+    pd.testing.assert_frame_equal(expected, result)
+    results.append({"input": "companies", "rows": args.rows, "apply_seconds": round(apply_seconds, 3),
+                    "bulk_seconds": round(bulk_seconds, 3), "speedup": round(apply_seconds / bulk_seconds, 1)})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Helpers shared by the benchmark scripts."""
+import resource
+import time
+
+
+def _proc_status_mb(field, pid="self"):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, in MB.
+
+    Reads `VmHWM` on Linux, which unlike `ru_maxrss` is not inherited from
+    the parent across `exec`.
+    """
+    peak = _proc_status_mb("VmHWM")
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return round(peak, 1)
+
+
+def rss_mb():
+    """Current resident memory of this process, in MB (Linux only, else peak)."""
+    current = _proc_status_mb("VmRSS")
+    return round(current, 1) if current is not None else peak_rss_mb()
+
+
+def process_rss_mb(pid):
+    """Current resident memory of process `pid`, in MB (Linux only, else `None`)."""
+    current = _proc_status_mb("VmRSS", pid)
+    return round(current, 1) if current is not None else None
+
+
+def timed(func, *args, repeat=1):
+    """Result of `func(*args)` and its wall time in seconds, averaged over `repeat` calls."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def regressions(values, baseline, max_ratio, floor=0.0, unit="ms"):
+    """Messages for the values more than `max_ratio` times their baseline value.
+
+    `values` and `baseline` map a name to a number; names absent from the
+    baseline are skipped. Baseline values below `floor` count as `floor`, so
+    small measures do not fail on noise.
+    """
+    failures = []
+    for name, value in values.items():
+        before = baseline.get(name)
+        if before is not None and value > max_ratio * max(before, floor):
+            failures.append(f"{name}: {before} -> {value} {unit}")
+    return failures
@@ -0,0 +1,175 @@
+"""Synthetic exports shaped like the production `*_prod.csv` files.
+
+`write_dataset` writes all ten exports; from the command line::
+
+    python -m benchmarks.synthetic ./data/dashboard-data --events 1000000
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+TYPE_IDS = [1, 3, 4, 5, 7, 8, 9]
+TYPE_WEIGHTS = [0.6, 0.1, 0.1, 0.05, 0.05, 0.05, 0.05]
+
+
+def consumption_histories(rows, contacts=100_000, organizations=1_000, users=10_000,
+                          start="2022-01-01", end="2025-01-01", first_id=1, seed=0):
+    """Returns a consumption history frame of `rows` events sorted by date."""
+    rng = np.random.default_rng(seed)
+    start_s = pd.Timestamp(start).value // 10**9
+    end_s = pd.Timestamp(end).value // 10**9
+    return pd.DataFrame({
+        "id": np.arange(first_id, first_id + rows),
+        "contact_id": rng.integers(1, contacts + 1, rows),
+        "creation_date": pd.to_datetime(np.sort(rng.integers(start_s, end_s, rows)), unit="s"),
+        "organization_id": rng.integers(1, organizations + 1, rows),
+        "type_id": rng.choice(TYPE_IDS, rows, p=TYPE_WEIGHTS),
+        "user_id": rng.integers(1, users + 1, rows),
+    })
+
+
+def write_consumption_histories(path, rows, chunk_rows=1_000_000, start="2022-01-01",
+                                end="2025-01-01", seed=0, **kwargs):
+    """Writes `rows` synthetic events to the CSV `path`, chunk by chunk.
+
+    Each chunk covers its own slice of the period so the file stays sorted
+    by `creation_date` without holding every row in memory.
+    """
+    chunks = max(1, -(-rows // chunk_rows))
+    bounds = pd.date_range(start, end, periods=chunks + 1)
+    written = 0
+    for index in range(chunks):
+        size = min(chunk_rows, rows - written)
+        chunk = consumption_histories(size, start=bounds[index], end=bounds[index + 1],
+                                      first_id=written + 1, seed=seed + index, **kwargs)
+        chunk.to_csv(path, mode="w" if index == 0 else "a", header=index == 0, index=False)
+        written += size
+
+
+HIERARCHICAL_LEVELS = ["Dirigeant", "Cadre", "Manager", "Employé", "Autre"]
+JOB_TYPES = 25
+COMPANY_TAGS = {
+    "Secteur": range(1, 80),
+    "Taille d'entreprise": range(1, 6),
+    "Tranche de CA": range(1, 12),
+    "Tranche d'effectif": range(1, 14),
+    "Structure Type": range(1, 5),
+}
+
+
+def _job_type_list(rng):
+    count = rng.choice([0, 1, 1, 1, 2, 3])
+    return json.dumps([{"id": int(job_id), "name": f"Fonction {job_id}"}
+                       for job_id in rng.integers(1, JOB_TYPES + 1, count)])
+
+
+def _contact_tag_list(rng):
+    if rng.random() < 0.15:
+        return "[]"
+    level = int(rng.integers(len(HIERARCHICAL_LEVELS)))
+    return json.dumps([{"name": "Niveau hiérarchique",
+                        "list": [{"id": level + 1, "name": HIERARCHICAL_LEVELS[level]}]}])
+
+
+def _company_tag_list(rng):
+    tags = []
+    for name, ids in COMPANY_TAGS.items():
+        if rng.random() < 0.2:
+            continue
+        tag_id = int(rng.choice(ids))
+        items = [] if rng.random() < 0.05 else [{"id": tag_id, "name": f"{name} {tag_id}"}]
+        tags.append({"name": name, "list": items})
+    return json.dumps(tags)
+
+
+def contacts(rows, companies=20_000, seed=0):
+    """Returns a contacts frame with real `tag_list`/`job_type_list` payloads."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "company_id": rng.integers(1, companies + 1, rows),
+        "tag_list": [_contact_tag_list(rng) for _ in range(rows)],
+        "job_type_list": [_job_type_list(rng) for _ in range(rows)],
+    })
+
+
+def companies(rows, seed=0, invalid_rate=0.001):
+    """Returns a companies frame whose `tag_list` holds the five categories."""
+    rng = np.random.default_rng(seed)
+    tag_lists = [_company_tag_list(rng) for _ in range(rows)]
+    for index in np.flatnonzero(rng.random(rows) < invalid_rate):
+        tag_lists[index] = None if index % 2 else "{invalid"
+    return pd.DataFrame({"id": np.arange(1, rows + 1), "tag_list": tag_lists})
+
+
+def company_sectors(classes=12, seed=0):
+    """Returns the sector lookup covering every synthetic `Secteur` id."""
+    rng = np.random.default_rng(seed)
+    ids = np.array(COMPANY_TAGS["Secteur"])
+    return pd.DataFrame({"id": ids, "name": [f"Secteur {i}" for i in ids], "class": rng.integers(1, classes + 1, len(ids))})
+
+
+def lookup(ids, prefix):
+    """Returns an `id`/`name` lookup frame such as job types or revenue brackets."""
+    return pd.DataFrame({"id": ids, "name": [f"{prefix} {i}" for i in ids]})
+
+
+def users(rows):
+    """Returns a users frame with first and last names."""
+    ids = np.arange(1, rows + 1)
+    return pd.DataFrame({"id": ids, "first_name": [f"Prénom{i}" for i in ids], "last_name": [f"Nom{i}" for i in ids]})
+
+
+def write_dataset(data_dir, events, contacts_count=100_000, companies_count=20_000, organizations=1_000,
+                  users_count=10_000, start="2022-01-01", end="2025-01-01", seed=0):
+    """Writes the ten `*_prod.csv` exports of a consistent synthetic dataset to `data_dir`.
+
+    Events reference existing contacts, organizations and users; contacts
+    and companies carry real JSON tag payloads whose ids all exist in the
+    lookup files.
+    """
+    from dashboard import loaders
+
+    def write(file_name, df):
+        df.to_csv(os.path.join(data_dir, file_name), index=False)
+
+    classes = 12
+    rng = np.random.default_rng(seed)
+    write(loaders.ORGANIZATIONS_FILE, lookup(range(1, organizations + 1), "Organisation"))
+    write(loaders.USERS_FILE, users(users_count).assign(organization_id=rng.integers(1, organizations + 1, users_count)))
+    write(loaders.JOB_TYPES_FILE, lookup(range(1, JOB_TYPES + 1), "Fonction").rename(columns={"name": "type"}))
+    write(loaders.COMPANY_SECTORS_CLASSES_FILE, lookup(range(1, classes + 1), "Classe"))
+    write(loaders.COMPANY_SECTORS_FILE, company_sectors(classes, seed=seed))
+    write(loaders.COMPANY_WORKFORCE_FILE, lookup(COMPANY_TAGS["Tranche d'effectif"], "Effectif"))
+    write(loaders.COMPANY_SALES_FILE, lookup(COMPANY_TAGS["Tranche de CA"], "CA"))
+    write(loaders.CONTACTS_FILE, contacts(contacts_count, companies=companies_count, seed=seed))
+    write(loaders.COMPANIES_FILE, companies(companies_count, seed=seed))
+    write_consumption_histories(
+        os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE), events, start=start, end=end, seed=seed,
+        contacts=contacts_count, organizations=organizations, users=users_count,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--companies", type=int, default=20_000)
+    parser.add_argument("--organizations", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--start", default="2022-01-01")
+    parser.add_argument("--end", default="2025-01-01")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    write_dataset(args.data_dir, args.events, args.contacts, args.companies, args.organizations, args.users,
+                  start=args.start, end=args.end, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Data layer of the consumption dashboard (loading, snapshots, enrichment)."""
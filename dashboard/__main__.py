@@ -0,0 +1,121 @@
+"""Command line entry point: ``python -m dashboard <command>``."""
+import argparse
+import functools
+import json
+import logging
+import time
+
+from dashboard import fact_table, pipeline, server, snapshot
+from dashboard.aggregate import BREAKDOWN_COLUMNS, fill_periods
+from dashboard.loaders import DATA_DIR
+from dashboard.lookups import LookupRegistry
+from dashboard.query import ConsumptionQuery
+from dashboard.refresh import Refresher
+
+
+def ingest(args):
+    start = time.perf_counter()
+    written = snapshot.ingest(args.data_dir, force=args.force)
+    for path in written:
+        print(f"snapshot écrit : {path}")
+    print(f"{len(written)} snapshot(s) en {time.perf_counter() - start:.1f}s")
+
+
+def build(args):
+    if not args.force and fact_table.is_fresh(args.data_dir):
+        print("table de faits à jour, rien à faire")
+        return
+    if args.incremental and not args.force:
+        manifest = fact_table.append(args.data_dir)
+        if manifest["operation"] == "append":
+            print(f"{manifest['appended_rows']} lignes ajoutées en {manifest['append_seconds']}s ({manifest['rows']} au total)")
+            return
+    else:
+        manifest = fact_table.build(args.data_dir)
+    print(f"{manifest['rows']} lignes en {manifest['build_seconds']}s -> {fact_table.fact_table_dir(args.data_dir)}")
+
+
+def query(args):
+    dataset = pipeline.load_from_fact_table(args.data_dir) if args.fact_table else pipeline.load(args.data_dir)
+    if dataset is None:
+        raise SystemExit("table de faits absente : lancer `python -m dashboard build`")
+    default_start, default_end = pipeline.default_period(dataset.events)
+    consumption_query = ConsumptionQuery(args.start or default_start, args.end or default_end, args.types, args.orgs, args.users)
+    aggregates = consumption_query.run(dataset.engine)
+    names = LookupRegistry.load(args.data_dir).names
+    tables = {"timeline": aggregates.period_timeline(args.freq, consumption_query.start_date, consumption_query.end_date)}
+    tables.update({column: aggregates.breakdown(column, names.get(column)) for column in BREAKDOWN_COLUMNS})
+    # Mesures distinctes estimées : les sketches ne filtrent pas par utilisateur
+    if not consumption_query.user_ids:
+        for column, sketches in dataset.sketches.items():
+            distinct = sketches.distinct(consumption_query, args.freq)
+            tables[f"{column} distinct"] = fill_periods(distinct, args.freq, consumption_query.start_date, consumption_query.end_date)
+            tables[f"{column} distinct by organization_id"] = sketches.distinct(consumption_query, "organization_id")
+    print(json.dumps({name: table.astype({"creation_date": str} if "creation_date" in table else {}).to_dict("records")
+                      for name, table in tables.items()}, ensure_ascii=False, indent=2, default=int))
+
+
+def serve(args):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    build = functools.partial(
+        pipeline.load_version, args.data_dir, args.source, args.query_engine, args.workers, args.duckdb_threads,
+    )
+    refresher = Refresher(build, pipeline.watched_paths(args.data_dir, args.source), interval=args.refresh_interval)
+    version = refresher.current
+    print(f"version {version.number} construite en {version.seconds}s")
+    if args.refresh_interval:
+        refresher.start()
+    service = server.DataService(refresher, cache_max_bytes=args.cache_max_mb * 2**20)
+    with server.make_server(args.address, service) as data_server:
+        print(f"serveur de données sur {args.address}")
+        data_server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dashboard")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="convert *_prod.csv files to Parquet snapshots")
+    ingest_parser.add_argument("--data-dir", default=DATA_DIR)
+    ingest_parser.add_argument("--force", action="store_true", help="rewrite snapshots even if up to date")
+    ingest_parser.set_defaults(func=ingest)
+
+    build_parser = subparsers.add_parser("build", help="materialize the enriched fact table")
+    build_parser.add_argument("--data-dir", default=DATA_DIR)
+    build_parser.add_argument("--force", action="store_true", help="rebuild even if inputs did not change")
+    build_parser.add_argument("--incremental", action="store_true",
+                              help="only ingest events appended to the consumption CSV since the last build")
+    build_parser.set_defaults(func=build)
+
+    query_parser = subparsers.add_parser("query", help="print the chart tables of a selection as JSON")
+    query_parser.add_argument("--data-dir", default=DATA_DIR)
+    query_parser.add_argument("--fact-table", action="store_true", help="read the prebuilt fact table")
+    query_parser.add_argument("--start", help="first day (default: 31 days before the last event)")
+    query_parser.add_argument("--end", help="last day (default: day of the last event)")
+    query_parser.add_argument("--types", type=int, nargs="+", default=[1])
+    query_parser.add_argument("--orgs", type=int, nargs="*")
+    query_parser.add_argument("--users", type=int, nargs="*")
+    query_parser.add_argument("--freq", choices=["D", "M"], default="D")
+    query_parser.set_defaults(func=query)
+
+    serve_parser = subparsers.add_parser("serve", help="load the data once and answer the queries of app replicas")
+    serve_parser.add_argument("--data-dir", default=DATA_DIR)
+    serve_parser.add_argument("--address", default=server.DEFAULT_ADDRESS,
+                              help="host:port, or the path of a Unix socket (unix:path)")
+    serve_parser.add_argument("--source", choices=pipeline.SOURCES, default="events")
+    serve_parser.add_argument("--query-engine", choices=["pandas", "duckdb"], default="pandas")
+    serve_parser.add_argument("--duckdb-threads", type=int)
+    serve_parser.add_argument("--workers", type=int, help="files read concurrently at load time")
+    serve_parser.add_argument("--refresh-interval", type=float, default=60,
+                              help="seconds between checks of the exports, 0 to never reload")
+    serve_parser.add_argument("--cache-max-mb", type=int, default=server.CACHE_MAX_BYTES // 2**20)
+    serve_parser.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve" and args.source == "streaming" and args.query_engine == "duckdb":
+        parser.error("--query-engine duckdb needs every event: not available with --source streaming")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
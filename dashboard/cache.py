@@ -0,0 +1,115 @@
+"""Process-wide LRU cache of results computed from a version of the data.
+
+The app keeps the aggregates, distinct counts and explorer filters of each
+sidebar selection, and the chart payloads, in a `DataCache`; the data
+server keeps its encoded responses in one. Entries are keyed by name only:
+callers put the data version number in the name (see `refresh.Version`),
+so the results of a replaced version are never read again and leave the
+cache as least recently used. The cache is bounded in bytes and counts
+hits, misses and evictions.
+
+All sessions share the cached values. DataFrames are handed out as shallow
+copies which, with pandas copy-on-write enabled, can be modified by a caller
+without ever touching the shared data.
+"""
+import collections
+import threading
+
+import pandas as pd
+
+# Verrous de chargement partagés par tranche de noms : leur nombre ne croît pas avec celui des entrées
+LOAD_LOCK_STRIPES = 64
+
+
+def nbytes(value):
+    """Approximate memory footprint of a cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(nbytes(item) for item in value.values())
+    return int(getattr(value, "nbytes", 0))
+
+
+def _shallow_copy(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        items = [_shallow_copy(item) for item in value]
+        return type(value)(*items) if hasattr(value, "_fields") else tuple(items)
+    return value
+
+
+Entry = collections.namedtuple("Entry", ["value", "size"])
+
+
+class DataCache:
+    """Thread-safe LRU cache of computed values, bounded in bytes."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()  # name -> Entry, du moins au plus récent
+        self._lock = threading.Lock()
+        # Réentrants : un chargement peut lire une autre entrée de la même tranche
+        self._load_locks = [threading.RLock() for _ in range(LOAD_LOCK_STRIPES)]
+
+    def get(self, name, loader):
+        """Returns the value cached under `name`, calling `loader()` if there is none (or it was evicted)."""
+        value = self._lookup(name)
+        if value is not None:
+            return _shallow_copy(value)
+
+        # Un seul chargement par entrée, même si plusieurs sessions la demandent
+        with self._load_locks[hash(name) % LOAD_LOCK_STRIPES]:
+            value = self._lookup(name, count=False)
+            if value is None:
+                value = loader()
+                self._store(name, value)
+        return _shallow_copy(value)
+
+    def _lookup(self, name, count=True):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            if count:
+                self.hits += 1
+            return entry.value
+
+    def _store(self, name, value):
+        with self._lock:
+            self._entries[name] = Entry(value, nbytes(value))
+            self._entries.move_to_end(name)
+            if self.max_bytes is None:
+                return
+            while len(self._entries) > 1 and self.size() > self.max_bytes:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def size(self):
+        return sum(entry.size for entry in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters and current content of the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_mb": round(self.size() / 2**20, 1),
+                "max_mb": round(self.max_bytes / 2**20, 1) if self.max_bytes is not None else None,
+            }
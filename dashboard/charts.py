@@ -0,0 +1,139 @@
+"""Vega-Lite specs of the dashboard charts, built once and shipped with their data once.
+
+The Altair construction and validation of a chart does not depend on its
+data: `spec_template` builds it once per kind, parameters and theme colour,
+with no data attached. `payload` then adds the aggregated table as a single
+named dataset, referenced by every layer of the chart, so the bar and text
+layers share the same rows. The name is a hash of the table: payloads of
+identical tables (the same selection on another session, or a rerun) are
+served from the chart cache without serializing the data again.
+"""
+import functools
+import hashlib
+import json
+
+import altair as alt
+import pandas as pd
+import pyarrow as pa
+
+from dashboard.timing import stage
+
+AXIS = {"labelFontSize": 12, "titleFontSize": 14, "labelLimit": 300}
+COUNT_TITLE = "Nombre d'occurrences"
+# Jeu de données nommé commun à toutes les couches, remplacé par la table agrégée dans `payload`
+DATA = alt.NamedData("data")
+
+
+def data_hash(df):
+    """Hex digest of the content, columns and dtypes of `df`."""
+    digest = hashlib.md5(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(repr([(column, str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+    return digest.hexdigest()
+
+
+def arrow_bytes(df):
+    """`df` as an Arrow IPC stream, the format of Streamlit chart datasets."""
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def timeline_chart(text_color, title=COUNT_TITLE):
+    """Occurrences (or the measure `title`) per date, with the count above each bar."""
+    chart = alt.Chart(DATA).mark_bar().encode(
+        x=alt.X("creation_date:N", title="Date", sort=None),
+        y=alt.Y("count:Q", title=title),
+        tooltip=["creation_date:N", "count:Q"]
+    ).properties(
+        width=800,
+    )
+    # Décalage vertical pour placer les labels au-dessus des barres
+    text_labels = alt.Chart(DATA).mark_text(align="center", baseline="bottom", dy=-5, color=text_color).encode(
+        x=alt.X("creation_date:N", sort=None),
+        y="count:Q",
+        text=alt.Text("count:Q", format=",")
+    )
+    return alt.layer(chart, text_labels).configure_axis(labelAngle=-45)
+
+
+def bar_chart(text_color, y="name", x="count", text=None, width=None):
+    """Horizontal bars of `x` per `y`, sorted by value, with `text` at the end of
+    each bar (the formatted value of `x` by default, no labels if `False`)."""
+    chart = alt.Chart(DATA).mark_bar().encode(
+        x=alt.X(f"{x}:Q", title=COUNT_TITLE),
+        y=alt.Y(f"{y}:N", title="", sort="-x"),
+        tooltip=[f"{y}:N", f"{x}:Q"],
+    )
+    if width is not None:
+        chart = chart.properties(width=width)
+    if text is False:
+        return chart.configure_axis(**AXIS)
+    text_labels = alt.Chart(DATA).mark_text(align="left", baseline="middle", dx=5, color=text_color).encode(
+        x=alt.X(f"{x}:Q", title=COUNT_TITLE),
+        y=alt.Y(f"{y}:N", title="", sort="-x"),
+        text=f"{text}:N" if text else alt.Text(f"{x}:Q", format=","),
+    )
+    return alt.layer(chart, text_labels).configure_axis(**AXIS)
+
+
+def pie_chart(text_color, theta="count", color="name", title=None):
+    """Share of `theta` per `color`."""
+    chart = alt.Chart(DATA).mark_arc().encode(
+        theta=alt.Theta(field=theta, type="quantitative"),
+        color=alt.Color(field=color, type="nominal"),
+        tooltip=[f"{color}:N", f"{theta}:Q"]
+    ).properties(
+        width=400,
+        height=400,
+    )
+    return chart.properties(title=title) if title else chart
+
+
+CHARTS = {"timeline": timeline_chart, "bar": bar_chart, "pie": pie_chart}
+
+
+@functools.lru_cache(maxsize=64)
+def spec_template(kind, text_color, params=()):
+    """Vega-Lite dict of a chart of `kind` without data, built once per arguments."""
+    chart = CHARTS[kind](text_color, **dict(params))
+    # Pas de largeur ni hauteur par défaut : celles de Streamlit s'appliquent, comme pour st.altair_chart
+    with alt.themes.enable("none"):
+        return chart.to_dict()
+
+
+def payload(kind, df, text_color, params=(), name=None):
+    """Vega-Lite spec of a chart of `kind` over `df`, the data in one named dataset
+    (named after `data_hash(df)` unless `name` is given)."""
+    name = name or data_hash(df)
+    return dict(spec_template(kind, text_color, params), data={"name": name}, datasets={name: arrow_bytes(df)})
+
+
+def payload_size(spec):
+    """Bytes of the spec sent to the browser: the JSON plus the Arrow datasets."""
+    datasets = spec.get("datasets", {})
+    rest = {key: value for key, value in spec.items() if key != "datasets"}
+    return len(json.dumps(rest)) + sum(len(data) for data in datasets.values())
+
+
+class ChartCache:
+    """Chart payloads keyed on kind, parameters, theme colour and data hash.
+
+    The payload size and build time of each chart are recorded as a
+    "chart" timing stage.
+    """
+
+    def __init__(self, data_cache):
+        self.data_cache = data_cache
+
+    def get(self, label, kind, df, text_color, **params):
+        """Payload of the chart `label`, built by `payload` on a cache miss."""
+        params = tuple(sorted(params.items()))
+        with stage("chart", chart=label, rows=len(df)) as record:
+            name = data_hash(df)
+            spec = self.data_cache.get(
+                ("chart", kind, params, text_color, name), lambda: payload(kind, df, text_color, params, name),
+            )
+            record["kb"] = round(payload_size(spec) / 1024, 1)
+        return dict(spec)
@@ -0,0 +1,54 @@
+"""Enrichment of the consumption events with contact and company attributes."""
+import collections
+
+import pandas as pd
+
+from dashboard.tags import flatten_company_tags, flatten_contact_tags
+from dashboard.timing import stage
+
+# Fichiers dont dépend la table enrichie
+INPUT_FILES = ["consumption_histories_prod.csv", "contacts_prod.csv", "companies_prod.csv", "company_sectors_prod.csv"]
+
+Lookups = collections.namedtuple("Lookups", ["contacts", "companies", "company_sectors"])
+
+
+def prepare_lookups(contacts_df, companies_df, companies_sector_df):
+    """Flattens contact and company tags once, for one or many calls to `enrich`."""
+    # Formating contact data
+    with stage("flatten contact tags", rows=len(contacts_df)):
+        contacts_df = pd.concat([
+            contacts_df.drop(columns=['job_type_list', 'tag_list']),
+            flatten_contact_tags(contacts_df),
+        ], axis=1)
+
+    # Formating company data
+    with stage("flatten company tags", rows=len(companies_df)):
+        tags_df = flatten_company_tags(companies_df["tag_list"])
+    companies_df = pd.concat([companies_df.drop(columns=["tag_list"]), tags_df], axis=1)
+    #companies_df = pd.concat([companies_df, tags_df], axis=1) # use the below one afeter debug
+
+    return Lookups(contacts_df, companies_df, companies_sector_df[['id', 'class']])
+
+
+def build_main_df(df, contacts_df, companies_df, companies_sector_df):
+    """Joins consumption events with flattened contact and company tags."""
+    return enrich(df, prepare_lookups(contacts_df, companies_df, companies_sector_df))
+
+
+def enrich(df, lookups):
+    """Joins consumption events with lookups from `prepare_lookups`."""
+    with stage("merge contacts", rows=len(df)):
+        df = df.merge(lookups.contacts, left_on='contact_id', right_on='id', how='left')
+
+    # Fusionner avec le DataFrame original
+    with stage("merge companies", rows=len(df)):
+        df = df.merge(lookups.companies, left_on='company_id', right_on='id', how='left')
+    #df = df.drop(columns=['id_y']).rename(columns={'id_x': 'id'})
+    
+    df = df.drop(columns=['id', 'id_y']).rename(columns={'id_x': 'id'})
+
+    with stage("merge sectors", rows=len(df)):
+        df = df.merge(lookups.company_sectors, left_on='Secteur', right_on='id', how='left')
+    df = df.drop(columns=['id_y']).rename(columns={'id_x': 'id'})
+
+    return df
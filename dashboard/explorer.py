@@ -0,0 +1,103 @@
+"""Paginated access to the events of a selection, and their export in chunks.
+
+The events frame is sorted by date, so the period of a selection is a row
+range found by binary search, with the day of `end_date` included as in
+the query engines. `FilteredEvents` checks the type, organization and user
+filters on that range once, block by block, and keeps the matching rows as
+a bitmap (one bit per row of the period) with the number of matches per
+block. A page is then found by binary search on these counts and only its
+rows and columns are taken from the events, and an export walks the
+blocks in order: neither builds the filtered frame, whatever the number of
+matching rows. The filter result does not keep a reference to the events,
+so it can be cached without holding on to a replaced data version.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from dashboard.timing import stage
+
+BLOCK_ROWS = 1 << 16
+EXPORT_CHUNK_ROWS = 100_000
+# Lignes au plus d'un export téléchargé depuis l'application, qui garde le fichier fini en mémoire
+EXPORT_MAX_ROWS = 1_000_000
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"), "Parquet": ("parquet", "application/octet-stream")}
+
+
+def take(events, positions, columns=None):
+    """Rows at `positions` of `events`, of `columns` (all by default), with a fresh index."""
+    column_positions = slice(None) if columns is None else [events.columns.get_loc(column) for column in columns]
+    return events.iloc[positions, column_positions].reset_index(drop=True)
+
+
+class FilteredEvents:
+    """Positions of the rows of the date-sorted `events` matching a normalized `Selection`."""
+
+    def __init__(self, events, selection, block_rows=BLOCK_ROWS):
+        self.block_rows = block_rows
+        dates = events["creation_date"].to_numpy()
+        self.start = dates.searchsorted(np.datetime64(pd.Timestamp(selection.start_date)), side="left")
+        self.end = dates.searchsorted(np.datetime64(pd.Timestamp(selection.end_date) + pd.Timedelta(days=1)), side="left")
+
+        # Aucun type sélectionné : aucune ligne ; aucune organisation ou utilisateur : toutes
+        filters = [("type_id", selection.type_ids)]
+        filters += [(column, ids) for column, ids in (("organization_id", selection.org_ids), ("user_id", selection.user_ids)) if ids]
+        self._bits = []
+        counts = []
+        with stage("filter events", rows=self.end - self.start) as record:
+            for block_start in range(self.start, self.end, block_rows):
+                block_end = min(block_start + block_rows, self.end)
+                matches = np.ones(block_end - block_start, dtype=bool)
+                for column, ids in filters:
+                    matches &= events[column].iloc[block_start:block_end].isin(ids).to_numpy()
+                self._bits.append(np.packbits(matches))
+                counts.append(int(matches.sum()))
+            self._offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+            record["selected"] = len(self)
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    @property
+    def nbytes(self):
+        return sum(bits.nbytes for bits in self._bits) + self._offsets.nbytes
+
+    def positions(self, first, last):
+        """Row positions in `events` of the matches `first` (included) to `last` (excluded)."""
+        last = min(last, len(self))
+        parts = []
+        block = int(np.searchsorted(self._offsets, first, side="right")) - 1
+        while first < last:
+            block_start = self.start + block * self.block_rows
+            block_length = min(self.block_rows, self.end - block_start)
+            found = np.flatnonzero(np.unpackbits(self._bits[block], count=block_length))
+            taken = found[first - self._offsets[block]:last - self._offsets[block]]
+            parts.append(block_start + taken)
+            first += len(taken)
+            block += 1
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def page(self, events, number, size, columns=None):
+        """Rows of `events` (of `columns`, all by default) of the page `number` (from 0) of `size` matches."""
+        with stage("events page", rows=size):
+            return take(events, self.positions(number * size, (number + 1) * size), columns)
+
+    def chunks(self, events, columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Yields the matching rows of `events` in order, in frames of at most `chunk_rows` rows."""
+        for first in range(0, len(self), chunk_rows):
+            yield take(events, self.positions(first, first + chunk_rows), columns)
+
+
+def write_export(events, filtered, path, export_format="CSV", columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Writes the rows of `events` matched by `filtered` to `path` as CSV or Parquet, one chunk at a time.
+
+    Both formats are written by Arrow: the CSV writer is several times faster
+    than `DataFrame.to_csv`, and dates keep their nanoseconds.
+    """
+    schema = pa.Schema.from_pandas(take(events, [], columns), preserve_index=False)
+    writer_type = pa_csv.CSVWriter if export_format == "CSV" else pq.ParquetWriter
+    with stage("export events", rows=len(filtered), format=export_format), writer_type(path, schema) as writer:
+        for chunk in filtered.chunks(events, columns, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
@@ -0,0 +1,317 @@
+"""Persisted enriched fact table.
+
+`python -m dashboard build` materializes the output of `build_main_df` once
+as uncompressed Arrow IPC files, so that the dashboard only has to
+memory-map them. Every process mapping the files shares the same pages of
+the OS page cache instead of holding a private copy of the joined frame.
+The rollup cube and the distinct-count sketches are persisted alongside.
+
+A JSON manifest next to the data records the size and mtime of each input
+file; the table is stale as soon as one of them changes.
+
+`build --incremental` handles the common case where only new events were
+appended to the consumption CSV: the rows after the byte offset recorded in
+the manifest are read, enriched and written as a new data part and a new
+cube part, plus a sketch part per metric. Lookups that changed or a rewritten CSV trigger a full build,
+and parts are merged back into one once there are more than `MAX_PARTS`.
+"""
+import hashlib
+import json
+import os
+import time
+
+import pyarrow as pa
+
+from dashboard import loaders
+from dashboard.enrich import INPUT_FILES, build_main_df
+from dashboard.query import sort_by_date
+from dashboard.rollup import build_cube
+from dashboard.schema import compact_main_df, memory_report
+from dashboard.sketch import METRICS, build_sketches, merge_sketches
+from dashboard.snapshot import snapshot_path
+
+FACT_TABLE_DIR = "fact_table"
+DATA_PART = "main_df-{:05d}.arrow"
+CUBE_PART = "cube-{:05d}.arrow"
+SKETCH_PART = "sketches-{}-{:05d}.arrow"
+MANIFEST_FILE = "manifest.json"
+
+MAX_PARTS = 8
+SIGNATURE_BYTES = 64 * 1024
+
+
+def fact_table_dir(data_dir):
+    return os.path.join(data_dir, FACT_TABLE_DIR)
+
+
+def input_fingerprint(data_dir):
+    """Returns the size and mtime of every input CSV and snapshot."""
+    fingerprint = {}
+    for name in INPUT_FILES:
+        csv_path = os.path.join(data_dir, name)
+        for path in (csv_path, snapshot_path(csv_path)):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                fingerprint[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+def _lookup_fingerprint(fingerprint):
+    """The fingerprint without the consumption history, which may only grow."""
+    consumption = os.path.splitext(loaders.CONSUMPTION_HISTORIES_FILE)[0]
+    return {name: value for name, value in fingerprint.items() if not name.startswith(consumption)}
+
+
+def _csv_signature(csv_path, offset):
+    """Hashes of the first and last bytes before `offset`, to detect a rewritten CSV."""
+    with open(csv_path, "rb") as csv_file:
+        head = csv_file.read(min(offset, SIGNATURE_BYTES))
+        csv_file.seek(max(offset - SIGNATURE_BYTES, 0))
+        tail = csv_file.read(offset - csv_file.tell())
+    return [hashlib.sha1(head).hexdigest(), hashlib.sha1(tail).hexdigest()]
+
+
+def read_manifest(data_dir):
+    """Returns the manifest of the built table, or `None` if there is none."""
+    try:
+        with open(os.path.join(fact_table_dir(data_dir), MANIFEST_FILE)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def is_fresh(data_dir):
+    manifest = read_manifest(data_dir)
+    return manifest is not None and manifest["inputs"] == input_fingerprint(data_dir)
+
+
+def _write_atomic(path, write):
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_table(path, table):
+    def write(tmp_path):
+        # Non compressé : indispensable pour un memory-map sans copie
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    _write_atomic(path, write)
+
+
+def _write_manifest(data_dir, manifest):
+    def write(tmp_path):
+        with open(tmp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+    # Le manifeste est écrit en dernier : il ne référence jamais un fichier partiel
+    _write_atomic(os.path.join(fact_table_dir(data_dir), MANIFEST_FILE), write)
+
+
+def _remove_unreferenced(data_dir, manifest):
+    referenced = set(manifest["parts"]) | set(manifest["cube_parts"]) | {MANIFEST_FILE}
+    referenced.update(name for names in manifest["sketch_parts"].values() for name in names)
+    for name in os.listdir(fact_table_dir(data_dir)):
+        if name not in referenced:
+            os.remove(os.path.join(fact_table_dir(data_dir), name))
+
+
+def _consumption_state(data_dir, df, offset):
+    """What the next incremental build needs to know about the ingested history."""
+    csv_path = os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE)
+    return {
+        "offset": offset,
+        "signature": _csv_signature(csv_path, offset) if offset is not None else None,
+        "last_id": int(df["id"].max()) if len(df) else None,
+        "last_creation_date": str(df["creation_date"].max()) if len(df) else None,
+    }
+
+
+def _sketch_tables(df):
+    """{metric column: Arrow table of `build_sketches`} of `df`."""
+    return {column: pa.Table.from_pandas(build_sketches(df, column), preserve_index=False) for column in METRICS}
+
+
+def build(data_dir):
+    """Builds the enriched fact table of `data_dir` and returns its manifest."""
+    start = time.perf_counter()
+    inputs = input_fingerprint(data_dir)
+    csv_path = os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE)
+    offset = os.path.getsize(csv_path) if os.path.exists(csv_path) else None
+
+    raw_df = build_main_df(*loaders.load_tables(data_dir, ["load_consumption"] + loaders.ENRICH_LOADERS).values())
+    df = sort_by_date(compact_main_df(raw_df))
+    report = memory_report(raw_df, df)
+    del raw_df
+
+    os.makedirs(fact_table_dir(data_dir), exist_ok=True)
+    generation = (read_manifest(data_dir) or {}).get("generation", -1) + 1
+    parts = [DATA_PART.format(generation)]
+    cube_parts = [CUBE_PART.format(generation)]
+    _write_table(os.path.join(fact_table_dir(data_dir), parts[0]), pa.Table.from_pandas(df, preserve_index=False))
+    _write_table(os.path.join(fact_table_dir(data_dir), cube_parts[0]), pa.Table.from_pandas(build_cube(df), preserve_index=False))
+    sketch_parts = {}
+    for column, table in _sketch_tables(df).items():
+        sketch_parts[column] = [SKETCH_PART.format(column, generation)]
+        _write_table(os.path.join(fact_table_dir(data_dir), sketch_parts[column][0]), table)
+
+    manifest = {
+        "operation": "build",
+        "inputs": inputs,
+        "generation": generation,
+        "parts": parts,
+        "cube_parts": cube_parts,
+        "sketch_parts": sketch_parts,
+        "consumption": _consumption_state(data_dir, df, offset),
+        "rows": len(df),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "build_seconds": round(time.perf_counter() - start, 2),
+        "memory": report.reset_index(names="column").to_dict("records"),
+    }
+    _write_manifest(data_dir, manifest)
+    _remove_unreferenced(data_dir, manifest)
+    return manifest
+
+
+def _can_append(data_dir, manifest):
+    state = manifest.get("consumption") or {}
+    csv_path = os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE)
+    if state.get("offset") is None or not os.path.exists(csv_path):
+        return False
+    if _lookup_fingerprint(manifest["inputs"]) != _lookup_fingerprint(input_fingerprint(data_dir)):
+        return False
+    if os.path.getsize(csv_path) < state["offset"]:
+        return False
+    return _csv_signature(csv_path, state["offset"]) == state["signature"]
+
+
+def _read_parts(data_dir, names):
+    return [pa.ipc.open_file(pa.memory_map(os.path.join(fact_table_dir(data_dir), name))).read_all() for name in names]
+
+
+def append(data_dir):
+    """Appends the events added to the consumption CSV since the last build.
+
+    Falls back to `build` when an append is not possible. Returns the manifest.
+    """
+    manifest = read_manifest(data_dir)
+    if manifest is None or "sketch_parts" not in manifest or not _can_append(data_dir, manifest):
+        return build(data_dir)
+
+    start = time.perf_counter()
+    inputs = input_fingerprint(data_dir)
+    state = manifest["consumption"]
+    csv_path = os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE)
+    offset = os.path.getsize(csv_path)
+
+    delta_df = loaders.load_consumption_from_offset(data_dir, state["offset"], offset)
+    if state["last_id"] is not None:
+        delta_df = delta_df[delta_df["id"] > state["last_id"]]  # Lignes déjà ingérées
+    delta_df = build_main_df(delta_df, *loaders.load_tables(data_dir, loaders.ENRICH_LOADERS).values())
+    delta_df = sort_by_date(compact_main_df(delta_df))
+
+    if len(delta_df):
+        schema = _read_parts(data_dir, manifest["parts"][:1])[0].schema
+        cube_schema = _read_parts(data_dir, manifest["cube_parts"][:1])[0].schema
+        sketch_schemas = {column: _read_parts(data_dir, names[:1])[0].schema for column, names in manifest["sketch_parts"].items()}
+        try:
+            table = pa.Table.from_pandas(delta_df, preserve_index=False).select(schema.names).cast(schema)
+            cube_table = pa.Table.from_pandas(build_cube(delta_df), preserve_index=False).select(cube_schema.names).cast(cube_schema)
+            sketch_tables = {
+                column: table.select(sketch_schemas[column].names).cast(sketch_schemas[column])
+                for column, table in _sketch_tables(delta_df).items()
+            }
+        except (pa.ArrowInvalid, KeyError):
+            # Identifiants hors des types compacts de la table : reconstruction complète
+            return build(data_dir)
+
+        generation = manifest["generation"] + 1
+        manifest["parts"].append(DATA_PART.format(generation))
+        manifest["cube_parts"].append(CUBE_PART.format(generation))
+        manifest["generation"] = generation
+        _write_table(os.path.join(fact_table_dir(data_dir), manifest["parts"][-1]), table)
+        _write_table(os.path.join(fact_table_dir(data_dir), manifest["cube_parts"][-1]), cube_table)
+        for column, table in sketch_tables.items():
+            manifest["sketch_parts"][column].append(SKETCH_PART.format(column, generation))
+            _write_table(os.path.join(fact_table_dir(data_dir), manifest["sketch_parts"][column][-1]), table)
+
+    last_id, last_creation_date = state["last_id"], state["last_creation_date"]
+    manifest["consumption"] = _consumption_state(data_dir, delta_df, offset)
+    if not len(delta_df):
+        manifest["consumption"].update(last_id=last_id, last_creation_date=last_creation_date)
+    manifest["operation"] = "append"
+    manifest["inputs"] = inputs
+    manifest["rows"] += len(delta_df)
+    manifest["appended_rows"] = len(delta_df)
+    manifest["appended_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    manifest["append_seconds"] = round(time.perf_counter() - start, 2)
+    _write_manifest(data_dir, manifest)
+
+    if len(manifest["parts"]) > MAX_PARTS:
+        manifest = compact(data_dir, manifest)
+    return manifest
+
+
+def compact(data_dir, manifest):
+    """Merges the data, cube and sketch parts into one file each, without re-parsing inputs."""
+    generation = manifest["generation"] + 1
+    tables = {
+        "parts": (DATA_PART.format(generation), pa.concat_tables(_read_parts(data_dir, manifest["parts"]))),
+        "cube_parts": (CUBE_PART.format(generation), pa.concat_tables(_read_parts(data_dir, manifest["cube_parts"]))),
+    }
+    for key, (name, table) in tables.items():
+        _write_table(os.path.join(fact_table_dir(data_dir), name), table.combine_chunks())
+        manifest[key] = [name]
+    for column, names in manifest["sketch_parts"].items():
+        # Registres communs à plusieurs parties (mêmes jour, type et organisation) : rang maximal
+        parts = _read_parts(data_dir, names)
+        sketches = merge_sketches([part.to_pandas() for part in parts])
+        table = pa.Table.from_pandas(sketches, preserve_index=False).select(parts[0].schema.names).cast(parts[0].schema)
+        manifest["sketch_parts"][column] = [SKETCH_PART.format(column, generation)]
+        _write_table(os.path.join(fact_table_dir(data_dir), manifest["sketch_parts"][column][0]), table)
+    manifest["generation"] = generation
+    _write_manifest(data_dir, manifest)
+    _remove_unreferenced(data_dir, manifest)
+    return manifest
+
+
+def _load_names(data_dir, names):
+    table = pa.concat_tables(_read_parts(data_dir, names))
+    return sort_by_date(table.to_pandas(split_blocks=True))
+
+
+def _load_parts(data_dir, key):
+    manifest = read_manifest(data_dir)
+    if manifest is None or key not in manifest:
+        return None
+    return _load_names(data_dir, manifest[key])
+
+
+def load(data_dir):
+    """Memory-maps the built fact table and returns it as a DataFrame.
+
+    Returns `None` when the table has not been built. With a single part,
+    numeric columns without nulls are handed to pandas without copy
+    (`split_blocks=True`); appended parts are concatenated in memory until
+    the next compaction. Rows are sorted by date.
+    """
+    return _load_parts(data_dir, "parts")
+
+
+def load_cube(data_dir):
+    """Returns the persisted rollup cube, or `None` when the table has not been built."""
+    return _load_parts(data_dir, "cube_parts")
+
+
+def load_sketches(data_dir):
+    """Returns the persisted sketches per metric column (see `sketch.build_sketches`),
+    or `None` when the table was built without them.
+
+    Appended parts are only concatenated: `CodedSketches` keeps the highest
+    rank of a register present in several of them.
+    """
+    manifest = read_manifest(data_dir)
+    if manifest is None or "sketch_parts" not in manifest:
+        return None
+    return {column: _load_names(data_dir, names) for column, names in manifest["sketch_parts"].items()}
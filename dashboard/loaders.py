@@ -0,0 +1,149 @@
+"""Readers for the `*_prod.csv` exports (through their snapshots when fresh)."""
+import concurrent.futures
+import contextvars
+import functools
+import io
+import os
+import time
+
+import pandas as pd
+
+from dashboard.snapshot import iter_table, read_table, snapshot_path
+from dashboard.timing import stage
+
+DATA_DIR = "./data/dashboard-data/"
+
+CONSUMPTION_HISTORIES_FILE = "consumption_histories_prod.csv"
+ORGANIZATIONS_FILE = "organizations_prod.csv"
+USERS_FILE = "users_prod.csv"
+CONTACTS_FILE = "contacts_prod.csv"
+COMPANIES_FILE = "companies_prod.csv"
+JOB_TYPES_FILE = "job_types_prod.csv"
+COMPANY_SECTORS_FILE = "company_sectors_prod.csv"
+COMPANY_SECTORS_CLASSES_FILE = "company_classes_prod.csv"
+COMPANY_WORKFORCE_FILE = "workforce_prod.csv"
+COMPANY_SALES_FILE = "sales_prod.csv"
+
+CONSUMPTION_COLUMNS = ['id', 'contact_id', 'creation_date', 'organization_id', 'type_id', 'user_id']
+
+# Tables jointes aux événements par `enrich.build_main_df`, dans l'ordre de ses arguments
+ENRICH_LOADERS = ["load_contacts", "load_companies", "load_company_sectors"]
+
+# Lectures simultanées par défaut de `load_tables` : Parquet et le parseur CSV libèrent le GIL
+WORKERS = min(8, os.cpu_count() or 1)
+
+
+def source_paths(data_dir, *file_names):
+    """Files a loader may read: each CSV and its snapshot."""
+    paths = []
+    for file_name in file_names:
+        csv_path = os.path.join(data_dir, file_name)
+        paths += [csv_path, snapshot_path(csv_path)]
+    return paths
+
+
+def load_consumption(data_dir=DATA_DIR, nrows=None):
+    return read_table(
+        os.path.join(data_dir, CONSUMPTION_HISTORIES_FILE),
+        usecols=CONSUMPTION_COLUMNS,
+        parse_dates=["creation_date"],
+        nrows=nrows,
+    )
+
+
+def iter_consumption(data_dir=DATA_DIR, chunk_rows=500_000):
+    """Yields the consumption history in frames of at most `chunk_rows` rows."""
+    return iter_table(
+        os.path.join(data_dir, CONSUMPTION_HISTORIES_FILE),
+        chunk_rows,
+        usecols=CONSUMPTION_COLUMNS,
+        parse_dates=["creation_date"],
+    )
+
+
+def load_consumption_from_offset(data_dir, start, end):
+    """Reads the consumption rows stored between bytes `start` and `end` of the CSV.
+
+    `start` must be the beginning of a line; the header is taken from the
+    first line of the file.
+    """
+    with open(os.path.join(data_dir, CONSUMPTION_HISTORIES_FILE), "rb") as csv_file:
+        header = csv_file.readline()
+        csv_file.seek(start)
+        rows = csv_file.read(end - start)
+    return pd.read_csv(
+        io.BytesIO(header + rows),
+        usecols=CONSUMPTION_COLUMNS,
+        parse_dates=["creation_date"],
+    )
+
+
+def load_organizations(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, ORGANIZATIONS_FILE))
+
+
+def load_users(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, USERS_FILE))
+
+
+def load_contacts(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, CONTACTS_FILE), usecols=['id', 'company_id', 'tag_list', 'job_type_list'])
+
+
+def load_companies(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, COMPANIES_FILE), usecols=['id', 'tag_list'])
+
+
+def load_company_sectors(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, COMPANY_SECTORS_FILE))
+
+
+def load_company_sectors_classes(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, COMPANY_SECTORS_CLASSES_FILE))
+
+
+def load_job_types(data_dir=DATA_DIR):
+    job_types_df = read_table(os.path.join(data_dir, JOB_TYPES_FILE), usecols=['id', 'type'])
+    job_types_df = job_types_df.rename(columns={'type': 'name'})
+    return job_types_df
+
+
+def load_companies_workforce(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, COMPANY_WORKFORCE_FILE), usecols=['id', 'name'])
+
+
+def load_companies_sales(data_dir=DATA_DIR):
+    return read_table(os.path.join(data_dir, COMPANY_SALES_FILE), usecols=['id', 'name'])
+
+
+def load_concurrently(calls, workers=None):
+    """Runs the loaders of {name: function without arguments} on `workers`
+    threads (`WORKERS` by default, 1 to run them one after the other).
+
+    Returns {name: frame}. Recorded as a "load tables" stage, with the
+    summed time of the loaders next to the wall time: with enough workers
+    the wall time is that of the largest file.
+    """
+    workers = max(1, min(workers or WORKERS, len(calls)))
+    with stage("load tables", files=len(calls), workers=workers) as record:
+        def run(load):
+            start = time.perf_counter()
+            df = load()
+            return df, 1000 * (time.perf_counter() - start)
+
+        if workers == 1:
+            results = [run(load) for load in calls.values()]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="loader") as executor:
+                # Chaque lecture dans une copie du contexte : ses étapes restent dans la mesure en cours
+                futures = [executor.submit(contextvars.copy_context().run, run, load) for load in calls.values()]
+                results = [future.result() for future in futures]
+        if results:
+            record["sum_ms"] = round(sum(ms for _, ms in results), 2)
+            record["max_ms"] = round(max(ms for _, ms in results), 2)
+    return {name: df for name, (df, _) in zip(calls, results)}
+
+
+def load_tables(data_dir, names, workers=None):
+    """`load_concurrently` of the loaders `names` of this module, such as "load_users"."""
+    return load_concurrently({name: functools.partial(globals()[name], data_dir) for name in names}, workers)
@@ -0,0 +1,97 @@
+"""Reference tables and their display labels, built once per export.
+
+`LookupRegistry` loads the organization, user, job type, workforce,
+revenue and sector tables once and keeps only what the page needs: for
+each chart column a dense read-only id -> label array, resolved in O(1)
+per id by `label_ids`, and the option lists of the organization and user
+selectors. Nothing is concatenated or merged on a rerun.
+"""
+import numpy as np
+import pandas as pd
+
+from dashboard import loaders
+
+UNKNOWN = "Inconnu"
+
+LOOKUP_FILES = [
+    loaders.ORGANIZATIONS_FILE, loaders.USERS_FILE, loaders.JOB_TYPES_FILE, loaders.COMPANY_WORKFORCE_FILE,
+    loaders.COMPANY_SALES_FILE, loaders.COMPANY_SECTORS_CLASSES_FILE, loaders.COMPANY_SECTORS_FILE,
+]
+# Lecteurs de ces fichiers, dans l'ordre des arguments de `LookupRegistry`
+LOADERS = [
+    "load_organizations", "load_users", "load_job_types", "load_companies_workforce",
+    "load_companies_sales", "load_company_sectors_classes", "load_company_sectors",
+]
+
+
+def id_names(ids, names):
+    """Dense read-only array of `names` indexed by id, `UNKNOWN` where there is none.
+
+    The first name wins for duplicate ids, as the first match of a merge.
+    """
+    lookup = pd.DataFrame({"id": ids, "name": names}).dropna(subset=["id"])
+    lookup = lookup[lookup["id"] >= 0].drop_duplicates("id")
+    table = np.full(int(lookup["id"].max()) + 1 if len(lookup) else 0, UNKNOWN, dtype=object)
+    table[lookup["id"].to_numpy(dtype=np.int64)] = lookup["name"].fillna(UNKNOWN).to_numpy()
+    table.flags.writeable = False
+    return table
+
+
+def label_ids(ids, table):
+    """Names of `ids` from an `id_names` table, `UNKNOWN` for missing or unknown ids."""
+    ids = pd.Series(ids).to_numpy(dtype=np.float64, na_value=-1)
+    known = (ids >= 0) & (ids < len(table))
+    labels = np.full(len(ids), UNKNOWN, dtype=object)
+    labels[known] = table[ids[known].astype(np.int64)]
+    return labels
+
+
+def organization_labels(org_df):
+    return org_df["name"] + " (" + org_df["id"].astype(str) + ")"
+
+
+def user_labels(users_df):
+    return users_df["first_name"] + " " + users_df["last_name"] + " (" + users_df["id"].astype(str) + ")"
+
+
+class LookupRegistry:
+    """Display labels of every reference table, by chart column."""
+
+    def __init__(self, org_df, users_df, job_types_df, workforce_df, sales_df, sector_classes_df, sectors_df):
+        org_labels = organization_labels(org_df)
+        users_labels = user_labels(users_df)
+
+        # Options des sélecteurs : libellé -> id, dans l'ordre des fichiers
+        self.options = {
+            "organization_id": dict(zip(org_labels, org_df["id"])),
+            "user_id": dict(zip(users_labels, users_df["id"])),
+        }
+        self.names = {
+            "organization_id": id_names(org_df["id"], org_labels),
+            "user_id": id_names(users_df["id"], users_labels),
+            "job_type_id": id_names(job_types_df["id"], job_types_df["name"]),
+            "Tranche d'effectif": id_names(workforce_df["id"], workforce_df["name"]),
+            "Tranche de CA": id_names(sales_df["id"], sales_df["name"]),
+            "class": id_names(sector_classes_df["id"], sector_classes_df["name"]),
+            "Secteur": id_names(sectors_df["id"], sectors_df["name"]),
+        }
+
+    @classmethod
+    def load(cls, data_dir=loaders.DATA_DIR, workers=None):
+        """Reads the reference tables on `workers` threads (see `loaders.load_concurrently`)."""
+        return cls(*loaders.load_tables(data_dir, LOADERS, workers).values())
+
+    @classmethod
+    def from_labels(cls, options, names):
+        """Registry of already built selector `options` and `id_names` arrays, as sent by the data server."""
+        registry = cls.__new__(cls)
+        registry.options, registry.names = options, names
+        return registry
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.names.values())
+
+    def label(self, column, ids):
+        """Labels of `ids` in `column`, `UNKNOWN` for ids missing from the reference table."""
+        return label_ids(ids, self.names[column])
@@ -0,0 +1,160 @@
+"""Loading of the dashboard data, from the exports to a query engine.
+
+Each loading mode returns a `Dataset`: the event rows shown in the preview
+table, the engine answering `ConsumptionQuery` objects (a `CodedCube`
+over the rollup cube), the `CodedSketches` of the distinct-count metrics
+and a memory report. The Streamlit app only caches
+and displays these; a batch job or a benchmark calls the same functions::
+
+    dataset = pipeline.load(data_dir)
+    aggregates = ConsumptionQuery(start, end, [1]).run(dataset.engine)
+
+`load_version` adds the lookup registry and the chosen query engine: it is
+the value rebuilt by the app's `Refresher`, and by the data server's.
+"""
+import collections
+import concurrent.futures
+import contextvars
+import functools
+import os
+
+import pandas as pd
+
+from dashboard import fact_table, loaders, streaming
+from dashboard.aggregate import CodedCube
+from dashboard.enrich import INPUT_FILES, build_main_df
+from dashboard.lookups import LOOKUP_FILES, LookupRegistry
+from dashboard.query import sort_by_date
+from dashboard.rollup import build_cube
+from dashboard.schema import compact_main_df, memory_report
+from dashboard.sketch import METRICS, CodedSketches, build_sketches
+from dashboard.timing import stage
+
+DEFAULT_PERIOD_DAYS = 31
+# Origines des événements : exports en mémoire, table de faits préconstruite, lecture par morceaux
+SOURCES = ["events", "fact_table", "streaming"]
+
+Dataset = collections.namedtuple("Dataset", ["events", "engine", "sketches", "memory", "note"])
+
+
+def load_main_df(data_dir=loaders.DATA_DIR, nrows=None, workers=None):
+    """The enriched main frame with compact dtypes, sorted by date, and its memory
+    report. The four files are read on `workers` threads (see `loaders.load_concurrently`)."""
+    tables = loaders.load_concurrently({
+        "load_consumption": functools.partial(loaders.load_consumption, data_dir, nrows=nrows),
+        **{name: functools.partial(getattr(loaders, name), data_dir) for name in loaders.ENRICH_LOADERS},
+    }, workers)
+    df = build_main_df(*tables.values())
+    del tables
+    with stage("compact and sort", rows=len(df)):
+        compact_df = sort_by_date(compact_main_df(df))
+    return compact_df, memory_report(df, compact_df)
+
+
+def code_cube(main_df, cube=None):
+    """The `CodedCube` of `cube`, rolled up from `main_df` if not given."""
+    cube = build_cube(main_df) if cube is None else cube
+    with stage("code cube", rows=len(cube)):
+        return CodedCube(cube)
+
+
+def code_sketches(main_df, sketches=None):
+    """{metric column: `CodedSketches`} of `sketches` (see `sketch.build_sketches`), built from `main_df` if not given."""
+    coded = {}
+    for column in METRICS:
+        frame = build_sketches(main_df, column) if sketches is None else sketches[column]
+        with stage("code sketches", rows=len(frame), metric=column):
+            coded[column] = CodedSketches(frame)
+    return coded
+
+
+def fact_table_memory(data_dir=loaders.DATA_DIR):
+    """Memory report stored in the fact table manifest, empty if there is none."""
+    records = (fact_table.read_manifest(data_dir) or {}).get("memory")
+    return pd.DataFrame(records).set_index("column") if records else pd.DataFrame()
+
+
+def streamed_memory(streamed):
+    """Rows and MB of the preview window, of the cube and of the sketches of a `streaming.Streamed` load."""
+    frames = {"fenêtre": streamed.window, "cube": streamed.cube}
+    frames.update({f"sketches {column}": frame for column, frame in streamed.sketches.items()})
+    return pd.DataFrame({
+        "rows": [len(frame) for frame in frames.values()],
+        "mb": [frame.memory_usage(deep=True).sum() / 2**20 for frame in frames.values()],
+    }, index=list(frames)).round(2)
+
+
+def streamed_note(streamed):
+    return (
+        f"Mode streaming : {streamed.rows:,} événements agrégés en {streamed.chunks} morceaux, "
+        f"aperçu limité aux {len(streamed.window):,} plus récents."
+    )
+
+
+def load(data_dir=loaders.DATA_DIR, nrows=None, workers=None):
+    """`Dataset` of the full in-memory load."""
+    df, memory = load_main_df(data_dir, nrows, workers)
+    return Dataset(df, code_cube(df), code_sketches(df), memory, None)
+
+
+def load_from_fact_table(data_dir=loaders.DATA_DIR):
+    """`Dataset` of the prebuilt fact table, `None` if it was not built."""
+    df, cube = fact_table.load(data_dir), fact_table.load_cube(data_dir)
+    if df is None or cube is None:
+        return None
+    # Tables construites avant la persistance des sketches : calculés au chargement
+    return Dataset(df, code_cube(df, cube), code_sketches(df, fact_table.load_sketches(data_dir)), fact_table_memory(data_dir), None)
+
+
+def load_streamed(data_dir=loaders.DATA_DIR, **kwargs):
+    """`Dataset` of the streaming load (see `streaming.load`), `None` for an empty history."""
+    streamed = streaming.load(data_dir, **kwargs)
+    if streamed.cube is None:
+        return None
+    return Dataset(
+        streamed.window, code_cube(streamed.window, streamed.cube), code_sketches(streamed.window, streamed.sketches),
+        streamed_memory(streamed), streamed_note(streamed),
+    )
+
+
+def default_period(df, days=DEFAULT_PERIOD_DAYS):
+    """The last `days` days of `df`: (start, end)."""
+    end = df["creation_date"].max()
+    return end - pd.Timedelta(days=days), end
+
+
+def watched_paths(data_dir=loaders.DATA_DIR, source="events"):
+    """Files whose change calls for a new `load_version`: the exports read (the
+    manifest for the fact table) and the reference tables."""
+    if source == "fact_table":
+        paths = [os.path.join(fact_table.fact_table_dir(data_dir), fact_table.MANIFEST_FILE)]
+    else:
+        paths = loaders.source_paths(data_dir, *INPUT_FILES)
+    return paths + loaders.source_paths(data_dir, *LOOKUP_FILES)
+
+
+def load_version(data_dir=loaders.DATA_DIR, source="events", query_engine="pandas", workers=None,
+                 duckdb_threads=None, nrows=None, **streaming_options):
+    """One version of the data: (`Dataset` or `None`, `LookupRegistry`, query engine).
+
+    The reference tables are read on a thread while the events load, so a
+    cold start lasts as long as the largest file, not the sum of the files.
+    `query_engine` is "pandas" (the dataset's `CodedCube`) or "duckdb",
+    which needs every event and so no `"streaming"` source.
+    """
+    if query_engine == "duckdb" and source == "streaming":
+        raise ValueError("the DuckDB engine needs every event, not the streaming window")
+    with stage("load data"), concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="lookups") as executor:
+        lookups_future = executor.submit(contextvars.copy_context().run, LookupRegistry.load, data_dir, workers)
+        if source == "fact_table":
+            dataset = load_from_fact_table(data_dir)
+        elif source == "streaming":
+            dataset = load_streamed(data_dir, workers=workers, **streaming_options)
+        else:
+            dataset = load(data_dir, nrows=nrows, workers=workers)
+        lookups = lookups_future.result()
+    if dataset is None or query_engine != "duckdb":
+        return dataset, lookups, dataset and dataset.engine
+    from dashboard.duckdb_engine import DuckDBEngine
+
+    return dataset, lookups, DuckDBEngine(dataset.events, threads=duckdb_threads)
@@ -0,0 +1,82 @@
+"""Filtering of the main frame.
+
+The main frame is kept sorted by `creation_date`, so a period is a
+contiguous row range found by binary search: filtering costs
+O(log n + rows in the period) instead of two comparisons over the whole
+history. The engines search their own date codes (`CodedCube.positions`,
+`explorer.FilteredEvents`); `date_slice`, which slices a frame, is only
+used by the reference functions of `rollup`.
+
+A sidebar selection is normalized into a hashable `Selection`, used as the
+key of memoized filter results. `ConsumptionQuery` builds the normalized
+selection and runs it on a query engine (`CodedCube` or `DuckDBEngine`).
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+Selection = collections.namedtuple("Selection", ["start_date", "end_date", "type_ids", "org_ids", "user_ids"])
+
+# Types de consommation, par libellé
+TYPE_IDS = {
+    "consultation contact": 1,
+    "exports": 3,
+    "exports CRM": 4,
+    "location mail": 5,
+    "push to crm": 7,
+    "campagnes/séquence": 8,
+    "mobiles": 9,
+}
+
+
+def sort_by_date(df):
+    """Returns `df` sorted by `creation_date` with a fresh RangeIndex."""
+    if df["creation_date"].is_monotonic_increasing:
+        return df
+    return df.sort_values("creation_date", kind="stable", ignore_index=True)
+
+
+def date_slice(df, start_date, end_date):
+    """Rows of the date-sorted `df` with `start_date <= creation_date <= end_date`.
+
+    Bounds are converted with `pd.Timestamp`, as the former boolean mask did.
+    """
+    dates = df["creation_date"].to_numpy()
+    start = dates.searchsorted(np.datetime64(pd.Timestamp(start_date)), side="left")
+    end = dates.searchsorted(np.datetime64(pd.Timestamp(end_date)), side="right")
+    return df.iloc[start:end]
+
+
+def _ids(values):
+    return tuple(sorted({int(value) for value in (values if values is not None else ())}))
+
+
+def normalize_selection(start_date, end_date, type_ids, org_ids=None, user_ids=None):
+    """Canonical form of a sidebar selection.
+
+    Dates are truncated to the day and ids deduplicated and sorted, so equal
+    selections compare equal whatever the order in which values were picked.
+    """
+    return Selection(
+        pd.Timestamp(start_date).date(),
+        pd.Timestamp(end_date).date(),
+        _ids(type_ids),
+        _ids(org_ids),
+        _ids(user_ids),
+    )
+
+
+class ConsumptionQuery(Selection):
+    """A normalized selection (see `normalize_selection`) that runs on a query engine.
+
+    Equal queries compare and hash equal, as the `Selection` they are.
+    """
+    __slots__ = ()
+
+    def __new__(cls, start_date, end_date, type_ids, org_ids=None, user_ids=None):
+        return super().__new__(cls, *normalize_selection(start_date, end_date, type_ids, org_ids, user_ids))
+
+    def run(self, engine):
+        """`Aggregates` of the selected events: timeline and breakdowns."""
+        return engine.aggregate(self)
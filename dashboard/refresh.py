@@ -0,0 +1,107 @@
+"""Background rebuild of the dashboard data when the exports change.
+
+A `Refresher` holds the current `Version` of a value built from files (the
+loaded dataset and its lookups). A daemon thread polls the identity of the
+files (see `file_key`); once they changed and stayed unchanged for one
+poll, so that an export still being written is not read, the value is
+rebuilt on that thread and swapped in by a single attribute assignment.
+Readers keep getting the previous version until then: only the very first
+build, when there is no version yet, runs on a caller's thread.
+
+A failed build is logged and kept in `error`; the previous version stays
+active and the build is retried at the next change.
+"""
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+Version = collections.namedtuple("Version", ["number", "value", "key", "built_at", "seconds"])
+
+
+def file_key(paths):
+    """Identity of `paths`: (path, mtime, size), `None` for missing files."""
+    key = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            key.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            key.append((path, None))
+    return tuple(key)
+
+
+class Refresher:
+    """The result of `build()` for the current state of `paths`, rebuilt in the background."""
+
+    def __init__(self, build, paths, interval=60):
+        self.build = build
+        self.paths = list(paths)
+        self.interval = interval
+        self.error = None
+        self._version = None
+        self._seen_key = None  # Identité des fichiers au dernier passage
+        self._failed_key = None  # Fichiers dont la construction a échoué
+        self._build_lock = threading.Lock()  # Une seule construction à la fois
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def current(self):
+        """The active `Version`, built on the calling thread if there is none yet."""
+        version = self._version
+        if version is None:
+            with self._build_lock:
+                if self._version is None:
+                    self._version = self._build(1)
+            version = self._version
+        return version
+
+    def _build(self, number):
+        key = file_key(self.paths)
+        start = time.perf_counter()
+        value = self.build()
+        return Version(number, value, key, datetime.datetime.now(), round(time.perf_counter() - start, 2))
+
+    def refresh(self, wait_stable=True):
+        """Rebuilds and swaps the version if the files changed since it was built
+        (and, with `wait_stable`, did not change since the previous call).
+
+        Returns `True` if a new version was swapped in.
+        """
+        key = file_key(self.paths)
+        stable = key == self._seen_key or not wait_stable
+        self._seen_key = key
+        current = self._version
+        if current is None or key in (current.key, self._failed_key) or not stable:
+            return False
+        with self._build_lock:
+            try:
+                version = self._build(self._version.number + 1)
+            except Exception as error:
+                logger.exception("rebuild of version %d failed", self._version.number + 1)
+                self.error = error
+                self._failed_key = key
+                return False
+            self._version = version
+            self.error = None
+        logger.info("data version %d built in %.1fs", version.number, version.seconds)
+        return True
+
+    def start(self):
+        """Starts polling the files every `interval` seconds on a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="data-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
@@ -0,0 +1,65 @@
+"""Pre-aggregated event counts behind every chart.
+
+The cube counts events per day x `type_id` x `organization_id` x `user_id`
+x breakdown dimensions. Its `creation_date` column holds the day, and rows
+are sorted by it, so `date_slice` applies to it as to the main frame. Every
+chart is a sum of `count` over the filtered cube rows, so page latency
+depends on the number of distinct combinations, not on the number of
+events.
+
+`build_cube` is used by every load path; the app, the CLI and the data
+server then query the cube through `aggregate.CodedCube` (or the events
+through `duckdb_engine.DuckDBEngine`). `filter_cube`, `select`, `timeline`
+and `breakdown` are not on that path: they are the plain pandas filters and
+groupbys the charts were first drawn with, kept as the reference semantics
+that the engines are checked against by the benchmarks and tests.
+"""
+from dashboard.query import date_slice
+from dashboard.timing import timed
+
+FILTER_COLUMNS = ['type_id', 'organization_id', 'user_id']
+DIMENSIONS = ['job_type_id', 'hierarchical_name', "Tranche d'effectif", 'Tranche de CA', 'class', 'Secteur']
+
+
+@timed("build cube")
+def build_cube(df):
+    """Counts the events of the main frame per day, filter column and dimension."""
+    keys = [df["creation_date"].dt.floor("D")] + [df[column] for column in FILTER_COLUMNS + DIMENSIONS]
+    cube = df.groupby(keys, dropna=False, observed=True, sort=True).size()
+    return cube.rename("count").reset_index()
+
+
+def filter_cube(cube, type_ids, org_ids=None, user_ids=None):
+    """Cube rows matching the sidebar selection; empty org/user lists mean all (reference only)."""
+    rows = cube[cube["type_id"].isin(type_ids)]
+    if org_ids:
+        rows = rows[rows["organization_id"].isin(org_ids)]
+    if user_ids:
+        rows = rows[rows["user_id"].isin(user_ids)]
+    return rows
+
+
+def select(cube, selection):
+    """Cube rows matching a normalized `Selection` (reference for `CodedCube.positions`)."""
+    return filter_cube(
+        date_slice(cube, selection.start_date, selection.end_date),
+        selection.type_ids,
+        selection.org_ids,
+        selection.user_ids,
+    )
+
+
+def timeline(rows, freq):
+    """Event counts per day (`freq="D"`) or per month (`freq="M"`) (reference for `Aggregates.timeline`)."""
+    if freq == "D":
+        periods = rows["creation_date"].dt.date
+    else:
+        periods = rows["creation_date"].dt.to_period(freq)
+    return rows.groupby(periods)["count"].sum().reset_index(name="count")
+
+
+def breakdown(rows, column):
+    """Event counts per value of `column`, most frequent first, like `value_counts()` (reference for `Aggregates.breakdown`)."""
+    counts = rows.groupby(column, observed=True)["count"].sum()
+    counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+    return counts.reset_index(name="count")
@@ -0,0 +1,60 @@
+"""Compact dtypes for the enriched main frame.
+
+Ids are stored on the smallest integer type that holds them (pandas
+nullable `Int*` types where left joins introduced NaN), low-cardinality
+labels as `category`, and join keys no chart uses are dropped.
+"""
+import numpy as np
+import pandas as pd
+
+ID_COLUMNS = [
+    'id', 'contact_id', 'organization_id', 'type_id', 'user_id', 'job_type_id',
+    'Secteur', "Taille d'entreprise", 'Tranche de CA', "Tranche d'effectif", 'Structure Type', 'class',
+]
+CATEGORY_COLUMNS = ['hierarchical_name']
+DROP_COLUMNS = ['company_id']
+
+INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def downcast_ids(series):
+    """Returns `series` on the smallest (nullable if needed) integer dtype.
+
+    Series holding non-integral values are returned unchanged.
+    """
+    values = series.dropna()
+    if len(values) and not np.array_equal(values, np.floor(values)):
+        return series
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+    for integer_type in INTEGER_TYPES:
+        info = np.iinfo(integer_type)
+        if info.min <= low and high <= info.max:
+            break
+    if len(values) < len(series):
+        return series.astype(pd.api.types.pandas_dtype(integer_type.__name__.capitalize()))
+    return series.astype(integer_type)
+
+
+def compact_main_df(df):
+    """Returns a copy of the main frame with compact dtypes."""
+    df = df.drop(columns=[column for column in DROP_COLUMNS if column in df.columns])
+    for column in ID_COLUMNS:
+        if column in df.columns:
+            df[column] = downcast_ids(df[column])
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def memory_report(before, after):
+    """Per-column dtype and `memory_usage(deep=True)` (MB) before and after compaction."""
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'mb_before': before.memory_usage(deep=True, index=False) / 2**20,
+        'mb_after': after.memory_usage(deep=True, index=False) / 2**20,
+    }).reindex(before.columns)
+    report = report.fillna({'dtype_after': 'dropped', 'mb_after': 0.0})
+    report.loc['total'] = ['', '', report['mb_before'].sum(), report['mb_after'].sum()]
+    return report.round({'mb_before': 2, 'mb_after': 2})
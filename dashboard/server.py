@@ -0,0 +1,417 @@
+"""Data server shared by several dashboard replicas, and its client.
+
+`python -m dashboard serve` loads the data once (`pipeline.load_version`,
+rebuilt in the background by a `Refresher` as in the app) and answers the
+queries of any number of Streamlit replicas or worker processes over a Unix
+socket or a TCP port. With `data_server` set, `app.py` is a thin client: it
+holds neither the events nor the cube, only the results of its own
+sessions, and N replicas no longer mean N copies of the data.
+
+Every message is length-prefixed. A request is a JSON object with an `op`;
+a response is a JSON header followed by zero or more tables, each an Arrow
+IPC stream, then an empty message. Arrow keeps the dtypes (nullable
+integers, categoricals, dates, periods), so the client gets the very frames
+the local engines return. An export is sent as one table per chunk, so
+neither side holds the whole selection.
+
+Operations:
+
+- `version`: number, build time and error of the active version;
+- `dataset`: memory report, note and last event (columns and default period);
+- `lookups`: selector options and id -> label arrays;
+- `aggregate`, `distinct`: `Aggregates` tables and distinct counts of a selection;
+- `events`, `page`, `export`: the event explorer (see `explorer.FilteredEvents`).
+
+Results are cached on the server per version and selection, shared by all
+replicas. The server has no authentication: bind it to a Unix socket or to
+an address only the replicas can reach.
+"""
+import datetime
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from dashboard import explorer
+from dashboard.aggregate import Aggregates
+from dashboard.cache import DataCache
+from dashboard.lookups import LookupRegistry
+from dashboard.pipeline import Dataset
+from dashboard.query import ConsumptionQuery
+from dashboard.refresh import Version
+from dashboard.sketch import METRICS
+from dashboard.timing import stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+OPERATIONS = ["version", "dataset", "lookups", "aggregate", "distinct", "events", "page", "export"]
+CACHE_MAX_BYTES = 256 * 2**20
+
+_LENGTH = struct.Struct("!Q")
+
+
+class DataServerError(Exception):
+    """A request the data server could not answer."""
+
+
+def parse_address(address):
+    """A Unix socket path ("unix:path", or any address with a "/"), else a ("host", port) pair."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    if "/" in address:
+        return address
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def encode_frame(frame):
+    """`frame` as an Arrow IPC stream."""
+    table = pa.Table.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+        if not table.num_rows:
+            # Un lot vide porte les dictionnaires : sans lui, un catégoriel vide perd ses catégories
+            writer.write_batch(pa.RecordBatch.from_pandas(frame, schema=table.schema))
+    return memoryview(sink.getvalue())
+
+
+def decode_frame(payload):
+    return pa.ipc.open_stream(payload).read_pandas()
+
+
+def write_message(stream, payload):
+    stream.write(_LENGTH.pack(len(payload)))
+    if len(payload):
+        stream.write(payload)
+
+
+def read_message(stream):
+    """The next message of `stream`, `None` if it was closed between two messages."""
+    prefix = stream.read(_LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < _LENGTH.size:
+        raise ConnectionError("connection closed in a message")
+    (length,) = _LENGTH.unpack(prefix)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ConnectionError("connection closed in a message")
+    return payload
+
+
+def _query_args(selection):
+    return [str(selection.start_date), str(selection.end_date), *map(list, selection[2:])]
+
+
+##############################################################
+#  SERVEUR
+##############################################################
+
+class DataService:
+    """Answers requests from the current version of a `Refresher` of `pipeline.load_version`."""
+
+    def __init__(self, refresher, cache_max_bytes=CACHE_MAX_BYTES):
+        self.refresher = refresher
+        # Résultats par version et sélection, partagés par toutes les répliques
+        self.cache = DataCache(max_bytes=cache_max_bytes)
+
+    def respond(self, request):
+        """(header, iterable of Arrow payloads) answering `request`."""
+        if request.get("op") not in OPERATIONS:
+            raise DataServerError(f"unknown operation: {request.get('op')!r}")
+        version = self.refresher.current
+        handler = getattr(self, f"_{request['op']}")
+        query = ConsumptionQuery(*request["query"]) if "query" in request else None
+        with stage("serve", op=request["op"], version=version.number):
+            header, payloads = handler(version, query, request)
+        return {"version": version.number, **header}, payloads
+
+    def _cached(self, version, key, compute):
+        return self.cache.get((version.number, *key), compute)
+
+    def _version(self, version, query, request):
+        error = self.refresher.error
+        return {
+            "built_at": version.built_at.isoformat(), "seconds": version.seconds,
+            "error": None if error is None else str(error),
+        }, []
+
+    def _dataset(self, version, query, request):
+        dataset = version.value[0]
+        if dataset is None:
+            return {"empty": True}, []
+        return {"empty": False, "note": dataset.note}, [encode_frame(dataset.memory), encode_frame(dataset.events.iloc[-1:])]
+
+    def _lookups(self, version, query, request):
+        lookups = version.value[1]
+        options = [pd.DataFrame({"label": list(labels), "id": list(labels.values())}) for labels in lookups.options.values()]
+        names = [pd.DataFrame({"name": table}) for table in lookups.names.values()]
+        return {"options": list(lookups.options), "names": list(lookups.names)}, [encode_frame(frame) for frame in options + names]
+
+    def _aggregate(self, version, query, request):
+        def compute():
+            aggregates = query.run(version.value[2])
+            payloads = [encode_frame(aggregates.days)] + [encode_frame(frame) for frame in aggregates.breakdowns.values()]
+            return {"breakdowns": list(aggregates.breakdowns)}, payloads
+        return self._cached(version, ("aggregate", query), compute)
+
+    def _distinct(self, version, query, request):
+        column, by = request["column"], request.get("by")
+
+        def compute():
+            result = version.value[0].sketches[column].distinct(query, by)
+            return ({"count": result}, []) if by is None else ({}, [encode_frame(result)])
+        return self._cached(version, ("distinct", query, column, by), compute)
+
+    def _filtered(self, version, query):
+        return self._cached(version, ("events", query), lambda: explorer.FilteredEvents(version.value[0].events, query))
+
+    def _events(self, version, query, request):
+        return {"rows": len(self._filtered(version, query))}, []
+
+    def _page(self, version, query, request):
+        page = self._filtered(version, query).page(version.value[0].events, request["number"], request["size"], request.get("columns"))
+        return {}, [encode_frame(page)]
+
+    def _export(self, version, query, request):
+        chunks = self._filtered(version, query).chunks(
+            version.value[0].events, request.get("columns"), request.get("chunk_rows", explorer.EXPORT_CHUNK_ROWS),
+        )
+        return {}, (encode_frame(chunk) for chunk in chunks)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answers the requests of one client connection, one after the other."""
+
+    def setup(self):
+        super().setup()
+        if self.request.family != socket.AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        while True:
+            message = read_message(self.rfile)
+            if message is None:
+                return
+            try:
+                header, payloads = self.server.service.respond(json.loads(message))
+            except Exception as error:
+                logger.exception("request failed: %s", message[:200])
+                header, payloads = {"error": f"{type(error).__name__}: {error}"}, []
+            write_message(self.wfile, json.dumps(header).encode())
+            # Un export est envoyé morceau par morceau : une erreur en cours de route coupe la connexion
+            for payload in payloads:
+                write_message(self.wfile, payload)
+            write_message(self.wfile, b"")
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(address, service):
+    """A threading socket server answering with `service` on `address` (see `parse_address`)."""
+    address = parse_address(address)
+    if isinstance(address, str):
+        # Socket laissé par un serveur arrêté
+        if os.path.exists(address):
+            os.unlink(address)
+        server = _UnixServer(address, _Handler)
+    else:
+        server = _TCPServer(address, _Handler)
+    server.service = service
+    return server
+
+
+##############################################################
+#  CLIENT
+##############################################################
+
+class DataClient:
+    """Client of a data server, with the `current` and `error` of a `Refresher`.
+
+    The value of each `Version` is the (`Dataset`, `LookupRegistry`, engine)
+    triple of `pipeline.load_version`, whose engine, sketches and explorer
+    ask the server. Its events are only the last event: enough for the
+    columns and the default period. Lookups and the memory report are fetched
+    once per version. Each thread keeps its own connection.
+    """
+
+    def __init__(self, address, timeout=None):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self.error = None
+        self._version = None
+        self._connections = threading.local()
+
+    def _connect(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        connection.connect(self.address)
+        if family != socket.AF_UNIX:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection, connection.makefile("rb"), connection.makefile("wb")
+
+    def _send(self, request):
+        """Sends `request` and returns the reader of its response, reconnecting once if the connection dropped."""
+        message = json.dumps(request).encode()
+        for attempt in (1, 2):
+            if getattr(self._connections, "streams", None) is None:
+                self._connections.streams = self._connect()
+            _, reader, writer = self._connections.streams
+            try:
+                write_message(writer, message)
+                writer.flush()
+                header = read_message(reader)
+                if header is None:
+                    raise ConnectionError("connection closed by the data server")
+            except OSError:
+                # Serveur redémarré depuis le dernier appel de ce thread : les requêtes sont sans effet de bord
+                self.close()
+                if attempt == 2:
+                    raise
+                continue
+            header = json.loads(header)
+            if "error" in header and header.get("version") is None:
+                read_message(reader)
+                raise DataServerError(header["error"])
+            return header, reader
+
+    def _frames(self, reader):
+        """The tables of a response, decoded as they arrive."""
+        while True:
+            payload = read_message(reader)
+            if payload is None:
+                self.close()
+                raise ConnectionError("connection closed by the data server")
+            if not payload:
+                return
+            yield decode_frame(payload)
+
+    def request(self, op, query=None, **args):
+        """(header, frames) of the response to `op` for the `Selection` `query`."""
+        if query is not None:
+            args["query"] = _query_args(query)
+        header, reader = self._send({"op": op, **args})
+        with stage("data server", op=op) as record:
+            frames = list(self._frames(reader))
+            record["rows"] = sum(len(frame) for frame in frames)
+        return header, frames
+
+    def stream(self, op, query=None, **args):
+        """Yields the frames of the response to `op` one by one, without holding them all."""
+        if query is not None:
+            args["query"] = _query_args(query)
+        _, reader = self._send({"op": op, **args})
+        frames = self._frames(reader)
+        try:
+            yield from frames
+        finally:
+            # Réponse abandonnée en cours de route : la connexion n'est plus synchronisée
+            if frames.gi_frame is not None:
+                self.close()
+
+    def close(self):
+        streams = getattr(self._connections, "streams", None)
+        self._connections.streams = None
+        if streams is not None:
+            streams[0].close()
+
+    @property
+    def current(self):
+        header, _ = self.request("version")
+        self.error = header["error"]
+        version = self._version
+        if version is None or version.number != header["version"]:
+            built_at = datetime.datetime.fromisoformat(header["built_at"])
+            version = Version(header["version"], self._value(), None, built_at, header["seconds"])
+            self._version = version
+        return version
+
+    def _value(self):
+        header, frames = self.request("dataset")
+        lookups = self.lookups()
+        if header["empty"]:
+            return None, lookups, None
+        memory, events = frames
+        engine = RemoteEngine(self)
+        sketches = {column: RemoteSketches(self, column) for column in METRICS}
+        return Dataset(events, engine, sketches, memory, header["note"]), lookups, engine
+
+    def lookups(self):
+        header, frames = self.request("lookups")
+        options = {
+            column: dict(zip(frame["label"], frame["id"].tolist()))
+            for column, frame in zip(header["options"], frames)
+        }
+        names = {}
+        for column, frame in zip(header["names"], frames[len(options):]):
+            names[column] = frame["name"].to_numpy(dtype=object)
+            names[column].flags.writeable = False
+        return LookupRegistry.from_labels(options, names)
+
+    def filtered_events(self, selection):
+        """`RemoteFilteredEvents` of `selection`: the matches stay on the server."""
+        header, _ = self.request("events", selection)
+        return RemoteFilteredEvents(self, selection, header["rows"])
+
+
+class RemoteEngine:
+    """Query engine answering `aggregate` from the data server."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def aggregate(self, selection):
+        header, frames = self.client.request("aggregate", selection)
+        return Aggregates(frames[0], dict(zip(header["breakdowns"], frames[1:])))
+
+
+class RemoteSketches:
+    """`CodedSketches.distinct` of one metric column, computed by the data server."""
+
+    def __init__(self, client, column):
+        self.client = client
+        self.column = column
+
+    def distinct(self, selection, by=None):
+        header, frames = self.client.request("distinct", selection, column=self.column, by=by)
+        return header["count"] if by is None else frames[0]
+
+
+class RemoteFilteredEvents:
+    """`explorer.FilteredEvents` kept by the data server: pages and export chunks are fetched from it.
+
+    The `events` arguments are ignored, the server reads its own.
+    """
+
+    nbytes = 0
+
+    def __init__(self, client, selection, rows):
+        self.client = client
+        self.selection = selection
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+    def page(self, events, number, size, columns=None):
+        _, frames = self.client.request("page", self.selection, number=int(number), size=int(size), columns=columns)
+        return frames[0]
+
+    def chunks(self, events, columns=None, chunk_rows=explorer.EXPORT_CHUNK_ROWS):
+        return self.client.stream("export", self.selection, columns=columns, chunk_rows=chunk_rows)
@@ -0,0 +1,153 @@
+"""HyperLogLog sketches of distinct contacts and users behind the distinct-count metrics.
+
+A distinct count cannot be summed from the rollup cube: the contacts of two
+days overlap. Each event instead hashes its contact (or user) id into one
+of `REGISTERS` registers and a rank, the position of the first set bit of
+the rest of the hash. A sketch keeps the highest rank per register, and the
+number of distinct ids is estimated from the registers within about
+1.04 / sqrt(`REGISTERS`) (1.6 %). Sketches merge by taking the highest rank
+of each register, so the sketches of any set of days, types and
+organizations give the distinct count of their union.
+
+`build_sketches` keeps the registers per day x `type_id` x
+`organization_id`, sparsely: one row per register that is set, so a small
+organization costs a few rows, not a full sketch. `CodedSketches` codes
+these rows once, like `aggregate.CodedCube`, and answers a selection per
+day, month or organization by merging the selected rows into one dense
+sketch per output row.
+"""
+import numpy as np
+import pandas as pd
+
+from dashboard.timing import stage, timed
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+KEYS = ["creation_date", "type_id", "organization_id"]
+# Métriques distinctes : colonne comptée -> libellé
+METRICS = {"contact_id": "Contacts distincts", "user_id": "Utilisateurs actifs"}
+
+_RANK_BITS = 64 - PRECISION
+# Constante de correction du biais de HyperLogLog pour m >= 128
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+
+def registers(ids):
+    """Register index and rank (1 + leading zeros of the remaining bits) of the hash of each id."""
+    hashes = pd.util.hash_array(np.asarray(ids, dtype=np.int64))
+    rest = hashes & np.uint64((1 << _RANK_BITS) - 1)
+    # 52 bits au plus : exacts en float64, dont frexp donne la longueur en bits
+    return (hashes >> np.uint64(_RANK_BITS)).astype(np.uint16), (_RANK_BITS + 1 - np.frexp(rest.astype(np.float64))[1]).astype(np.uint8)
+
+
+def estimate(dense):
+    """Distinct count estimated from each row of a (sketches x `REGISTERS`) array of ranks."""
+    dense = np.atleast_2d(dense)
+    raw = _ALPHA * REGISTERS**2 / np.ldexp(1.0, -dense.astype(np.int64)).sum(axis=1)
+    # Petits effectifs : comptage linéaire sur les registres vides
+    empty = (dense == 0).sum(axis=1)
+    linear = REGISTERS * np.log(REGISTERS / np.maximum(empty, 1))
+    return np.where((raw <= 2.5 * REGISTERS) & (empty > 0), linear, raw).round().astype(np.int64)
+
+
+def _max_rank(frame):
+    return frame.groupby(KEYS + ["register"], dropna=False, observed=True, sort=True)["rank"].max().reset_index()
+
+
+@timed("build sketches")
+def build_sketches(df, column):
+    """Sparse sketches of the distinct values of `column` per day, type and organization,
+    sorted by day: one row per set register with its rank."""
+    rows = df[df[column].notna()]
+    register, rank = registers(rows[column].to_numpy(dtype=np.int64))
+    return _max_rank(pd.DataFrame({
+        "creation_date": rows["creation_date"].dt.floor("D").to_numpy(),
+        "type_id": rows["type_id"].to_numpy(),
+        "organization_id": rows["organization_id"].to_numpy(),
+        "register": register,
+        "rank": rank,
+    }))
+
+
+@timed("merge sketches")
+def merge_sketches(sketches):
+    """Sketches of the union of the events of several `build_sketches` results."""
+    return _max_rank(pd.concat(sketches, ignore_index=True))
+
+
+def _dense(register, rank, buckets=None, size=1):
+    dense = np.zeros((size, REGISTERS), dtype=np.uint8)
+    np.maximum.at(dense, (np.zeros(len(register), dtype=np.int64) if buckets is None else buckets, np.asarray(register, dtype=np.int64)), np.asarray(rank))
+    return dense
+
+
+class CodedSketches:
+    """Sketch rows of `build_sketches` as integer codes, built once per sketch frame."""
+
+    def __init__(self, sketches):
+        self.registers = sketches["register"].to_numpy(dtype=np.uint16)
+        self.ranks = sketches["rank"].to_numpy(dtype=np.uint8)
+        self._codes = {}
+        self._uniques = {}
+        for column in KEYS:
+            codes, uniques = pd.factorize(sketches[column], sort=True)
+            self._codes[column] = (codes + 1).astype(np.min_scalar_type(len(uniques)))
+            self._uniques[column] = uniques
+
+    def __len__(self):
+        return len(self.ranks)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.registers, self.ranks, *self._codes.values()])
+
+    def positions(self, selection):
+        """Sketch row positions of the period, types and organizations of `selection`.
+
+        Users are not a sketch key: a user filter is ignored.
+        """
+        # Lignes triées par jour : la période est une tranche des codes de date, croissants
+        days, dates = self._uniques["creation_date"], self._codes["creation_date"]
+        start = dates.searchsorted(days.searchsorted(pd.Timestamp(selection.start_date), side="left") + 1, side="left")
+        end = dates.searchsorted(days.searchsorted(pd.Timestamp(selection.end_date), side="right"), side="right")
+        keep = np.ones(end - start, dtype=bool)
+        for column, ids in (("type_id", selection.type_ids), ("organization_id", selection.org_ids)):
+            if ids or column == "type_id":
+                allowed = np.zeros(len(self._uniques[column]) + 1, dtype=bool)
+                codes = self._uniques[column].get_indexer(list(ids)) + 1
+                allowed[codes[codes > 0]] = True
+                keep &= allowed[self._codes[column][start:end]]
+        return start + np.flatnonzero(keep)
+
+    def distinct(self, selection, by=None):
+        """Estimated distinct count of `selection`: a number, or per day (`by="D"`),
+        month (`"M"`) or organization (`"organization_id"`) a frame like
+        `Aggregates.timeline` and `Aggregates.breakdown`, with a `count` column."""
+        with stage("distinct", rows=len(self)) as record:
+            positions = self.positions(selection)
+            record["selected"] = len(positions)
+            if by is None:
+                return int(estimate(_dense(self.registers[positions], self.ranks[positions]))[0])
+
+            if by in ("D", "M"):
+                codes = self._codes["creation_date"][positions]
+                keys = pd.DatetimeIndex(self._uniques["creation_date"])
+                if by == "M":
+                    # Jour -> mois, puis mois codés de façon dense
+                    months, keys = pd.factorize(keys.to_period("M"), sort=True)
+                    codes = np.concatenate([[0], months + 1])[codes]
+                else:
+                    keys = keys.date
+                column = "creation_date"
+            else:
+                codes, keys, column = self._codes[by][positions], self._uniques[by], by
+            # Code 0 : événements sans organisation, absents des répartitions comme dans `CodedCube`
+            known = codes > 0
+            codes, positions = codes[known], positions[known]
+            present = np.unique(codes)
+            buckets = np.searchsorted(present, codes)
+            counts = estimate(_dense(self.registers[positions], self.ranks[positions], buckets, len(present)))
+            result = pd.DataFrame({column: keys[present - 1], "count": counts})
+            if by not in ("D", "M"):
+                result = result.sort_values("count", ascending=False, kind="stable", ignore_index=True)
+            return result
@@ -0,0 +1,119 @@
+"""Columnar snapshots of the ``*_prod.csv`` exports.
+
+Each CSV is converted once to a zstd-compressed Parquet file stored next to
+it (``foo_prod.csv`` -> ``foo_prod.parquet``). Readers use the snapshot when
+it is at least as recent as the CSV and parse the CSV otherwise.
+"""
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dashboard.timing import stage
+
+CSV_SUFFIX = "_prod.csv"
+SNAPSHOT_SUFFIX = ".parquet"
+COMPRESSION = "zstd"
+
+# Colonnes à typer en dates lors de la conversion, par fichier
+DATE_COLUMNS = {
+    "consumption_histories_prod.csv": ["creation_date"],
+}
+
+
+def snapshot_path(csv_path):
+    """Returns the path of the snapshot associated to `csv_path`."""
+    return os.path.splitext(csv_path)[0] + SNAPSHOT_SUFFIX
+
+
+def is_fresh(csv_path):
+    """Returns `True` if a snapshot exists and is not older than the CSV."""
+    snapshot = snapshot_path(csv_path)
+    if not os.path.exists(snapshot):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(snapshot) >= os.path.getmtime(csv_path)
+
+
+def write_snapshot(csv_path):
+    """Converts `csv_path` to its Parquet snapshot and returns the snapshot path.
+
+    The CSV is parsed with pandas, exactly as the loaders do, so that columns
+    read back from the snapshot have the same dtypes as a direct CSV read.
+    """
+    parse_dates = DATE_COLUMNS.get(os.path.basename(csv_path), False)
+    df = pd.read_csv(csv_path, parse_dates=parse_dates)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    snapshot = snapshot_path(csv_path)
+    tmp_path = snapshot + ".tmp"
+    pq.write_table(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, snapshot)  # Jamais de snapshot à moitié écrit
+    return snapshot
+
+
+def ingest(data_dir, force=False):
+    """Writes snapshots for every stale `*_prod.csv` of `data_dir`.
+
+    Returns the list of snapshot paths that were (re)written.
+    """
+    written = []
+    for csv_path in sorted(glob.glob(os.path.join(data_dir, "*" + CSV_SUFFIX))):
+        if force or not is_fresh(csv_path):
+            written.append(write_snapshot(csv_path))
+    return written
+
+
+def _open_snapshot(csv_path, usecols):
+    parquet_file = pq.ParquetFile(snapshot_path(csv_path), memory_map=True)
+    schema = parquet_file.schema_arrow
+    if usecols is not None:
+        # Même ordre de colonnes que `pd.read_csv(usecols=...)` : celui du fichier
+        schema = pa.schema([field for field in schema if field.name in usecols], schema.metadata)
+    return parquet_file, schema
+
+
+def read_table(csv_path, usecols=None, parse_dates=None, nrows=None):
+    """Reads a table from its snapshot when fresh, from the CSV otherwise.
+
+    Arguments mirror `pd.read_csv` so loaders can switch transparently; the
+    snapshot is memory-mapped and only the requested columns are decoded.
+    """
+    fresh = is_fresh(csv_path)
+    with stage("read", file=os.path.basename(csv_path), source="parquet" if fresh else "csv") as record:
+        df = _read_table(csv_path, fresh, usecols, parse_dates, nrows)
+        record["rows"] = len(df)
+    return df
+
+
+def _read_table(csv_path, fresh, usecols, parse_dates, nrows):
+    if not fresh:
+        return pd.read_csv(csv_path, usecols=usecols, parse_dates=parse_dates, nrows=nrows)
+
+    parquet_file, schema = _open_snapshot(csv_path, usecols)
+    if nrows is None:
+        return parquet_file.read(columns=schema.names).to_pandas()
+
+    batches = []
+    remaining = nrows
+    for batch in parquet_file.iter_batches(batch_size=nrows, columns=schema.names):
+        if remaining <= 0:
+            break
+        batches.append(batch.slice(0, remaining))
+        remaining -= batches[-1].num_rows
+    return pa.Table.from_batches(batches, schema=schema).to_pandas()
+
+
+def iter_table(csv_path, chunk_rows, usecols=None, parse_dates=None):
+    """Yields the table `read_table` would return, in frames of at most `chunk_rows` rows."""
+    if not is_fresh(csv_path):
+        with pd.read_csv(csv_path, usecols=usecols, parse_dates=parse_dates, chunksize=chunk_rows) as reader:
+            yield from reader
+        return
+
+    parquet_file, schema = _open_snapshot(csv_path, usecols)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=schema.names):
+        yield pa.Table.from_batches([batch], schema=schema).to_pandas()
@@ -0,0 +1,109 @@
+"""Low-memory load of the consumption history.
+
+`load` reads the history chunk by chunk (from the snapshot when fresh),
+enriches each chunk against lookups flattened once, and folds it into the
+rollup cube straight away: the enriched event table is never held whole.
+Peak memory is one enriched chunk plus the cube, plus a bounded window of
+the most recent enriched rows (in days and in rows) kept for the preview
+table.
+
+The HyperLogLog sketches of the distinct-count metrics (see
+`dashboard.sketch`) are built per chunk and merged along with the cube.
+
+Partial cubes are merged whenever they outgrow the merged cube, which
+keeps the merge cost linear in the number of chunks whatever the order of
+the rows in the file.
+"""
+import collections
+
+import pandas as pd
+
+from dashboard import loaders
+from dashboard.enrich import enrich, prepare_lookups
+from dashboard.query import sort_by_date
+from dashboard.rollup import build_cube
+from dashboard.schema import compact_main_df
+from dashboard.sketch import METRICS, build_sketches, merge_sketches
+from dashboard.timing import stage, timed
+
+CHUNK_ROWS = 500_000
+WINDOW_DAYS = 92
+WINDOW_ROWS = 200_000
+
+Streamed = collections.namedtuple("Streamed", ["window", "cube", "sketches", "rows", "chunks"])
+
+
+@timed("merge cubes")
+def merge_cubes(cubes):
+    """Sums the counts of partial cubes sharing the same keys, with compact dtypes."""
+    cube = pd.concat(cubes, ignore_index=True)
+    keys = [column for column in cube.columns if column != "count"]
+    cube = cube.groupby(keys, dropna=False, observed=True, sort=True)["count"].sum().reset_index()
+    return compact_main_df(cube)
+
+
+def _merge_all_sketches(sketches, partials):
+    """Merged sketches per metric column of `sketches` (`None` at first) and of `partials`."""
+    return {
+        column: merge_sketches(([sketches[column]] if sketches else []) + [partial[column] for partial in partials])
+        for column in METRICS
+    }
+
+
+def _trim_window(parts, window_days, window_rows):
+    """Keeps at most the `window_rows` most recent rows of the last `window_days` days.
+
+    The chunks are assumed to arrive in date order, as the consumption export
+    is written: only whole leading chunks, then the head of the first one,
+    are dropped to respect `window_rows`.
+    """
+    if not any(len(part) for part in parts):
+        return []
+    latest = max(part["creation_date"].max() for part in parts if len(part))
+    cutoff = latest.floor("D") - pd.Timedelta(days=window_days)
+    parts = [part[part["creation_date"] >= cutoff] for part in parts]
+    while parts and sum(len(part) for part in parts) - len(parts[0]) >= window_rows:
+        parts.pop(0)
+    excess = sum(len(part) for part in parts) - window_rows
+    if excess > 0:
+        parts[0] = parts[0].iloc[excess:]
+    return [part for part in parts if len(part)]
+
+
+def load(data_dir=loaders.DATA_DIR, chunk_rows=CHUNK_ROWS, window_days=WINDOW_DAYS, window_rows=WINDOW_ROWS, workers=None):
+    """Streams the consumption history of `data_dir` into the rollup cube.
+
+    Returns a `Streamed` tuple: the enriched rows of the last `window_days`
+    days (at most `window_rows`, the most recent ones) sorted by date, the
+    rollup cube, the sketches per metric column, and the numbers of events and chunks read. Contacts,
+    companies and sectors are read first, on `workers` threads.
+    """
+    lookups = prepare_lookups(*loaders.load_tables(data_dir, loaders.ENRICH_LOADERS, workers).values())
+
+    cube = sketches = None
+    partial_cubes = []
+    partial_sketches = []
+    window = []
+    rows = chunks = 0
+    for chunk in loaders.iter_consumption(data_dir, chunk_rows):
+        rows += len(chunk)
+        chunks += 1
+        if chunk.empty:
+            # Fichier réduit à son en-tête : rien à agréger, et les dates n'y sont pas typées
+            continue
+        with stage("fold chunk", rows=len(chunk), chunk=chunks):
+            chunk = compact_main_df(enrich(chunk, lookups))
+            partial_cubes.append(build_cube(chunk))
+            partial_sketches.append({column: build_sketches(chunk, column) for column in METRICS})
+            if sum(len(partial) for partial in partial_cubes) > (len(cube) if cube is not None else chunk_rows):
+                cube = merge_cubes(([cube] if cube is not None else []) + partial_cubes)
+                sketches = _merge_all_sketches(sketches, partial_sketches)
+                partial_cubes = []
+                partial_sketches = []
+            window = _trim_window(window + [chunk], window_days, window_rows)
+
+    if partial_cubes:
+        cube = merge_cubes(([cube] if cube is not None else []) + partial_cubes)
+        sketches = _merge_all_sketches(sketches, partial_sketches)
+    window = compact_main_df(pd.concat(window, ignore_index=True)) if window else None
+    return Streamed(sort_by_date(window) if window is not None else None, cube, sketches, rows, chunks)
@@ -0,0 +1,163 @@
+"""Bulk flattening of the JSON `job_type_list` / `tag_list` columns.
+
+Columns are parsed block by block with the Arrow JSON reader (one
+multi-threaded C++ pass instead of one `json.loads` per row), then the
+wanted fields are gathered with array arithmetic on the resulting lists.
+Values that are not JSON arrays are nulled beforehand; blocks the reader
+still rejects are bisected so that only small slices around malformed rows
+are parsed row by row. Malformed or missing values count as empty lists.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+
+# Liste complète des catégories possibles
+all_categories = ["Secteur", "Taille d'entreprise", "Tranche de CA", "Tranche d'effectif", "Structure Type"]
+
+BLOCK_ROWS = 200_000
+# Taille des tranches rejetées en dessous de laquelle on parse ligne par ligne au lieu de bisecter encore
+FALLBACK_ROWS = 64
+
+_ITEM = pa.struct([("id", pa.int64()), ("name", pa.string())])
+JOB_TYPE_LIST = pa.list_(_ITEM)
+TAG_LIST = pa.list_(pa.struct([("name", pa.string()), ("list", pa.list_(_ITEM))]))
+
+
+def _ndjson(strings):
+    # Une ligne NDJSON par valeur : {"v": <json>}
+    lines = pc.binary_join_element_wise(
+        pa.scalar('{"v":', pa.large_string()), strings,
+        pa.scalar('}\n', pa.large_string()), pa.scalar('', pa.large_string()),
+    )
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int64)[lines.offset:lines.offset + len(lines) + 1]
+    return lines.buffers()[2][offsets[0]:offsets[-1]]
+
+
+def _parse_row(value, list_type):
+    try:
+        return pa.array([json.loads(value)], type=list_type)
+    except (json.JSONDecodeError, TypeError, pa.ArrowException):  # JSON invalide ou structure inattendue
+        return pa.nulls(1, list_type)
+
+
+def _parse_block(strings, list_type):
+    ndjson = _ndjson(strings)
+    try:
+        table = pa_json.read_json(
+            pa.BufferReader(ndjson),
+            read_options=pa_json.ReadOptions(block_size=max(len(ndjson), 1)),
+            parse_options=pa_json.ParseOptions(
+                explicit_schema=pa.schema([("v", list_type)]),
+                unexpected_field_behavior="ignore",
+            ),
+        )
+        return table.column("v").combine_chunks()
+    except pa.ArrowInvalid:
+        pass
+    if len(strings) <= FALLBACK_ROWS:
+        return pa.concat_arrays([_parse_row(value, list_type) for value in strings.to_pylist()])
+    # Dichotomie : seules les petites tranches autour des lignes invalides passent en ligne à ligne
+    middle = len(strings) // 2
+    return pa.concat_arrays([
+        _parse_block(strings[:middle], list_type),
+        _parse_block(strings[middle:], list_type),
+    ])
+
+
+def parse_json_column(values, list_type, block_rows=BLOCK_ROWS):
+    """Parses a column of JSON arrays into a single Arrow list array.
+
+    Missing values and values that are not JSON arrays become null lists.
+    """
+    strings = pa.array(pd.Series(values, dtype=object), type=pa.large_string(), from_pandas=True)
+    trimmed = pc.utf8_trim_whitespace(strings)
+    is_array = pc.and_(pc.starts_with(trimmed, "["), pc.ends_with(trimmed, "]"))
+    strings = pc.if_else(pc.fill_null(is_array, False), strings, pa.scalar("null", pa.large_string()))
+
+    blocks = [_parse_block(strings[start:start + block_rows], list_type)
+              for start in range(0, len(strings), block_rows)]
+    if not blocks:
+        return pa.array([], type=list_type)
+    return pa.concat_arrays(blocks)
+
+
+def _first_positions(list_array):
+    """Index in `list_flatten(list_array)` of each row's first item, -1 if empty."""
+    parents = pc.list_parent_indices(list_array).to_numpy()
+    positions = np.full(len(list_array), -1, dtype=np.int64)
+    if len(parents):
+        starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+        positions[parents[starts]] = starts
+    return positions
+
+
+def _gather_ids(ids, positions, index):
+    """Gathers `ids[positions]`, NaN where the position is -1."""
+    found = positions >= 0
+    if found.all():
+        return pd.Series(ids[positions], index=index)
+    result = np.full(len(positions), np.nan)
+    result[found] = ids[positions[found]]
+    return pd.Series(result, index=index)
+
+
+def flatten_contact_tags(contacts_df):
+    """Returns `job_type_id` and `hierarchical_name` of each contact.
+
+    `job_type_id` is the id of the first job type, `hierarchical_name` the
+    name of the first item of the first tag.
+    """
+    jobs = parse_json_column(contacts_df['job_type_list'], JOB_TYPE_LIST)
+    job_items = pc.list_flatten(jobs)
+    job_type_id = _gather_ids(
+        job_items.field("id").to_numpy(zero_copy_only=False),
+        _first_positions(jobs),
+        contacts_df.index,
+    )
+
+    tags = parse_json_column(contacts_df['tag_list'], TAG_LIST)
+    tag_entries = pc.list_flatten(tags)
+    entry_items = tag_entries.field("list")
+    item_names = pc.list_flatten(entry_items).field("name").to_numpy(zero_copy_only=False)
+    item_positions = _first_positions(entry_items)
+    entry_positions = _first_positions(tags)
+
+    hierarchical_name = np.full(len(tags), None, dtype=object)
+    has_tag = entry_positions >= 0
+    first_item = item_positions[entry_positions[has_tag]]
+    has_item = first_item >= 0
+    rows = np.flatnonzero(has_tag)[has_item]
+    hierarchical_name[rows] = item_names[first_item[has_item]]
+
+    return pd.DataFrame({
+        'job_type_id': job_type_id,
+        'hierarchical_name': pd.Series(hierarchical_name, index=contacts_df.index),
+    })
+
+
+def flatten_company_tags(tag_list):
+    """Returns one column per `all_categories` entry with the tag id of each company.
+
+    As in the former `extract_tags`, the id is the first item of the tag
+    named after the category; when a tag name repeats, the last one wins.
+    """
+    tags = parse_json_column(tag_list, TAG_LIST)
+    entries = pc.list_flatten(tags)
+    parents = pc.list_parent_indices(tags).to_numpy()
+    names = entries.field("name").to_numpy(zero_copy_only=False)
+    entry_items = entries.field("list")
+    item_ids = pc.list_flatten(entry_items).field("id").to_numpy(zero_copy_only=False)
+    item_positions = _first_positions(entry_items)
+
+    columns = {}
+    for category in all_categories:
+        ids = np.full(len(tags), np.nan)
+        matches = (names == category) & (item_positions >= 0)
+        # Affectation dans l'ordre : pour un nom répété, la dernière entrée l'emporte
+        ids[parents[matches]] = item_ids[item_positions[matches]]
+        columns[category] = ids
+    return pd.DataFrame(columns, index=pd.Series(tag_list).index)
@@ -0,0 +1,163 @@
+"""Timing records of the stages of a rerun, and single-run profiles.
+
+Hot paths are wrapped in `stage` blocks (or `timed` functions). While a
+`Recorder` is active in the current context, each block records its wall
+time, row count and resident memory delta, and the record is appended to
+the recorder, to the `dashboard.timing` logger and optionally to a JSON
+lines file. With no active recorder a stage costs one context variable
+lookup, so instrumentation stays in place in production.
+
+Stages run in worker threads record into the recorder of the thread that
+submitted them when the work runs in a copy of its context
+(`contextvars.copy_context().run`), nested under the submitting stage.
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_recorder = contextvars.ContextVar("timing_recorder", default=None)
+# Étapes en cours dans ce contexte, de la plus externe à la plus interne
+_stages = contextvars.ContextVar("timing_stages", default=())
+_log_lock = threading.Lock()
+
+
+def rss_mb():
+    """Current resident memory of this process, in MB (`None` off Linux)."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Recorder:
+    """Timing records of one run, appended to `log_path` as JSON lines if given."""
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.run = uuid.uuid4().hex[:8]
+        self.records = []
+        self._started = time.perf_counter()
+
+    def start(self):
+        """Makes the stages of the rest of the current context (a script run) record into this recorder."""
+        _recorder.set(self)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Makes the stages of the current context record into this recorder."""
+        token = _recorder.set(self)
+        try:
+            yield self
+        finally:
+            _recorder.reset(token)
+
+    def add(self, record):
+        record = {"run": self.run, **record}
+        self.records.append(record)
+        logger.debug("%s", record)
+        if self.log_path:
+            with _log_lock, open(self.log_path, "a") as log:
+                log.write(json.dumps(record, default=str) + "\n")
+
+    def elapsed_ms(self):
+        return round(1000 * (time.perf_counter() - self._started), 2)
+
+    def frame(self):
+        """The records in start order, nested stages indented."""
+        if not self.records:
+            return pd.DataFrame(columns=["stage", "ms", "rows", "rss_delta_mb"])
+        df = pd.DataFrame(self.records).sort_values("start_ms", kind="stable")
+        df["stage"] = ["  " * depth + stage for depth, stage in zip(df["depth"], df["stage"])]
+        columns = ["stage", "ms", "rows", "rss_delta_mb"]
+        columns += [column for column in df.columns if column not in columns + ["run", "depth"]]
+        return df.reindex(columns=columns).reset_index(drop=True)
+
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """Times the block as stage `name` of the active recorder.
+
+    Yields the record: the block can add fields to it, such as `rows`.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        yield {}
+        return
+    record = {"stage": name, **fields}
+    parents = _stages.get()
+    if parents:
+        record["parent"] = parents[-1]
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    token = _stages.set(parents + (name,))
+    try:
+        yield record
+    finally:
+        _stages.reset(token)
+        rss_after = rss_mb()
+        record.update(
+            start_ms=round(1000 * (start - recorder._started), 2),
+            ms=round(1000 * (time.perf_counter() - start), 2),
+            rss_delta_mb=round(rss_after - rss_before, 1) if rss_before is not None else None,
+            depth=len(parents),
+        )
+        recorder.add(record)
+
+
+def timed(name=None):
+    """Decorator timing each call as a stage, with the row count of a frame result."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__qualname__) as record:
+                result = func(*args, **kwargs)
+                if isinstance(result, (pd.DataFrame, pd.Series)):
+                    record["rows"] = len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+class Profile:
+    """cProfile (or pyinstrument, if installed) capture of a block of code."""
+
+    def __init__(self, mode="cprofile"):
+        self.mode = mode
+        if mode == "pyinstrument":
+            import pyinstrument
+
+            self._profiler = pyinstrument.Profiler()
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if self.mode == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self, limit=40):
+        """Stops the capture and returns the report as text."""
+        if self.mode == "pyinstrument":
+            self._profiler.stop()
+            return self._profiler.output_text()
+        self._profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(self._profiler, stream=report).sort_stats("cumulative").print_stats(limit)
+        return report.getvalue()
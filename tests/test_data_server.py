@@ -0,0 +1,48 @@
+"""A client of the data server gets exactly the local results."""
+import os
+import threading
+
+import pytest
+
+from benchmarks import synthetic
+from benchmarks.bench_data_server import differences, explorer_tables, tables
+from benchmarks.bench_query_engines import random_selections
+from dashboard import explorer, pipeline, server
+from dashboard.refresh import Refresher
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    data_dir = str(tmp_path_factory.mktemp("server"))
+    synthetic.write_dataset(data_dir, 20_000, contacts_count=2_000)
+    return data_dir
+
+
+@pytest.fixture(scope="module")
+def refresher(data_dir):
+    return Refresher(lambda: pipeline.load_version(data_dir), [], interval=0)
+
+
+@pytest.fixture(scope="module")
+def client(data_dir, refresher):
+    address = "unix:" + os.path.join(data_dir, "data.sock")
+    data_server = server.make_server(address, server.DataService(refresher))
+    threading.Thread(target=data_server.serve_forever, daemon=True).start()
+    yield server.DataClient(address)
+    data_server.shutdown()
+    data_server.server_close()
+
+
+def test_remote_results_equal_local(data_dir, refresher, client):
+    dataset, lookups, engine = refresher.current.value
+    remote_dataset, remote_lookups, remote_engine = client.current.value
+    assert remote_lookups.options == lookups.options
+    for column, names in lookups.names.items():
+        assert list(remote_lookups.names[column]) == list(names)
+
+    export_path = os.path.join(data_dir, "export.csv")
+    for selection in random_selections(dataset.events, 8):
+        assert differences(tables(dataset, engine, selection), tables(remote_dataset, remote_engine, selection)) == []
+        local = explorer_tables(dataset, explorer.FilteredEvents(dataset.events, selection), export_path)
+        remote = explorer_tables(remote_dataset, client.filtered_events(selection), export_path)
+        assert differences(dict(enumerate(local)), dict(enumerate(remote))) == []
@@ -0,0 +1,38 @@
+"""The sketches persisted with the fact table give the counts of sketches built from its events."""
+import os
+
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.bench_query_engines import random_selections
+from dashboard import fact_table, loaders
+from dashboard.sketch import CodedSketches, build_sketches
+
+
+def assert_same_distinct_counts(data_dir):
+    df = fact_table.load(data_dir)
+    for column, sketches in fact_table.load_sketches(data_dir).items():
+        persisted, expected = CodedSketches(sketches), CodedSketches(build_sketches(df, column))
+        for selection in random_selections(df, 5):
+            assert persisted.distinct(selection) == expected.distinct(selection)
+            for by in ("D", "M", "organization_id"):
+                pd.testing.assert_frame_equal(persisted.distinct(selection, by), expected.distinct(selection, by))
+
+
+def test_persisted_sketches(tmp_path):
+    synthetic.write_dataset(tmp_path, 20_000, contacts_count=2_000, organizations=50, users_count=200)
+    fact_table.build(tmp_path)
+    assert_same_distinct_counts(tmp_path)
+
+    # Événements ajoutés sur les derniers jours : registres communs avec la première partie
+    synthetic.consumption_histories(
+        3_000, contacts=2_000, organizations=50, users=200, start="2024-12-20", end="2025-01-01", first_id=20_001, seed=1,
+    ).to_csv(os.path.join(tmp_path, loaders.CONSUMPTION_HISTORIES_FILE), mode="a", header=False, index=False)
+    manifest = fact_table.append(tmp_path)
+    assert manifest["operation"] == "append"
+    assert all(len(names) == 2 for names in manifest["sketch_parts"].values())
+    assert_same_distinct_counts(tmp_path)
+
+    manifest = fact_table.compact(tmp_path, manifest)
+    assert all(len(names) == 1 for names in manifest["sketch_parts"].values())
+    assert_same_distinct_counts(tmp_path)
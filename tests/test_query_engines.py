@@ -0,0 +1,24 @@
+"""The DuckDB engine draws the same charts as the pandas cube."""
+import pandas as pd
+import pytest
+
+from benchmarks.bench_query_engines import engine_tables, main_df, random_selections, reference_tables
+from dashboard.aggregate import CodedCube
+from dashboard.duckdb_engine import DuckDBEngine
+from dashboard.rollup import build_cube
+
+
+@pytest.fixture(scope="module")
+def df():
+    return main_df(20_000, 2_000)
+
+
+def test_duckdb_tables_equal_pandas(df):
+    cube = build_cube(df)
+    engines = {"cube": CodedCube(cube), "duckdb": DuckDBEngine(df)}
+    for selection in random_selections(df, 15):
+        expected = reference_tables(cube, selection)
+        for name, engine in engines.items():
+            tables = engine_tables(engine, selection)
+            for key, table in expected.items():
+                pd.testing.assert_frame_equal(table, tables[key], obj=f"{name} {key} for {selection}")
@@ -0,0 +1,23 @@
+"""Distinct counts from the HyperLogLog sketches."""
+import pandas as pd
+
+from dashboard.query import ConsumptionQuery
+from dashboard.sketch import CodedSketches, build_sketches
+
+
+def test_distinct_without_organization():
+    # Trois événements sur six sans organisation : comptés au total, absents de la répartition
+    df = pd.DataFrame({
+        "creation_date": pd.to_datetime(["2024-01-01"] * 3 + ["2024-01-02"] * 3),
+        "type_id": [1] * 6,
+        "organization_id": pd.array([1, None, 2, None, 1, None], dtype="Int64"),
+        "contact_id": [1, 2, 3, 4, 5, 6],
+    })
+    sketches = CodedSketches(build_sketches(df, "contact_id"))
+    selection = ConsumptionQuery(pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-02"), [1])
+
+    assert sketches.distinct(selection) == 6
+    assert sketches.distinct(selection, "D")["count"].tolist() == [3, 3]
+    by_organization = sketches.distinct(selection, "organization_id")
+    assert by_organization["organization_id"].tolist() == [1, 2]
+    assert by_organization["count"].tolist() == [2, 1]
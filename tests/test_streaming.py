@@ -0,0 +1,62 @@
+"""The streaming load folds the history into the same cube as the full load, in bounded memory."""
+import argparse
+import os
+
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.bench_streaming import run_child
+from benchmarks.bench_streaming import write_inputs as write_bench_inputs
+from dashboard import loaders, streaming
+from dashboard.enrich import build_main_df
+from dashboard.query import sort_by_date
+from dashboard.rollup import build_cube
+from dashboard.schema import compact_main_df
+
+
+def write_inputs(data_dir, rows):
+    synthetic.write_consumption_histories(
+        os.path.join(data_dir, loaders.CONSUMPTION_HISTORIES_FILE), rows, chunk_rows=4_000,
+        contacts=500, organizations=20, users=50,
+    )
+    synthetic.contacts(500).to_csv(os.path.join(data_dir, loaders.CONTACTS_FILE), index=False)
+    synthetic.companies(2_000).to_csv(os.path.join(data_dir, loaders.COMPANIES_FILE), index=False)
+    synthetic.company_sectors().to_csv(os.path.join(data_dir, loaders.COMPANY_SECTORS_FILE), index=False)
+
+
+def test_streamed_cube_equals_full_load(tmp_path):
+    write_inputs(tmp_path, 20_000)
+    df = build_main_df(
+        loaders.load_consumption(tmp_path),
+        loaders.load_contacts(tmp_path),
+        loaders.load_companies(tmp_path),
+        loaders.load_company_sectors(tmp_path),
+    )
+    df = sort_by_date(compact_main_df(df))
+
+    streamed = streaming.load(tmp_path, chunk_rows=3_000, window_days=60, window_rows=1_000)
+    assert (streamed.rows, streamed.chunks) == (len(df), 7)
+    pd.testing.assert_frame_equal(streamed.cube, build_cube(df))
+    # Fenêtre : les 1 000 derniers événements des 60 derniers jours
+    cutoff = df["creation_date"].max().floor("D") - pd.Timedelta(days=60)
+    expected = df[df["creation_date"] >= cutoff].tail(1_000)
+    assert sorted(streamed.window["id"]) == sorted(expected["id"])
+
+
+def test_empty_history(tmp_path):
+    write_inputs(tmp_path, 0)
+    streamed = streaming.load(tmp_path)
+    assert streamed.window is None and streamed.cube is None
+
+
+def test_peak_memory_below_cap(tmp_path):
+    # Historique de 40 Mo sur deux ans, peu de combinaisons : le cube reste petit devant le fichier
+    memory_cap_mb = 32
+    write_bench_inputs(tmp_path, argparse.Namespace(
+        rows=1_200_000, contacts=5, organizations=1, users=1, companies=1_000, start="2023-01-01", end="2025-01-01",
+    ))
+    assert os.path.getsize(os.path.join(tmp_path, loaders.CONSUMPTION_HISTORIES_FILE)) > memory_cap_mb * 2**20
+
+    result = run_child("streaming", str(tmp_path), 5_000, None, window_rows=5_000)
+    assert result["rows"] == 1_200_000
+    assert result["peak_rss_mb"] - result["interpreter_rss_mb"] < memory_cap_mb